@@ -0,0 +1,265 @@
+'''
+    Bit-reversal helpers for RPD/flash images.
+
+    QSPI/AS flash images are stored LSB-first per byte, so every RPD we parse or
+    program needs each byte bit-reversed (b7..b0 -> b0..b7). This used to be done
+    with a per-byte "for j in range(8)" loop at every call site; the helpers below
+    do the same thing through a 256-entry translate table (C speed in both py2 and
+    py3), with an optional NumPy path when numpy is importable.
+
+    pack_reversed_words()/qspi_program_plan() do the same for the 32-bit words sent with
+    QSPI_WRITE and index which 4KB chunks are blank so they can be skipped, and
+    unpack_reversed_words() decodes the words read back with QSPI_READ.
+
+    Run this file directly to benchmark the table/NumPy paths against the old loops:
+        python bitrev.py [size_in_MB ...]        (default: 64 512)
+'''
+import array
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# BIT_REVERSE[i] is byte i with its 8 bits mirrored, eg. 0x01 -> 0x80, 0x0F -> 0xF0
+BIT_REVERSE = bytearray(int('{0:08b}'.format(i)[::-1], 2) for i in range(256))
+# bytes version of the table, as required by bytes/bytearray.translate()
+BIT_REVERSE_TABLE = bytes(BIT_REVERSE)
+
+if numpy is not None:
+    _NP_BIT_REVERSE = numpy.frombuffer(BIT_REVERSE_TABLE, dtype=numpy.uint8)
+
+'''
+    Input   : data -- bytes/bytearray/memoryview (or anything supporting the buffer protocol)
+    Optional: start, end -- only reverse data[start:end], the rest is copied untouched
+              use_numpy -- True to use the NumPy lookup path (ignored if numpy is unavailable)
+    Output  : returns a NEW bytearray with the bits of every byte reversed
+    Note    : 0x00 and 0xFF map to themselves, so blank flash stays blank
+'''
+def reverse_bits(data, start=0, end=None, use_numpy=False):
+    if end is None:
+        end = len(data)
+    if start == 0 and end == len(data):
+        return _reverse(data, use_numpy)
+    result = bytearray(data)
+    result[start:end] = _reverse(memoryview(result)[start:end], use_numpy)
+    return result
+
+'''
+    Input   : data -- bytearray (or writable buffer) to be reversed in place
+    Optional: start, end -- only reverse data[start:end]
+              use_numpy -- True to use the NumPy lookup path (ignored if numpy is unavailable)
+    Output  : returns data, so it can be chained
+    Modify  : data -- bits of every byte in data[start:end] are reversed
+'''
+def reverse_bits_inplace(data, start=0, end=None, use_numpy=False):
+    if end is None:
+        end = len(data)
+    data[start:end] = _reverse(memoryview(data)[start:end], use_numpy)
+    return data
+
+def _reverse(data, use_numpy):
+    if hasattr(data, 'tobytearray'):
+        # Bitstream (mmap + overlay), materialize it once
+        data = data.tobytearray()
+    if use_numpy and numpy is not None:
+        return bytearray(_NP_BIT_REVERSE[numpy.frombuffer(data, dtype=numpy.uint8)].tobytes())
+    # bytearray() of a memoryview/bytes is a single memcpy, translate() is the table lookup
+    return bytearray(data).translate(BIT_REVERSE_TABLE)
+
+###########################################################################################
+#   Word packing for QSPI_WRITE
+###########################################################################################
+# QSPI_WRITE takes 32-bit words. The word for RPD bytes b0..b3 is (b0<<24|b1<<16|b2<<8|b3)
+# with all 32 bits reversed, which is the same as reversing the bits of every byte and
+# reading the 4 bytes back as a LITTLE endian word, so the whole image can be converted in
+# one translate() plus one array/frombuffer call instead of a 32 iteration loop per word.
+QSPI_CHUNK_SIZE = 4096
+# bytes reversed at a time by pack_reversed_words(), multiple of 4
+PACK_CHUNK_SIZE = 16 << 20
+_BLANK_CHUNK = b'\xff' * QSPI_CHUNK_SIZE
+
+'''
+    Input   : data -- RPD bytes (bytes/bytearray/memoryview)
+    Optional: use_numpy -- True to return a numpy uint32 array instead of array('I')
+    Output  : returns the bit reversed words ready for QSPI_WRITE, one per 4 bytes of data
+    Note    : a tail shorter than 4 bytes is padded with 0xFF (blank flash)
+              data is reversed PACK_CHUNK_SIZE bytes at a time straight into the words, so packing
+              a 512MB image holds the words and one chunk, not extra copies of the whole image
+'''
+def pack_reversed_words(data, use_numpy=False):
+    view = data if hasattr(data, 'tobytearray') else memoryview(data)
+    size = len(data)
+    n_words = (size + 3) // 4
+    if use_numpy and numpy is not None:
+        words = numpy.empty(n_words * 4, dtype=numpy.uint8)
+        words[size:] = 0xFF
+        for offset in range(0, size, PACK_CHUNK_SIZE):
+            chunk = view[offset:offset + PACK_CHUNK_SIZE]
+            words[offset:offset + len(chunk)] = _NP_BIT_REVERSE[numpy.frombuffer(chunk, dtype=numpy.uint8)]
+        return words.view('<u4')
+    words = array.array('I')
+    assert words.itemsize == 4, "array('I') is not 32 bit on this host"
+    for offset in range(0, size, PACK_CHUNK_SIZE):
+        chunk = _reverse(view[offset:offset + PACK_CHUNK_SIZE], False)
+        if len(chunk) % 4:
+            chunk += b'\xff' * (4 - len(chunk) % 4)
+        if hasattr(words, 'frombytes'):
+            words.frombytes(chunk)
+        else:
+            words.fromstring(buffer(chunk))
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words
+
+'''
+    Input   : words -- 32-bit words as returned by QSPI_READ (list/array of ints)
+    Optional: use_numpy -- True to use the NumPy lookup path (ignored if numpy is unavailable)
+    Output  : returns the flash bytes in RPD order (bytearray), the inverse of pack_reversed_words()
+'''
+def unpack_reversed_words(words, use_numpy=False):
+    packed = array.array('I', words)
+    assert packed.itemsize == 4, "array('I') is not 32 bit on this host"
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return _reverse(packed.tobytes() if hasattr(packed, 'tobytes') else packed.tostring(), use_numpy)
+
+'''
+    Input   : data -- RPD bytes (bytes/bytearray/memoryview)
+    Optional: chunk_size -- bytes per chunk, multiple of 4, default 4KB (one QSPI_WRITE)
+    Output  : returns a list of (offset, length) for every chunk that is NOT all 0xFF,
+              the last chunk may be shorter than chunk_size
+'''
+def nonblank_chunks(data, chunk_size=QSPI_CHUNK_SIZE):
+    view = data if hasattr(data, 'tobytearray') else memoryview(data)
+    blank = _BLANK_CHUNK if chunk_size == QSPI_CHUNK_SIZE else b'\xff' * chunk_size
+    size = len(data)
+    chunks = []
+    for offset in range(0, size, chunk_size):
+        length = min(chunk_size, size - offset)
+        if view[offset:offset + length] != blank[:length]:
+            chunks.append((offset, length))
+    return chunks
+
+'''
+    Input   : data -- RPD bytes (bytes/bytearray/memoryview)
+    Optional: chunk_size -- bytes per QSPI_WRITE, default 4KB
+              use_numpy -- see pack_reversed_words()
+    Output  : returns (words, chunks)
+              words -- pack_reversed_words(data)
+              chunks -- nonblank_chunks(data), blank chunks need no programming
+    Note    : program chunk (offset, length) with words[offset/4 : (offset+length+3)/4]
+'''
+def qspi_program_plan(data, chunk_size=QSPI_CHUNK_SIZE, use_numpy=False):
+    return pack_reversed_words(data, use_numpy), nonblank_chunks(data, chunk_size)
+
+'''
+    Input   : data -- bytearray to reverse (modified in place)
+    Output  : the original per byte loop used across fwval_lib, kept for the benchmark only
+'''
+def _legacy_reverse_bits(data):
+    for i in range(len(data)) :
+        byte = data[i]
+        temp = 0
+        for j in range(8) :
+            if (byte & (1 << j)) :
+                temp |= (1 << (7-j))
+        data[i] = temp
+    return data
+
+'''
+    Input   : data -- RPD bytes
+    Output  : the original word pack loop of fpga_add_new_qspi_image, kept for the benchmark only
+'''
+def _legacy_pack_words(data):
+    words = []
+    for i in range(len(data) // 4) :
+        data_word = data[i * 4] << 24 | data[i * 4 + 1] << 16 | data[i * 4 + 2] << 8 | data[i * 4 + 3]
+        reversed_data = 0
+        if data_word != 0xFFFFFFFF and data_word != 0:
+            for j in range(32) :
+                if (data_word >> j) & 1 :
+                    reversed_data |= 1 << (31 - j)
+        else :
+            reversed_data = data_word
+        words.append(reversed_data)
+    return words
+
+'''
+    Input   : words -- 32-bit words read with QSPI_READ
+    Output  : the original word decode loop of fpga_read_flash, kept for the benchmark only
+'''
+def _legacy_unpack_words(words):
+    data = bytearray(len(words) * 4)
+    for i in range(len(words)) :
+        reversed_word = 0
+        if words[i] != 0xFFFFFFFF and words[i] != 0 :
+            for j in range(32) :
+                if (words[i] >> j) & 1 :
+                    reversed_word |= 1 << (31 - j)
+        else :
+            reversed_word = words[i]
+        for k, n in enumerate([24, 16, 8, 0]) :
+            data[i * 4 + k] = (reversed_word >> n & 0xff)
+    return data
+
+###########################################################################################
+#   Benchmark
+###########################################################################################
+# The legacy loop takes minutes per 64MB, so it is timed on a LEGACY_SAMPLE sized slice
+# and extrapolated linearly to the full image size.
+LEGACY_SAMPLE = 1 << 20
+
+def _synthetic_rpd(n_bytes):
+    # roughly what a real RPD looks like: random payload followed by blank (0xFF) flash
+    import os
+    payload = n_bytes // 2
+    return bytearray(os.urandom(payload)) + bytearray(b'\xff' * (n_bytes - payload))
+
+def _timeit(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+def benchmark(sizes_mb=(64, 512)):
+    for size_mb in sizes_mb:
+        n_bytes = size_mb << 20
+        image = _synthetic_rpd(n_bytes)
+        print("Synthetic RPD: %d MB" % size_mb)
+
+        sample = image[:LEGACY_SAMPLE]
+        t_legacy, expected = _timeit(_legacy_reverse_bits, bytearray(sample))
+        t_legacy = t_legacy * n_bytes / len(sample)
+        print("  legacy loop   : %8.2f s (extrapolated from %d KB)" % (t_legacy, len(sample) >> 10))
+
+        t_table, result = _timeit(reverse_bits, image)
+        assert result[:LEGACY_SAMPLE] == expected
+        print("  translate     : %8.3f s (%.0fx)" % (t_table, t_legacy / max(t_table, 1e-9)))
+
+        if numpy is not None:
+            t_np, result = _timeit(reverse_bits, image, 0, None, True)
+            assert result[:LEGACY_SAMPLE] == expected
+            print("  numpy         : %8.3f s (%.0fx)" % (t_np, t_legacy / max(t_np, 1e-9)))
+        else:
+            print("  numpy         : not installed, skipped")
+
+        t_legacy, expected = _timeit(_legacy_pack_words, sample)
+        t_legacy = t_legacy * n_bytes / len(sample)
+        print("  legacy pack   : %8.2f s (extrapolated from %d KB)" % (t_legacy, len(sample) >> 10))
+        t_pack, (words, chunks) = _timeit(qspi_program_plan, image)
+        assert list(words[:len(expected)]) == expected
+        print("  program plan  : %8.3f s (%.0fx), %d of %d chunks to program" %
+            (t_pack, t_legacy / max(t_pack, 1e-9), len(chunks), (n_bytes + QSPI_CHUNK_SIZE - 1) // QSPI_CHUNK_SIZE))
+
+        t_legacy, expected = _timeit(_legacy_unpack_words, words[:LEGACY_SAMPLE // 4])
+        t_legacy = t_legacy * n_bytes / len(sample)
+        print("  legacy unpack : %8.2f s (extrapolated from %d KB)" % (t_legacy, len(sample) >> 10))
+        t_unpack, result = _timeit(unpack_reversed_words, words)
+        assert result[:LEGACY_SAMPLE] == expected == sample
+        print("  unpack words  : %8.3f s (%.0fx)" % (t_unpack, t_legacy / max(t_unpack, 1e-9)))
+        del image, result, words
+
+if __name__ == "__main__":
+    benchmark([int(arg) for arg in sys.argv[1:]] or (64, 512))
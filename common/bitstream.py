@@ -0,0 +1,191 @@
+'''
+    Memory-mapped bitstream with copy-on-write overlays.
+
+    A Bitstream wraps a read-only mmap of an RBF/RPD file (or any existing buffer such as
+    a bytearray) and behaves like the bytearray returned by JtagTest.read_bitstream():
+        bitstream[i]            -> int
+        bitstream[a:b]          -> bytearray (small copy, overlay applied)
+        bitstream[i] = value    -> recorded in the overlay, the file is never modified
+        len(bitstream), iteration
+    Corruption helpers only ever flip a few bytes, so copy() shares the mapped image and
+    just duplicates the overlay, and view() gives a zero-copy window into the image.
+    A corruption test therefore holds about one image in memory instead of 3-4 copies.
+
+    With bit_reversed=True every byte read from the backing image is bit reversed on the fly,
+    which gives the same view as rpd_get_fw_add()/rpd_get_rsu_fw_add() without ever reversing
+    (or even reading) the whole file. The overlay is in the reversed domain.
+'''
+import mmap
+import os
+
+from fwval_lib.configuration.bitrev import BIT_REVERSE, BIT_REVERSE_TABLE
+
+# bytes streamed per write() when saving a Bitstream to file
+WRITE_CHUNK_SIZE = 1 << 20
+
+class Bitstream(object):
+    '''
+    Input   : base -- the backing buffer (mmap, bytes, bytearray), never modified
+    Optional: start, end -- window of base covered by this Bitstream, default the whole base
+              overlay -- dict of {absolute offset in base: byte value} applied on top of base
+              file_path -- source file, informational only
+              bit_reversed -- True to present every byte of base bit reversed
+    '''
+    def __init__(self, base, start=0, end=None, overlay=None, file_path=None, bit_reversed=False):
+        if end is None:
+            end = len(base)
+        assert 0 <= start <= end <= len(base), "Bitstream window [%d:%d] out of range" % (start, end)
+        self._base = base
+        self._start = start
+        self._end = end
+        self._overlay = {} if overlay is None else overlay
+        self.file_path = file_path
+        self.bit_reversed = bit_reversed
+
+    '''
+    Input   : file_path -- path of the bitstream file (usually rbf/rpd file)
+    Optional: bit_reversed -- True to read the file bit reversed, see module note
+    Output  : returns a read-only, memory-mapped Bitstream of the file
+    Exception: Throws IOError if file is empty
+    '''
+    @classmethod
+    def open(cls, file_path, bit_reversed=False):
+        with open(file_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                raise IOError("Source File %s size is empty" % file_path)
+            # the mapping stays valid after the file object is closed
+            base = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(base, file_path=file_path, bit_reversed=bit_reversed)
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __repr__(self):
+        return "<Bitstream %s len=0x%x patched=%d>" % (self.file_path, len(self), len(self.patched_offsets()))
+
+    def _abs(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Bitstream index out of range")
+        return self._start + index
+
+    def _base_byte(self, index):
+        value = bytearray(self._base[index:index + 1])[0]
+        return BIT_REVERSE[value] if self.bit_reversed else value
+
+    def _read(self, abs_start, abs_end):
+        data = bytearray(self._base[abs_start:abs_end])
+        if self.bit_reversed:
+            data = data.translate(BIT_REVERSE_TABLE)
+        if self._overlay:
+            if len(self._overlay) < abs_end - abs_start:
+                for offset, value in self._overlay.items():
+                    if abs_start <= offset < abs_end:
+                        data[offset - abs_start] = value
+            else:
+                for offset in range(abs_start, abs_end):
+                    if offset in self._overlay:
+                        data[offset - abs_start] = self._overlay[offset]
+        return data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return self[:][index]
+            return self._read(self._start + start, self._start + max(start, stop))
+        index = self._abs(index)
+        if index in self._overlay:
+            return self._overlay[index]
+        return self._base_byte(index)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            value = bytearray(value)
+            assert step == 1 and len(value) == max(0, stop - start), \
+                "Bitstream slice assignment cannot change the bitstream size"
+            for ith in range(len(value)):
+                self._overlay[self._start + start + ith] = value[ith]
+        else:
+            self._overlay[self._abs(index)] = value & 0xFF
+
+    def __iter__(self):
+        for offset in range(0, len(self), WRITE_CHUNK_SIZE):
+            for value in self[offset:offset + WRITE_CHUNK_SIZE]:
+                yield value
+
+    '''
+    Output  : returns a new Bitstream sharing the mapped image, with its own copy of the overlay
+    '''
+    def copy(self):
+        return Bitstream(self._base, self._start, self._end, dict(self._overlay), self.file_path, self.bit_reversed)
+
+    '''
+    Input   : start, end -- window relative to this Bitstream, same as slicing
+    Output  : returns a zero-copy Bitstream over [start:end] that SHARES this overlay,
+              ie. writes through the view are visible in the parent (like a memoryview)
+    '''
+    def view(self, start=0, end=None):
+        start, end, _ = slice(start, end).indices(len(self))
+        return Bitstream(self._base, self._start + start, self._start + max(start, end), self._overlay, self.file_path,
+            self.bit_reversed)
+
+    '''
+    Output  : returns a sorted list of (offset, original, value) of every byte that differs
+              from the backing image, offsets are relative to this Bitstream
+    '''
+    def patches(self):
+        result = []
+        for offset in self.patched_offsets():
+            original = self._base_byte(offset)
+            if original != self._overlay[offset]:
+                result.append((offset - self._start, original, self._overlay[offset]))
+        return result
+
+    def patched_offsets(self):
+        return sorted(offset for offset in self._overlay if self._start <= offset < self._end)
+
+    '''
+    Output  : returns the whole bitstream (overlay applied) as a bytearray
+    Note    : this is a full copy, only use it where a real buffer is required (eg. pycv)
+    '''
+    def tobytearray(self):
+        return self._read(self._start, self._end)
+
+    '''
+    Input   : file_path -- file to write into
+    Optional: start, end -- range to write, same as slicing
+    Note    : streamed in WRITE_CHUNK_SIZE pieces, the image is never fully copied
+    '''
+    def write_to_file(self, file_path, start=0, end=None):
+        start, end, _ = slice(start, end).indices(len(self))
+        with open(file_path, "wb") as file:
+            for offset in range(start, end, WRITE_CHUNK_SIZE):
+                file.write(self[offset:min(offset + WRITE_CHUNK_SIZE, end)])
+
+    def close(self):
+        if isinstance(self._base, mmap.mmap):
+            self._base.close()
+
+'''
+    Input   : bitstream -- bytearray or Bitstream
+    Output  : returns a copy that can be corrupted without touching the input,
+              a Bitstream copy only duplicates its overlay
+'''
+def copy_bitstream(bitstream):
+    if isinstance(bitstream, Bitstream):
+        return bitstream.copy()
+    return bytearray(bitstream)
+
+'''
+    Input   : bitstream -- bytearray, bytes or Bitstream
+    Output  : returns a real bytearray, for interfaces (eg. pycv prepare_data) that need a buffer
+'''
+def as_bytearray(bitstream):
+    if isinstance(bitstream, bytearray):
+        return bitstream
+    if isinstance(bitstream, Bitstream):
+        return bitstream.tobytearray()
+    return bytearray(bitstream)
@@ -0,0 +1,125 @@
+'''
+    In memory cache of bitstream files, per test object.
+
+    A test reads the same rbf/rpd several times: read_bitstream() for the fw key, again for
+    send_jtag(), rpd_get_fw_add() for the layout, the readback comparison of check_ram(), ...
+    BitstreamCache keeps the file contents as immutable bytes, keyed by
+    (path, size, mtime, inode), so a rewritten file is never served stale:
+        data = cache.read(file_path)            -> bytes, read from disk on a miss only
+        bitstream = bytearray(data)             -> private copy for callers patching it
+        cache.report()                          -> hit/miss counters
+    Least recently used files are evicted once the byte budget is exceeded, a file bigger than
+    the whole budget is read but not kept.
+
+    The cache is opt-in, like the layout cache: set FWVAL_BITSTREAM_CACHE=1 to enable it. A hit
+    still hands read_bitstream() callers a private bytearray copy, so the cached files cost their
+    budget on top of the copies in use. Budget is $FWVAL_BITSTREAM_CACHE_MB (default 512).
+    When disabled, read() reads the file every time and keeps nothing.
+'''
+import collections
+import os
+
+DEFAULT_BUDGET_MB = 512
+
+'''
+    Input   : file_path -- path of the file
+    Output  : returns the cache key of the file, (absolute path, size, mtime, inode)
+    Exception: Throws OSError if the file does not exist
+'''
+def file_key(file_path):
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime, stat.st_ino)
+
+class BitstreamCache(object):
+    '''
+    Optional: max_bytes -- byte budget, default $FWVAL_BITSTREAM_CACHE_MB MB, 0 disables the cache
+    '''
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("FWVAL_BITSTREAM_CACHE_MB", DEFAULT_BUDGET_MB)) << 20
+        self.max_bytes = max_bytes
+        self.enabled = os.environ.get("FWVAL_BITSTREAM_CACHE", "0") == "1"
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, file_path):
+        try:
+            return file_key(file_path) in self._entries
+        except OSError:
+            return False
+
+    @property
+    def cached_bytes(self):
+        return self._size
+
+    '''
+    Input   : file_path -- path of the file
+    Output  : returns the cached contents as bytes, None if the file is not cached (not counted as a miss)
+    '''
+    def get(self, file_path):
+        try:
+            key = file_key(file_path)
+        except OSError:
+            return None
+        data = self._entries.get(key)
+        if data is not None:
+            # most recently used last
+            del self._entries[key]
+            self._entries[key] = data
+            self.hits += 1
+        return data
+
+    '''
+    Input   : file_path -- path of the file
+    Output  : returns the contents of the file as bytes, from the cache if it did not change
+    Exception: Throws IOError/OSError if the file cannot be read
+    '''
+    def read(self, file_path):
+        data = self.get(file_path)
+        if data is not None:
+            return data
+        self.misses += 1
+        with open(file_path, "rb") as file:
+            key = file_key(file_path)
+            data = file.read()
+        # the file may have been rewritten while reading, only keep it if it still matches the key
+        if key[1] == len(data):
+            self._put(key, data)
+        return data
+
+    def _put(self, key, data):
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        self._drop([old_key for old_key in self._entries if old_key[0] == key[0]])
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            self._drop([next(iter(self._entries))])
+            self.evictions += 1
+
+    def _drop(self, keys):
+        for key in keys:
+            self._size -= len(self._entries.pop(key))
+
+    '''
+    Optional: file_path -- file to forget, default every file
+    '''
+    def invalidate(self, file_path=None):
+        if file_path is None:
+            self._entries.clear()
+            self._size = 0
+            return
+        path = os.path.abspath(file_path)
+        self._drop([key for key in self._entries if key[0] == path])
+
+    def report(self):
+        lookups = self.hits + self.misses
+        return "bitstream cache: %d hits, %d misses (%.0f%% hit rate), %d files (%d bytes of %d) cached, %d evicted" % \
+            (self.hits, self.misses, 100.0 * self.hits / lookups if lookups else 0, len(self._entries), self._size,
+             self.max_bytes, self.evictions)
@@ -0,0 +1,119 @@
+'''
+    QSPI erase planning.
+
+    fpga_add_new_qspi_image() sent one QSPI_ERASE per 4KB sector (per 64KB on 18.0) and
+    RsuTest.add_new_image() one per 64KB, each a mailbox round trip, even for hundreds of MB.
+    plan_erase() takes the flash ranges that need erasing and the erase sizes the flash
+    supports, and returns the fewest aligned erase commands covering them: the biggest sector
+    wherever a whole aligned one is inside the ranges, the smaller ones only at the edges.
+        plan = plan_erase([(start_address, len(bitstream))], is_blank=manifest.is_blank, legacy_size=4<<10)
+        for address, size in plan: self.fpga_qspi_erase(address, size)
+        cv_logger.info(plan.report())
+    Sectors known to be blank (eg. from the FlashManifest) are not erased again, but a bigger
+    sector may still cover them, erasing a blank sector again does no harm.
+
+    layout_ranges() gives the flash ranges an upcoming rpd/map layout occupies, for
+    JtagTest.erase_qspi_die() to erase only those instead of the whole die, unless they cover
+    more than DIE_ERASE_FRACTION of it.
+'''
+import os
+
+from fwval_lib.configuration.partitiontable import PartitionTable
+
+# supported erase sizes, biggest first, every size a multiple of the next one
+ERASE_SIZES = (64<<10, 32<<10, 4<<10)
+# a range limited die erase covering more than this fraction of the die falls back to the die erase,
+# one QSPI_ERASE instead of up to 1024 sector erase round trips per 512Mbit
+DIE_ERASE_FRACTION = 0.5
+
+class ErasePlan(object):
+    '''
+    Input   : commands -- list of (address, size) erase commands, in address order
+              legacy_commands -- erase commands the per sector loop would have sent
+              blank_bytes -- bytes inside the ranges not erased because they are known blank
+    '''
+    def __init__(self, commands, legacy_commands, blank_bytes=0):
+        self.commands = commands
+        self.legacy_commands = legacy_commands
+        self.blank_bytes = blank_bytes
+
+    def __iter__(self):
+        return iter(self.commands)
+
+    def __len__(self):
+        return len(self.commands)
+
+    @property
+    def erased_bytes(self):
+        return sum(size for _, size in self.commands)
+
+    @property
+    def saved_round_trips(self):
+        return self.legacy_commands - len(self.commands)
+
+    def report(self):
+        return "erase plan: %d commands (%d bytes) instead of %d, %d mailbox round trips saved, %d bytes known blank skipped" % \
+            (len(self.commands), self.erased_bytes, self.legacy_commands, self.saved_round_trips, self.blank_bytes)
+
+'''
+    Input   : ranges -- list of (address, length) flash ranges to erase, rounded out to the smallest erase size
+    Optional: erase_sizes -- erase sizes the flash supports, see ERASE_SIZES
+              is_blank -- function(address, size), True if the flash range is known to be erased already
+              legacy_size -- erase size of the per sector loop the plan replaces, for the report
+    Output  : returns the ErasePlan
+    Note    : nothing outside the ranges is erased, unless it is known to be blank
+'''
+def plan_erase(ranges, erase_sizes=ERASE_SIZES, is_blank=None, legacy_size=None):
+    erase_sizes = sorted(set(erase_sizes), reverse=True)
+    unit = erase_sizes[-1]
+    for bigger, smaller in zip(erase_sizes, erase_sizes[1:]):
+        assert bigger % smaller == 0, "Erase size %d is not a multiple of %d" % (bigger, smaller)
+    is_blank = is_blank or (lambda address, size: False)
+
+    # smallest sectors inside the ranges, and the ones of them really needing an erase
+    dirty = set()
+    for address, length in ranges:
+        dirty.update(range(address - address % unit, address + length, unit))
+    needed = set(address for address in dirty if not is_blank(address, unit))
+    allowed = {}
+
+    def may_erase(address):
+        if address not in allowed:
+            allowed[address] = address in dirty or is_blank(address, unit)
+        return allowed[address]
+
+    # one level of sizes at a time: a sector is erased whole if it may be, else split into the next size
+    commands = []
+    def cover(address, level):
+        size = erase_sizes[level]
+        units = range(address, address + size, unit)
+        if not any(unit_address in needed for unit_address in units):
+            return
+        if level == len(erase_sizes) - 1 or all(may_erase(unit_address) for unit_address in units):
+            commands.append((address, size))
+            return
+        for sub_address in range(address, address + size, erase_sizes[level + 1]):
+            cover(sub_address, level + 1)
+
+    biggest = erase_sizes[0]
+    for address in sorted(set(address - address % biggest for address in needed)):
+        cover(address, 0)
+
+    legacy_size = legacy_size or unit
+    legacy_commands = len(set(address - address % legacy_size for address in dirty))
+    return ErasePlan(commands, legacy_commands, (len(dirty) - len(needed)) * unit)
+
+'''
+    Input   : file_paths -- .map files (every block of the partition table) and/or rpd files
+                            (programmed at flash address 0)
+    Output  : returns the list of (address, length) flash ranges the layouts occupy
+'''
+def layout_ranges(file_paths):
+    ranges = []
+    for file_path in file_paths:
+        if file_path.lower().endswith(".map"):
+            ranges += [(partition.absolute_start, partition.absolute_end - partition.absolute_start + 1)
+                       for partition in PartitionTable.from_file(file_path)]
+        else:
+            ranges.append((0, os.path.getsize(file_path)))
+    return ranges
@@ -0,0 +1,210 @@
+'''
+    Flash sector manifest for incremental QSPI programming.
+
+    A FlashManifest remembers, per board and chip select, a hash of every 4KB flash sector we
+    last programmed (or erased). When the next image is programmed in incremental mode,
+    only the sectors whose hash differs from the manifest are erased and re-programmed,
+    so re-flashing an image that differs from the previous test by a corrupted byte costs
+    one sector instead of the whole image.
+
+    The manifest only knows about writes done through it. Anything else that touches the
+    flash (other tools, a different host, manual erase) makes it stale, so incremental
+    programming is opt-in and the manifest should be invalidated when in doubt.
+
+    Manifests are json files in $FWVAL_FLASH_MANIFEST_DIR (default ~/.fwval/flash_manifest).
+'''
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+# hash value recorded for an erased (all 0xFF) sector
+BLANK = "blank"
+# granularity of the recorded hashes (smallest QSPI erase), bigger erase sectors are groups of these
+HASH_SIZE = 4<<10
+
+class FlashManifest(object):
+    '''
+    Input   : board_id -- unique name of the board (see JtagTest.get_board_id())
+    Optional: chip_select -- QSPI chip select the manifest is for
+              manifest_dir -- directory holding the manifests
+    '''
+    def __init__(self, board_id, chip_select=0, manifest_dir=None):
+        self.board_id = board_id
+        self.chip_select = chip_select
+        self.manifest_dir = manifest_dir or os.environ.get("FWVAL_FLASH_MANIFEST_DIR") or \
+            os.path.join(os.path.expanduser("~"), ".fwval", "flash_manifest")
+        self.sectors = {}
+        self.bytes_written = 0
+        self.bytes_skipped = 0
+        self.load()
+
+    @property
+    def path(self):
+        name = "%s_cs%d.json" % (self.board_id, self.chip_select)
+        return os.path.join(self.manifest_dir, name.replace(os.sep, "_"))
+
+    def load(self):
+        self.sectors = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as file:
+                    content = json.load(file)
+                if content.get("version") == MANIFEST_VERSION:
+                    self.sectors = dict((int(address), value) for address, value in content["sectors"].items())
+            except (IOError, ValueError):
+                # a corrupted manifest is only a missed optimization, start from scratch
+                self.sectors = {}
+
+    def save(self):
+        if not os.path.isdir(self.manifest_dir):
+            os.makedirs(self.manifest_dir)
+        temp_path = self.path + ".%d.tmp" % os.getpid()
+        with open(temp_path, "w") as file:
+            json.dump({"version": MANIFEST_VERSION, "board_id": self.board_id, "chip_select": self.chip_select,
+                       "sectors": self.sectors}, file)
+        os.rename(temp_path, self.path)
+
+    '''
+    Output  : returns True if the manifest was saved, False if it could not be written
+    Note    : a manifest not saved is only a missed optimization, the next test programs the whole image
+    '''
+    def try_save(self):
+        try:
+            self.save()
+        except (IOError, OSError):
+            return False
+        return True
+
+    '''
+    Input   : data -- 4KB sector content (may be shorter, the rest is blank)
+    Output  : returns the hash recorded for the sector
+    '''
+    def sector_hash(self, data):
+        data = bytearray(data)
+        if len(data) < HASH_SIZE:
+            # after erase + program the tail of a partial sector reads back as 0xFF
+            data += b'\xff' * (HASH_SIZE - len(data))
+        if data.count(b'\xff') == len(data):
+            return BLANK
+        return hashlib.sha1(bytes(data)).hexdigest()
+
+    '''
+    Input   : data -- full image (file order, bytearray or Bitstream)
+              start_address -- flash address of data, must be 4KB aligned
+    Output  : returns {flash address: hash} of every 4KB sector of data
+    '''
+    def image_hashes(self, data, start_address=0):
+        assert start_address % HASH_SIZE == 0, \
+            "Flash manifest needs a 4KB aligned start address, got 0x%08x" % start_address
+        hashes = {}
+        for offset in range(0, len(data), HASH_SIZE):
+            hashes[start_address + offset] = self.sector_hash(data[offset:offset + HASH_SIZE])
+        return hashes
+
+    '''
+    Input   : data -- full image about to be programmed (file order, bytearray or Bitstream)
+              start_address -- flash address of data, must be sector_size aligned
+    Optional: sector_size -- erase size, a multiple of 4KB, default 4KB
+    Output  : returns (changed, hashes)
+              changed -- list of (offset in data, length) of the erase sectors that differ from the manifest
+              hashes -- image_hashes(data, start_address), for update() once programming passed
+    Modify  : self.bytes_written / self.bytes_skipped
+    '''
+    def changed_sectors(self, data, start_address=0, sector_size=HASH_SIZE):
+        assert sector_size % HASH_SIZE == 0 and start_address % sector_size == 0, \
+            "Flash manifest needs a %d bytes aligned start address, got 0x%08x" % (sector_size, start_address)
+        hashes = self.image_hashes(data, start_address)
+        changed = []
+        for offset in range(0, len(data), sector_size):
+            length = min(sector_size, len(data) - offset)
+            for address in range(start_address + offset, start_address + offset + length, HASH_SIZE):
+                if self.sectors.get(address) != hashes[address]:
+                    changed.append((offset, length))
+                    break
+        written = sum(length for _, length in changed)
+        self.bytes_written += written
+        self.bytes_skipped += len(data) - written
+        return changed, hashes
+
+    '''
+    Input   : start_address, size -- flash range
+    Output  : returns True if every sector of the range is recorded as blank
+    '''
+    def is_blank(self, start_address, size):
+        first = start_address - start_address % HASH_SIZE
+        return all(self.sectors.get(address) == BLANK for address in range(first, start_address + size, HASH_SIZE))
+
+    '''
+    Input   : hashes -- from changed_sectors(), recorded once programming passed
+    '''
+    def update(self, hashes):
+        self.sectors.update(hashes)
+        self.try_save()
+
+    '''
+    Input   : start_address, size -- erased flash range in bytes
+    Optional: save -- False to only update the manifest in memory, eg. to save() once after many erases
+    Modify  : marks every sector fully inside the range as blank, and forgets partially erased ones
+    '''
+    def record_erase(self, start_address, size, save=True):
+        self.forget(start_address, size, blank=True, save=save)
+
+    '''
+    Input   : start_address, size -- flash range written outside of this manifest
+    Optional: blank -- True if the range is known to be erased
+              save -- False to only update the manifest in memory
+    Modify  : forgets every sector overlapping the range (or marks it blank)
+    '''
+    def forget(self, start_address, size, blank=False, save=True):
+        first = start_address - start_address % HASH_SIZE
+        for address in range(first, start_address + size, HASH_SIZE):
+            if blank and address >= start_address and address + HASH_SIZE <= start_address + size:
+                self.sectors[address] = BLANK
+            else:
+                self.sectors.pop(address, None)
+        if save:
+            self.try_save()
+
+    '''
+    Input   : start_address, size -- flash range
+    Output  : returns the list of (address, length) sub ranges not recorded as blank, ie. that may hold data
+    '''
+    def dirty_ranges(self, start_address, size):
+        ranges = []
+        first = start_address - start_address % HASH_SIZE
+        for address in range(first, start_address + size, HASH_SIZE):
+            if self.sectors.get(address) == BLANK:
+                continue
+            if ranges and ranges[-1][0] + ranges[-1][1] == address:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + HASH_SIZE)
+            else:
+                ranges.append((address, HASH_SIZE))
+        return ranges
+
+    '''
+    Input   : board_id -- board whose manifests to update
+              start_address, size -- flash range written outside of the manifests
+    Modify  : forget() the range in the manifest of every chip select of the board, for
+              flash writes where the selected flash is not known
+    '''
+    @classmethod
+    def forget_all(cls, board_id, start_address, size, manifest_dir=None):
+        manifest = cls(board_id, 0, manifest_dir)
+        prefix = os.path.basename(manifest.path)[:-len("0.json")]
+        if not os.path.isdir(manifest.manifest_dir):
+            return
+        for name in os.listdir(manifest.manifest_dir):
+            if name.startswith(prefix) and name.endswith(".json") and name[len(prefix):-len(".json")].isdigit():
+                cls(board_id, int(name[len(prefix):-len(".json")]), manifest_dir).forget(start_address, size)
+
+    '''
+    Modify  : forgets everything, the next incremental programming writes the whole image
+    '''
+    def invalidate(self):
+        self.sectors = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def report(self):
+        return "incremental programming: %d bytes written, %d bytes skipped" % (self.bytes_written, self.bytes_skipped)
@@ -0,0 +1,244 @@
+'''
+    Declarative firmware descriptor decoding.
+
+    The descriptor tables of fwval_lib.common (MAIN_IMAGE_POINTER, MAIN_DESCRIPTOR,
+    BOOTROM_DESCRIPTOR, CMF_DESCRIPTOR, SPT_DESC, CPB_DESC, ...) map a field name to
+    [offset, size] of a little endian integer. JtagTest.read_add() decoded one field at a time
+    (slice, reverse_arr, hexlify, int(.., 16)). compile_layout() turns a set of fields into
+    precomputed struct.Struct unpackers instead, so all fields at the same base are decoded
+    from a single slice of the bitstream:
+        layout = compile_layout(table_fields(CMF_DESCRIPTOR, ["offset_trampol", "size_trampoline"]))
+        values = layout.unpack(bitstream, bitstream_start)
+        values["offset_trampol"]
+    Compiled layouts are memoized per field set, so callers can compile them inline.
+
+    FirmwareLayout is the decoded address map of one firmware image (what get_image_fw_add()
+    returned as a dict), frozen and still readable as layout["SSBL_START_ADD"]. decode_image()
+    builds it from a bitstream, decode_images() does it for several images of one rpd file,
+    optionally in a process pool where every worker maps and reverses the file on its own.
+'''
+import binascii
+import multiprocessing
+import struct
+
+from fwval_lib.configuration.bitstream import Bitstream
+
+# MAIN_IMAGE_POINTER fields of the main section addresses, in main section order
+MAIN_POINTER_FIELDS = ["1st_main_add", "2nd_main_add", "3rd_main_add", "4th_main_add"]
+# struct codes of the integer sizes struct can unpack directly, other sizes are unpacked as bytes
+_INT_CODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+class CompiledLayout(object):
+    '''
+    Input   : fields -- tuple of (key, offset, size), offsets relative to the base given to unpack()
+    '''
+    __slots__ = ("fields", "start", "end", "_groups")
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        assert self.fields, "CompiledLayout needs at least one field"
+        self.start = min(offset for _, offset, _ in self.fields)
+        self.end = max(offset + size for _, offset, size in self.fields)
+        # fields sorted by offset, split into groups of non overlapping fields, one Struct per group
+        self._groups = []
+        codes, keys, cursor, group_start = [], [], None, None
+        for key, offset, size in sorted(self.fields, key=lambda field: (field[1], field[2])):
+            if cursor is not None and offset < cursor:
+                self._groups.append((struct.Struct("<" + "".join(codes)), group_start - self.start, keys))
+                codes, keys, cursor = [], [], None
+            if cursor is None:
+                group_start = cursor = offset
+            if offset > cursor:
+                codes.append("%dx" % (offset - cursor))
+            codes.append(_INT_CODES.get(size, "%ds" % size))
+            keys.append((key, size not in _INT_CODES))
+            cursor = offset + size
+        self._groups.append((struct.Struct("<" + "".join(codes)), group_start - self.start, keys))
+
+    '''
+    Input   : bitstream -- bytearray/Bitstream the fields are read from
+    Optional: base -- offset of the descriptor in bitstream
+    Output  : returns {key: value} of every field
+    '''
+    def unpack(self, bitstream, base=0):
+        data = bytes(bitstream[base + self.start:base + self.end])
+        if len(data) < self.end - self.start:
+            raise ValueError("Descriptor fields 0x%x-0x%x are beyond the end of the bitstream" %
+                (base + self.start, base + self.end))
+        values = {}
+        for unpacker, offset, keys in self._groups:
+            for (key, as_bytes), value in zip(keys, unpacker.unpack_from(data, offset)):
+                # sizes struct has no code for, eg. 3 or 16 bytes, same as read_add()
+                values[key] = int(binascii.hexlify(value[::-1]), 16) if as_bytes else value
+        return values
+
+_LAYOUTS = {}
+
+'''
+    Input   : fields -- iterable of (key, offset, size), eg. from table_fields()
+    Output  : returns the CompiledLayout of the fields, memoized
+'''
+def compile_layout(fields):
+    fields = tuple(fields)
+    layout = _LAYOUTS.get(fields)
+    if layout is None:
+        layout = _LAYOUTS[fields] = CompiledLayout(fields)
+    return layout
+
+'''
+    Input   : table -- descriptor table, {name: [offset, size]}
+              names -- field names to take from the table
+    Optional: offset -- added to every field offset, eg. a2 start address
+              prefix -- prepended to the keys, to combine fields of several tables
+    Output  : returns a tuple of (key, offset, size) for compile_layout()
+'''
+def table_fields(table, names, offset=0, prefix=""):
+    return tuple((prefix + name, table[name][0] + offset, table[name][1]) for name in names)
+
+class FirmwareLayout(object):
+    '''
+    Input   : keyword arguments, the FIELDS below (upper or lower case), missing ones are None
+    Note    : frozen, and also readable as a dict with the upper case keys of get_image_fw_add()
+    '''
+    FIELDS = ("START_ADD", "ABSOLUTE_START_ADD", "END_ADD", "MAIN_START_ADD", "MAIN_END_ADD", "MAIN_SEC_NUM",
+              "SSBL_START_ADD", "SSBL_END_ADD", "TRAMPOLINE_START_ADD", "TRAMPOLINE_END_ADD",
+              "SYNC_START_ADD", "SYNC_END_ADD")
+    __slots__ = tuple(field.lower() for field in FIELDS)
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            value = fields.pop(name, fields.pop(name.lower(), None))
+            if isinstance(value, list):
+                value = tuple(value)
+            object.__setattr__(self, name.lower(), value)
+        assert not fields, "FirmwareLayout has no field %s" % ", ".join(fields)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FirmwareLayout is frozen")
+
+    def __delattr__(self, name):
+        raise AttributeError("FirmwareLayout is frozen")
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key.lower())
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __eq__(self, other):
+        return isinstance(other, FirmwareLayout) and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self[key] for key in self.FIELDS))
+
+    def __repr__(self):
+        return "FirmwareLayout(%s)" % ", ".join("%s=%r" % (key, self[key]) for key in self.FIELDS)
+
+    def get(self, key, default=None):
+        return self[key] if key in self.FIELDS else default
+
+    def keys(self):
+        return list(self.FIELDS)
+
+    def items(self):
+        return [(key, self[key]) for key in self.FIELDS]
+
+    '''
+    Output  : returns the layout as the dict get_image_fw_add() used to return (lists for the main sections)
+    '''
+    def as_dict(self):
+        return dict((key, list(value) if isinstance(value, tuple) else value) for key, value in self.items())
+
+    @classmethod
+    def from_dict(cls, fw_info):
+        return cls(**dict((str(key), value) for key, value in fw_info.items()))
+
+'''
+    Input   : bitstream -- bit reversed bytearray/Bitstream of the rpd
+              bitstream_start -- offset of the image within bitstream
+              descriptors -- {table name: table} of MAIN_IMAGE_POINTER, MAIN_DESCRIPTOR,
+                             BOOTROM_DESCRIPTOR and CMF_DESCRIPTOR
+    Optional: a2_partition_start -- flash address of PARTITION_A2, START_ADD is relative to it
+              single_image_rpd, single_image_offset, bitstream_flash_offset -- see RsuTest.get_image_fw_add()
+    Output  : returns the FirmwareLayout of the image
+'''
+def decode_image(bitstream, bitstream_start, descriptors, a2_partition_start=0, single_image_rpd=0,
+                 single_image_offset=None, bitstream_flash_offset=0):
+    header = compile_layout(
+        table_fields(descriptors["MAIN_IMAGE_POINTER"], ["sec_num"] + MAIN_POINTER_FIELDS, prefix="mip.") +
+        table_fields(descriptors["CMF_DESCRIPTOR"], ["fw_sec_size", "offset_trampol", "size_trampoline"], prefix="cmf.") +
+        table_fields(descriptors["BOOTROM_DESCRIPTOR"], ["ssbl_offset", "ssbl_size"], prefix="bootrom.")).unpack(bitstream, bitstream_start)
+    main_descriptor = compile_layout(table_fields(descriptors["MAIN_DESCRIPTOR"], ["size_main_sec"]))
+
+    fw_info = {"START_ADD": bitstream_start + bitstream_flash_offset - a2_partition_start,
+               "ABSOLUTE_START_ADD": bitstream_start + bitstream_flash_offset,
+               "MAIN_SEC_NUM": header["mip.sec_num"],
+               # dummy add 0
+               "MAIN_START_ADD": [0], "MAIN_END_ADD": [0]}
+    for main_sec in range(1, min(fw_info["MAIN_SEC_NUM"], len(MAIN_POINTER_FIELDS)) + 1):
+        add = header["mip." + MAIN_POINTER_FIELDS[main_sec - 1]]
+        # if address == 0, it means we are using relative address
+        if add == 0 and main_sec == 1:
+            add = bitstream_start + header["cmf.fw_sec_size"]
+        elif add == 0:
+            add = fw_info["MAIN_END_ADD"][main_sec - 1] + 1
+        fw_info["MAIN_START_ADD"].append(add)
+        if single_image_rpd == 0 or single_image_offset is not None:
+            descriptor_start = add if single_image_rpd == 0 else add - single_image_offset
+            fw_info["MAIN_END_ADD"].append(add + main_descriptor.unpack(bitstream, descriptor_start)["size_main_sec"] - 1)
+    if single_image_rpd == 0:
+        fw_info["END_ADD"] = fw_info["MAIN_END_ADD"][fw_info["MAIN_SEC_NUM"]]
+
+    fw_info["SSBL_START_ADD"] = bitstream_start + header["bootrom.ssbl_offset"] + bitstream_flash_offset
+    fw_info["SSBL_END_ADD"] = fw_info["SSBL_START_ADD"] + header["bootrom.ssbl_size"]
+    fw_info["TRAMPOLINE_START_ADD"] = bitstream_start + header["cmf.offset_trampol"] + bitstream_flash_offset
+    fw_info["TRAMPOLINE_END_ADD"] = fw_info["TRAMPOLINE_START_ADD"] + header["cmf.size_trampoline"]
+    fw_info["SYNC_START_ADD"] = fw_info["TRAMPOLINE_END_ADD"]
+    if fw_info["SYNC_START_ADD"] != fw_info["SSBL_START_ADD"]:
+        fw_info["SYNC_END_ADD"] = fw_info["SSBL_START_ADD"] - 1
+    return FirmwareLayout(**fw_info)
+
+def _decode_image_worker(args):
+    file_path, bitstream_start, descriptors, a2_partition_start = args
+    bitstream = Bitstream.open(file_path, bit_reversed=True)
+    try:
+        # plain dict, a frozen __slots__ object does not pickle back to the parent
+        return decode_image(bitstream, bitstream_start, descriptors, a2_partition_start).as_dict()
+    finally:
+        bitstream.close()
+
+'''
+    Input   : file_path -- rpd file (file order, reversed on the fly)
+              images -- list of (name, offset of the image in the rpd)
+              descriptors -- see decode_image()
+    Optional: a2_partition_start -- see decode_image()
+              workers -- size of the process pool, 0/1 to decode in this process
+    Output  : returns {name: FirmwareLayout}
+    Note    : every worker maps the file itself, only the descriptor bytes of its image are read
+'''
+def decode_images(file_path, images, descriptors, a2_partition_start=0, workers=0):
+    if workers > 1 and len(images) > 1:
+        pool = multiprocessing.Pool(min(workers, len(images)))
+        try:
+            results = pool.map(_decode_image_worker,
+                [(file_path, start, descriptors, a2_partition_start) for _, start in images])
+        finally:
+            pool.close()
+            pool.join()
+        return dict((name, FirmwareLayout.from_dict(fw_info)) for (name, _), fw_info in zip(images, results))
+    bitstream = Bitstream.open(file_path, bit_reversed=True)
+    try:
+        return dict((name, decode_image(bitstream, start, descriptors, a2_partition_start)) for name, start in images)
+    finally:
+        bitstream.close()
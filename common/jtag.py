@@ -1,14 +1,34 @@
 from fwval_lib.common import *
 from fwval_lib.common.platform_system_console import start_systemconsole as startscon
+from fwval_lib.configuration.bitrev import qspi_program_plan, unpack_reversed_words
+from fwval_lib.configuration.bitstream import Bitstream, as_bytearray, copy_bitstream
+from fwval_lib.configuration.bitstreamcache import BitstreamCache
+from fwval_lib.configuration.eraseplan import DIE_ERASE_FRACTION, ERASE_SIZES, layout_ranges, plan_erase
+from fwval_lib.configuration.flashmanifest import FlashManifest
+from fwval_lib.configuration.fwlayout import MAIN_POINTER_FIELDS, FirmwareLayout, compile_layout, table_fields
+from fwval_lib.configuration.keycancellation import cancellation_index, toolchain_key
+from fwval_lib.configuration.layoutcache import LayoutCache
+from fwval_lib.configuration.memcompare import compare_buffers
+from fwval_lib.configuration.pinwait import PinSettleStats, wait_pins
+from fwval_lib.configuration.prefetch import Pending
+from fwval_lib.configuration.rejectwatch import STALLED_TRANSFER_ERROR, BitstreamRejected, RejectionMonitor, TransferNotStopped, config_status_error, probe_reasons, run_watched, stall_probe
+from fwval_lib.configuration.runprofile import RunProfile
+from fwval_lib.configuration.spantrace import Tracer, traced
+from fwval_lib.configuration.timeoutmodel import TimeoutModel
+from fwval_lib.configuration.waitfor import WaitLedger, quiet, wait_for
 from fwval_lib.security.puf import PufAdd
+import atexit
 import binascii
+import contextlib
 import execution_lib
 import logging
 import os
 import pycv as fwval
 import random
 import re
+import socket
 import subprocess
+import time
 # To dump the sector memory and compare with golden bitstream image
 if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
     from fwval_lib.common.emu_utils import *
@@ -21,6 +41,13 @@ except: pass
 cv_logger.info("%s current rev: #%s" % (__name__, __version__))
 cv_logger.info("%s source: %s" % (__name__, __file__))
 
+# DUT helper design loaded to access the QSPI flash, and the test keys it is signed with when present
+HELPER_SOF = 'or_gate_design.x4.77MHZ_IOSC.sof'
+HELPER_PEM = "iid_puf/auth_keys/agilex_ec_priv_384_test.pem"
+HELPER_QKY = "iid_puf/auth_keys/agilex_ec_384_test.qky"
+# QSPI_READ sizes to try, biggest first: the response length field is 11 bits (in words)
+QSPI_READ_SIZES = (0x7ff * 4, 4096)
+
 ###########################################################################################
 #   Empty Class
 ###########################################################################################
@@ -61,6 +88,8 @@ class JtagTest(EmptyTest):
         else:
             self._REV = rev
         self._BASE_DIE = os.environ['DUT_BASE_DIE']
+        # environment and toolchain checks, resolved once, DUT family added once identified
+        self.run_profile = RunProfile.resolve(compare_quartus_version, base_die=self._BASE_DIE, rev=self._REV)
         self._BFM_CONFIG = configuration
         self._MSEL   = int(msel)
         self._DEVICE_IDX = int(device_idx)
@@ -81,6 +110,8 @@ class JtagTest(EmptyTest):
             self.platform_test.platform_identification()
             self.DUT_FILTER = self.platform_test.platform_properties
             self.DUT_FAMILY = self.DUT_FILTER.dut_family
+            self.run_profile = RunProfile.resolve(compare_quartus_version, dut_family=self.DUT_FAMILY,
+                base_die=self._BASE_DIE, rev=self._REV)
         except:
             print_err("\nTEST_RESULT :: FAILED DUT PLATFORM IDENTIFICATION")
             #log the traceback into stderr
@@ -242,8 +273,8 @@ class JtagTest(EmptyTest):
                         self.bmc.set_sdm_dc_en(True)
                 if self._CONFIG_DONE != None:
                     self.config_done = self.dut.get_connector(self._CONFIG_DONE,self._DEVICE_IDX)
-                    self._lib_delay()
                     assert_err(self.config_done != None, "ERROR :: Cannot open config_done (%s) Connector" %self._CONFIG_DONE)
+                    self._lib_delay()
                 else:
                     self.config_done = None
                     cv_logger.warning("User disabled the CONFIG_DONE gpio connector")
@@ -255,8 +286,8 @@ class JtagTest(EmptyTest):
                     cv_logger.warning("User disabled the INIT_DONE gpio connector")
 
             self.jtag = self.dut.get_connector("jtag",self._DEVICE_IDX)
-            self._lib_delay()
             assert_err(self.jtag != None, "ERROR :: Cannot open the JTAG Connector")
+            self._lib_delay()
             if ((msel == 9) or (msel == 11)):
                 try:
                     self.erase_qspi_die()
@@ -293,6 +324,8 @@ class JtagTest(EmptyTest):
               size -- 512, 1024. die size in Mbit
               power_cycle -- True, power cycle after flash erasure
               timeout -- 60s to send dut helper image
+              layout_files -- rpd/map files of the upcoming test (default $FWVAL_QSPI_ERASE_LAYOUT,
+                              os.pathsep separated), see plan_qspi_die_erase()
     Modify  : Erase flash and power_cycle mudv
               1. power on dut
               2. capture nconfig and set nconfig to 1
@@ -304,7 +337,8 @@ class JtagTest(EmptyTest):
               8. power cycle and restore nconfig value
     Output  : None
     '''  
-    def erase_qspi_die(self, chip_select=0, start_address=0, size=None, power_cycle=True, skip_helper=False, timeout=60):
+    @traced("erase")
+    def erase_qspi_die(self, chip_select=0, start_address=0, size=None, power_cycle=True, skip_helper=False, timeout=60, layout_files=None):
         
         old_nconfig = self.nconfig.get_output()
 
@@ -327,58 +361,164 @@ class JtagTest(EmptyTest):
                 else:
                     assert size!=None, "ERROR :: Failed to get DUT_QSPI_DEVICE_DENSITY from board resource"
 
+            if layout_files == None and os.environ.get("FWVAL_QSPI_ERASE_LAYOUT"):
+                layout_files = os.environ["FWVAL_QSPI_ERASE_LAYOUT"].split(os.pathsep)
+            erase_plan = self.plan_qspi_die_erase(layout_files, chip_select, start_address, size) if layout_files else None
+
             if (not skip_helper):    
                 # prepare helper image
                 cv_logger.info("Prepare DUT helper image...")
-                helper = execution_lib.getsof(input_sof_flag=0,input_file='or_gate_design.x4.77MHZ_IOSC.sof',mode="sof2rbf", conf="qspi")
-                pem_file = "iid_puf/auth_keys/agilex_ec_priv_384_test.pem"
-                qky_file = "iid_puf/auth_keys/agilex_ec_384_test.qky"
-                signed_helper = "signed_helper_file.rbf"
-
-                if (os.path.exists(pem_file) and os.path.exists(qky_file)):
-                    cv_logger.info("Use signed helper image instead of unsigned helper image")
-                    run_command("quartus_sign --family=agilex --operation=sign --pem=%s --qky=%s %s %s" %(pem_file,qky_file,helper,signed_helper))
-                    helper = signed_helper
-                
-                cv_logger.info("Avoid boot from old flash at the beginning of config")
-                self.power_cycle(nconfig=0)
+                [helper, helper_key] = self.get_helper_image()
 
-                # wait for sdm to finish processing previous bitstream from flash if any. assume 20s
-                cv_logger.info("Wait 20s before issuing CONFIG_JTAG...")
-                delay(20000)
-            
-                self.config_jtag()
-                self.send_jtag(file_path=helper, success=1, timeout=timeout)
+                if self.is_helper_loaded(helper_key):
+                    cv_logger.info("DUT helper image is already running, skip reloading it")
+                else:
+                    cv_logger.info("Avoid boot from old flash at the beginning of config")
+                    self.power_cycle(nconfig=0)
+
+                    # wait for sdm to finish processing previous bitstream from flash if any. assume 20s
+                    cv_logger.info("Wait 20s before issuing CONFIG_JTAG...")
+                    delay(20000)
+
+                    self.config_jtag()
+                    self.send_jtag(file_path=helper, success=1, timeout=timeout)
+                    self.remember_helper_loaded(helper_key)
 			
             cv_logger.info("Erasing flash die from address 0x%x with size %d Mbit..." % (start_address, size))
-            self.dut.test_time()
-            status = True
-            status = self.qspi.qspi_open()
-            assert status==1, "ERROR :: Failed to open QSPI interface"
+            with self.span("erase flash die", "erase"):
+                status = True
+                status = self.qspi.qspi_open()
+                assert status==1, "ERROR :: Failed to open QSPI interface"
             
-            # Set Chip Select to decide which daughter card
-            status = self.qspi.qspi_set_cs(chip_select)
-            assert status==1, "ERROR :: Failed to chip select qspi"
+                # Set Chip Select to decide which daughter card
+                status = self.qspi.qspi_set_cs(chip_select)
+                assert status==1, "ERROR :: Failed to chip select qspi"
             
-            # sector erase code for future reference. one sector 64kb
-            # offset = 0
-            # while status and offset < size :
-            #     status = self.qspi.qspi_sector_erase(start_address + offset)
-            #     offset +=  64<<10
+                # sector erase code for future reference. one sector 64kb
+                # offset = 0
+                # while status and offset < size :
+                #     status = self.qspi.qspi_sector_erase(start_address + offset)
+                #     offset +=  64<<10
                 
-            cv_logger.info("QSPI_ERASE")
-            # TODO: timeout, instead of explicitly put 1200s, calculate based on erase size
-            # Data on time taken needed, erase time limit is not clearly defined
-            self.qspi.qspi_die_erase(start_address, size, timeout=1200)
+                manifest = self.get_flash_manifest(chip_select)
+                if erase_plan == None:
+                    cv_logger.info("QSPI_ERASE")
+                    # erase time limit is not clearly defined, 1200s until erases were measured on the platform
+                    erase_timeout = self.transfer_timeout("qspi", "die_erase", size<<17, 1200)
+                    with self.measured_transfer("qspi", "die_erase", size<<17):
+                        self.qspi.qspi_die_erase(start_address, size, timeout=erase_timeout)
+                    # size is in Mbit
+                    manifest.record_erase(start_address, size<<17)
+                else:
+                    cv_logger.info("QSPI_ERASE of the layout span and the dirty ranges only")
+                    for address, sector_size in erase_plan :
+                        status = self.qspi.qspi_sector_erase(address)
+                        assert status, "ERROR :: Failed to erase QSPI sector 0x%08x" % address
+                        manifest.record_erase(address, sector_size, save=False)
+                    manifest.try_save()
+                    cv_logger.info("QSPI %s" % erase_plan.report())
                 
-            # Close exclusive access to QSPI interface
-            status = self.qspi.qspi_close()
-            assert status, "ERROR :: Fail to close QSPI Interface access"
-            cv_logger.info("Time to erase flash die: %s" % self.dut.elapsed_time())
+                # Close exclusive access to QSPI interface
+                status = self.qspi.qspi_close()
+                assert status, "ERROR :: Fail to close QSPI Interface access"
 
             if power_cycle:
                 self.power_cycle(old_nconfig)
                 
+    '''
+    Output  : returns [helper, helper_key]
+              helper -- path of the DUT helper image (rbf), signed when the test keys exist
+              helper_key -- content key of the helper (helper, pem and qky digests), None if not cached
+    Note    : the signed helper is kept in the layout cache, so quartus_sign only runs for new content
+    '''
+    def get_helper_image(self):
+        helper = execution_lib.getsof(input_sof_flag=0,input_file=HELPER_SOF,mode="sof2rbf", conf="qspi")
+        if not (os.path.exists(HELPER_PEM) and os.path.exists(HELPER_QKY)):
+            return [helper, None]
+
+        cv_logger.info("Use signed helper image instead of unsigned helper image")
+        cache = self.get_layout_cache()
+        if not cache.enabled:
+            run_command("quartus_sign --family=agilex --operation=sign --pem=%s --qky=%s %s %s" %(HELPER_PEM,HELPER_QKY,helper,"signed_helper_file.rbf"))
+            return ["signed_helper_file.rbf", None]
+
+        helper_key = cache.key("signed_helper", [helper, HELPER_PEM, HELPER_QKY])
+        signed_helper = os.path.join(cache.cache_dir, helper_key + ".rbf")
+        if os.path.exists(signed_helper):
+            cv_logger.info("Reuse signed helper image %s" % signed_helper)
+        else:
+            if not os.path.isdir(cache.cache_dir):
+                os.makedirs(cache.cache_dir)
+            temp_helper = signed_helper + ".%d.tmp" % os.getpid()
+            run_command("quartus_sign --family=agilex --operation=sign --pem=%s --qky=%s %s %s" %(HELPER_PEM,HELPER_QKY,helper,temp_helper))
+            os.rename(temp_helper, signed_helper)
+        return [signed_helper, helper_key]
+
+    '''
+    Input   : helper_key -- from get_helper_image()
+    Output  : returns True if the DUT runs the helper design, ie. jtagconfig reports the design hash
+              seen after the helper was last loaded
+    '''
+    def is_helper_loaded(self, helper_key):
+        if helper_key == None:
+            return False
+        entry = self.get_layout_cache().get(helper_key)
+        if not entry or not entry.get("design_hash"):
+            return False
+        try:
+            [design_hash, sld_node] = self.check_idle_jtagconfig()
+        except Exception as e:
+            cv_logger.warning("Cannot read the design hash, reload the helper image: %s" % str(e))
+            return False
+        return design_hash == entry["design_hash"]
+
+    '''
+    Input   : helper_key -- from get_helper_image()
+    Modify  : records the design hash of the helper just loaded, for is_helper_loaded()
+    '''
+    def remember_helper_loaded(self, helper_key):
+        if helper_key == None:
+            return
+        try:
+            [design_hash, sld_node] = self.check_idle_jtagconfig()
+        except Exception as e:
+            cv_logger.warning("Cannot read the design hash of the helper image: %s" % str(e))
+            return
+        if design_hash:
+            self.get_layout_cache().put(helper_key, {"design_hash": design_hash})
+
+    '''
+    Input   : layout_files -- rpd/map files the upcoming test programs, see layout_ranges()
+              chip_select, start_address -- flash to erase
+              size -- die size in Mbit
+    Output  : returns the ErasePlan (64KB sectors) of the range limited die erase,
+              None if the whole die must be erased
+    Note    : the layout span is always erased, the firmware writes into it (eg. SPT/CPB updates)
+              without the flash manifest knowing. Past the span only the ranges the flash manifest
+              does not know as blank are erased, a board without manifest gets the full die erase,
+              and so does a plan erasing more than DIE_ERASE_FRACTION of the die.
+              Flash writes made outside this library (other tools or hosts, quartus_pgm, manual
+              erases) leave the manifest stale: sectors it knows as blank are not erased. Delete
+              the manifest of the board (see FlashManifest) after such writes.
+    '''
+    def plan_qspi_die_erase(self, layout_files, chip_select=0, start_address=0, size=512):
+        manifest = self.get_flash_manifest(chip_select)
+        if not manifest.sectors :
+            cv_logger.info("No flash manifest for this board yet, erasing the whole QSPI die")
+            return None
+        die_end = start_address + (size<<17)
+        span = [(max(address, start_address), min(address + length, die_end) - max(address, start_address))
+                for address, length in layout_ranges(layout_files) if address < die_end and address + length > start_address]
+        ranges = span + manifest.dirty_ranges(start_address, size<<17)
+        # the QSPI connector only erases 64KB sectors
+        erase_plan = plan_erase(ranges, (64<<10,), legacy_size=64<<10)
+        cv_logger.info("Range limited QSPI die erase: %d bytes of layout span, %d of %d bytes to erase" %
+            (sum(length for _, length in span), erase_plan.erased_bytes, size<<17))
+        if erase_plan.erased_bytes > DIE_ERASE_FRACTION * (size<<17) :
+            cv_logger.info("The range limited erase covers most of the die, erasing the whole QSPI die")
+            return None
+        return erase_plan
+
     '''
     Added support for TSBL - ND Rearch 21.1 and beyond now uses TSBL, ND 20.4.1 below and FM still uses SSBL (HSD :1508667742)
     '''
@@ -405,16 +545,201 @@ class JtagTest(EmptyTest):
             cv_logger.debug("Detected family: {} and ACDS Version: {}. Using {} values".format(self.DUT_FAMILY,quartus_version,self.SSBL_TSBL))
 
     '''
-    For emulator delay is multiplied emu_delay_multiplier.
+    For emulator delay is multiplied by run_profile.delay_multiplier.
     Input   : delay (millisecond)
     '''
     def _lib_delay(self, delays=1000) :
+        delay(delays * self.run_profile.delay_multiplier, self.dut)
+
+    '''
+    Input   : condition -- function() returning True once the awaited event happened, an exception
+                           counts as not happened yet
+              name -- what is awaited, for the log
+              timeout_ms -- deadline, in millisecond
+    Optional: legacy_ms -- fixed delay the wait replaces, for the time saved log, default timeout_ms
+              scale -- True to multiply timeout_ms and legacy_ms like _lib_delay() on the emulator
+    Output  : returns True if the condition came true before the deadline
+    Note    : polls with exponential backoff (fwval_lib.configuration.waitfor), see get_wait_ledger()
+    '''
+    @traced("wait")
+    def wait_until(self, condition, name, timeout_ms, legacy_ms=None, scale=True):
+        multiplier = self.run_profile.delay_multiplier if scale else 1
+        legacy = (timeout_ms if legacy_ms is None else legacy_ms) * multiplier / 1000.0
+        result = wait_for(quiet(condition), timeout_ms * multiplier / 1000.0)
+        self.get_wait_ledger().record(name, legacy, result)
+        if result:
+            cv_logger.info("%s after %dms (%d polls) instead of a fixed %dms, %dms saved" %
+                (name, result.elapsed * 1000, result.polls, legacy * 1000, (legacy - result.elapsed) * 1000))
+        else:
+            cv_logger.warning("%s not seen within %dms, proceeding" %(name, result.elapsed * 1000))
+        return result.ok
 
-        emu_delay_multiplier = 120
-        if (os.environ.get("FWVAL_PLATFORM") == 'emulator') :
-            delay(delays * emu_delay_multiplier, self.dut)
-        else :
-            delay(delays, self.dut)
+    '''
+    Output  : returns the WaitLedger of the waits of this test, its report() gives the total time saved
+    '''
+    def get_wait_ledger(self) :
+        if not hasattr(self, "_wait_ledger") :
+            self._wait_ledger = WaitLedger()
+        return self._wait_ledger
+
+    '''
+    Output  : returns the TimeoutModel of the platform, durations measured by the earlier tests on it
+    '''
+    def get_timeout_model(self) :
+        if not hasattr(self, "_timeout_model") :
+            self._timeout_model = TimeoutModel(self.run_profile.platform or self.run_profile.pycv_platform)
+        return self._timeout_model
+
+    '''
+    Input   : interface, operation -- transfer the timeout is for, eg. "jtag", "send"
+              size -- bytes to transfer, None for an operation without payload
+              default -- fixed timeout of the call site, in seconds
+    Output  : returns the timeout derived from the throughput measured on the platform if longer than default,
+              default otherwise, until enough transfers were measured or without FWVAL_ADAPTIVE_TIMEOUT=1
+    Note    : only ever lengthens the fixed timeout, eg. for a bitstream bigger than the one it was picked for
+    '''
+    def transfer_timeout(self, interface, operation, size, default):
+        if not self.run_profile.adaptive_timeouts:
+            return default
+        timeout = self.get_timeout_model().timeout(interface, operation, size)
+        if timeout == None or timeout <= default:
+            return default
+        cv_logger.info("%s %s timeout: %ds%s (measured throughput) instead of %ds" %
+            (interface, operation, timeout, " for %d bytes" % size if size else "", default))
+        return timeout
+
+    '''
+    Input   : interface, operation, size -- see transfer_timeout()
+    Modify  : self, records the duration of the with block in the TimeoutModel, unless it raised
+    Example : with self.measured_transfer("jtag", "send", size):
+                  self.jtag.send_data_file(file_path, timeout=timeout)
+    '''
+    @contextlib.contextmanager
+    def measured_transfer(self, interface, operation, size=None):
+        start = time.time()
+        yield
+        self.get_timeout_model().record(interface, operation, size, time.time() - start)
+
+    '''
+    Output  : returns the Tracer of the timing spans of this test, written with write_trace() when the test exits
+    '''
+    def get_tracer(self) :
+        if not hasattr(self, "_tracer") :
+            self._tracer = Tracer()
+            atexit.register(self.write_trace)
+        return self._tracer
+
+    '''
+    Input   : name -- step timed by the with block, eg. "write data into RAM"
+    Optional: category -- phase of the step, see fwval_lib.configuration.spantrace
+    Modify  : self, records the span and logs its duration
+    Example : with self.span("erase flash die", "erase"):
+                  self.qspi.qspi_die_erase(start_address, size, timeout=timeout)
+    '''
+    @contextlib.contextmanager
+    def span(self, name, category="step"):
+        with self.get_tracer().span(name, category) as span:
+            yield span
+        cv_logger.info("Time to %s: %.3fs" % (name, span.elapsed))
+
+    '''
+    Modify  : writes the Chrome trace and the per-phase summary of the timing spans, see Tracer.write()
+    '''
+    def write_trace(self):
+        tracer = self.get_tracer()
+        try:
+            trace_path, summary_path = tracer.write()
+        except (IOError, OSError) as e:
+            cv_logger.warning("Timing trace not written: %s" % e)
+            return
+        cv_logger.info("Timing spans per phase:\n%s" % tracer.report())
+        cv_logger.info("Timing trace written to %s, summary to %s" % (trace_path, summary_path))
+
+    '''
+    Input   : expected -- {pin: value} of the pins to check, pin one of "nstatus", "config_done", "init_done"
+    Output  : returns a condition for wait_until(), True once every pin with a connector reads its value
+    '''
+    def pins_match(self, **expected):
+        connectors = [(getattr(self, pin, None), value) for pin, value in expected.items()]
+        connectors = [(connector, value) for connector, value in connectors if connector != None]
+        return lambda: all(connector.get_output() == value for connector, value in connectors)
+
+    '''
+    Optional: timeout -- seconds the SDM has to answer
+    Output  : returns True if the SDM answers a NOOP on the JTAG mailbox with an OK response
+    Note    : unlike jtag_send_noop(), a busy SDM is not waited for the full command timeout
+    '''
+    def sdm_mailbox_ready(self, timeout=1):
+        try:
+            resp = self.jtag.packet_send_cmd(32, SDM_CMD['NOOP'], timeout=timeout)
+        finally:
+            self.jtag_unclaim_packet()
+        return isinstance(resp, list) and len(resp) > 0 and resp[0] == 0
+
+    '''
+    Optional: timeout -- seconds the SDM has to answer
+    Output  : returns the rejection reason if CONFIG_STATUS on the JTAG mailbox shows a configuration error,
+              None otherwise
+    Note    : like sdm_mailbox_ready(), a busy SDM is not waited for the full command timeout
+    '''
+    def config_status_rejection(self, timeout=1):
+        try:
+            resp = self.jtag.packet_send_cmd(32, SDM_CMD['CONFIG_STATUS'], timeout=timeout)
+        finally:
+            self.jtag_unclaim_packet()
+        return config_status_error(resp)
+
+    '''
+    Optional: error_nstatus -- 0 if nSTATUS stays low once the configuration failed, see nconfig1_qspi()
+    Output  : returns a RejectionMonitor of a configuration not sent over JTAG (eg. QSPI), watching CONFIG_STATUS
+              on the JTAG mailbox and, with error_nstatus 0, nSTATUS
+    Note    : ND5 RevA cannot call CONFIG_STATUS in every state, only nSTATUS is watched there
+    '''
+    def config_rejection_monitor(self, error_nstatus=1):
+        probes = []
+        if not ((re.search('[Nn][Dd]5', self._BASE_DIE) != None) and (re.search('[aA]', self._REV) != None)):
+            probes.append(self.config_status_rejection)
+        if error_nstatus == 0 and getattr(self, "nstatus", None) != None:
+            probes.append(lambda: "nSTATUS low" if self.nstatus.get_output() == 0 else None)
+        return RejectionMonitor(probes)
+
+    '''
+    Input   : legacy_ms -- fixed delay the wait replaces, also the deadline, not scaled
+    Optional: config_done -- CONFIG_DONE value to wait for, None to keep the fixed delay
+    Output  : returns True once the configuration is over: CONFIG_DONE reads config_done and
+              the SDM answers the JTAG mailbox again
+    Note    : the SDM answering alone proves nothing (it answers right after a status check), without
+              config_done or a CONFIG_DONE connector the fixed delay is kept
+    '''
+    def wait_for_config_settled(self, legacy_ms, config_done=None):
+        if config_done == None or getattr(self, "config_done", None) == None:
+            cv_logger.info("Wait for %ds" % (legacy_ms / 1000))
+            delay(legacy_ms)
+            return True
+        pins = self.pins_match(config_done=config_done)
+        return self.wait_until(lambda: pins() and self.sdm_mailbox_ready(), "Configuration settled", legacy_ms,
+            scale=False)
+
+    '''
+    Optional: legacy_ms -- fixed delay the wait replaces, also the deadline, not scaled
+    Output  : returns True once the device went through a reconfiguration (eg. after rsu_switch_image()):
+              CONFIG_DONE seen low, then high again with the SDM answering the JTAG mailbox
+    Note    : without a CONFIG_DONE connector, falls back to the fixed delay. The mailbox polls share one
+              packet_session(), the service is only claimed once CONFIG_DONE is high again
+    '''
+    def wait_for_reconfig(self, legacy_ms=1000):
+        if getattr(self, "config_done", None) == None:
+            delay(legacy_ms, self.dut)
+            return True
+        went_low = []
+        def reconfigured():
+            if not went_low:
+                if self.config_done.get_output() == 0:
+                    went_low.append(True)
+                return False
+            return self.config_done.get_output() == 1 and self.sdm_mailbox_ready()
+        with self.packet_session():
+            return self.wait_until(reconfigured, "Reconfiguration", legacy_ms, scale=False)
 
     '''
     Input   : dut_closed: set to 1 dut already closed
@@ -454,6 +779,7 @@ class JtagTest(EmptyTest):
     Req     : nconfig must be 1 or 0
     Mod     : self -- power cycle the board (off, set nconfig, on)
     '''
+    @traced("power")
     def power_cycle(self, nconfig=1):
         #power off
         cv_logger.info("Power off")
@@ -493,87 +819,30 @@ class JtagTest(EmptyTest):
             cv_logger.warning("Environment variable DUT_SFE not found, default NON_SFE is used")
             return False
 
+    '''
+    Output    : returns the KeyCancellationIndex (fwval_lib.configuration.keycancellation) of the
+                KEY_CANCELLATION_DATABASE list of the device, parsed once per process
+    '''
+    def get_key_cancellation_index(self):
+        if (self.run_profile.nd_die):
+            return cancellation_index(KEY_CANCELLATION_DATABASE[0], nd=True)
+        return cancellation_index(KEY_CANCELLATION_DATABASE[1])
+
+    '''
+    Requires  : acds resources
+    Output    : returns (version tuple, build number) of the acds in use, see toolchain_key()
+    '''
+    def get_toolchain_key(self):
+        return toolchain_key(os.environ['QUARTUS_VERSION'], os.environ['ACDS_BUILD_NUMBER'])
+
     '''
     Requires  : acds resources
     Output    : returns firmware cancelled key, recorded by database at the top of the library, 0 mean no key is cancelled
     '''
 
     def get_cancelled_key_based_on_acds_version(self,):
-
-        if (re.search('[Nn][Dd]', self._BASE_DIE) != None):
-            KEY_CANCELLATION = KEY_CANCELLATION_DATABASE[0]
-        else:
-            KEY_CANCELLATION = KEY_CANCELLATION_DATABASE[1]
-
-        index_number = 0
-        current_acds_version      = os.environ['QUARTUS_VERSION']     #get acds version EG: 19.0
-        current_acds_version_path = os.environ['QUARTUS_ROOTDIR']     #get acds path EG: /tools/acds/19.0/20/linux64/quartus
-        current_acds_build        = os.environ['ACDS_BUILD_NUMBER']   #get acds build number
-
-        #Function to compare acds version, if left side latest than right side, return >  0 else return <  0, if same version then = 0
-        def compare_version(acds_version1, acds_version2):
-            def normalize(v):
-                return [int(x) for x in re.sub(r'(\.0+)*$','', v).split(".")]
-            return cmp(normalize(acds_version1), normalize(acds_version2))
-
-        ##############################################
-        ## Compare first item and last item before loop ##
-        ##############################################
-        #Compare first item, if current version smaller than the first data in data base, then no key cancelled
-        acds_version_build, cancelled_key = KEY_CANCELLATION[0]
-        acds_version = acds_version_build.split("/")[0]
-        acds_build   = acds_version_build.split("/")[1]
-
-        if ((compare_version(current_acds_version, acds_version) < 0) or ((compare_version(current_acds_version, acds_version) == 0) and (current_acds_build < acds_build))):
-            cv_logger.info("TEST :: Cancelled Key is 0")
-            return 0
-
-        #Compare last item, if current version later than the last data in database, key cancelled = last data in database
-        acds_version_build, cancelled_key = KEY_CANCELLATION[-1]
-        acds_version = acds_version_build.split("/")[0]
-        acds_build   = acds_version_build.split("/")[1]
-
-        if ((compare_version(current_acds_version, acds_version) > 0) or ((compare_version(current_acds_version, acds_version) == 0) and (current_acds_build > acds_build))):
-            cv_logger.info("TEST :: Cancelled Key is %s" %(cancelled_key))
-            return cancelled_key
-
-        ##############################
-        ## Compare other posibility ##
-        ##############################
-        prevItem  = -1;
-        ItemCount = 0;
-        for acds_version_build, cancelled_key in KEY_CANCELLATION:
-            acds_version = acds_version_build.split("/")[0]
-            acds_build   = acds_version_build.split("/")[1]
-
-            #If both acds version number are equal
-            if (compare_version(current_acds_version, acds_version) == 0):
-                #if both acds version number are the same then compare the build number
-                if (current_acds_build == acds_build):
-                    #if both build number are the same then exit loop, and take the cancelled key
-                    break
-
-                #If current acds_build > database_build number
-                elif (current_acds_build > acds_build):
-                    #record it down first
-                    prevItem = ItemCount;
-
-                #If current acds_build < database_build number
-                elif (current_acds_build < acds_build):
-                    if (prevItem != -1):
-                        cancelled_key = KEY_CANCELLATION[prevItem][1]
-                        break
-
-            elif (compare_version(current_acds_version, acds_version) > 0):
-                #record it down first
-                prevItem = ItemCount;
-            elif (compare_version(current_acds_version, acds_version) < 0):
-                #If Current acds_version
-                if (prevItem != -1):
-                    cancelled_key = KEY_CANCELLATION[prevItem][1]
-                    break
-            ItemCount = ItemCount + 1  #To count the number of element
-
+        # last database entry not newer than the acds version/build in use
+        cancelled_key = self.get_key_cancellation_index().cancelled_key(self.get_toolchain_key())
         cv_logger.info("TEST :: Cancelled Key is %s" %(cancelled_key))
         return cancelled_key
 
@@ -628,9 +897,10 @@ class JtagTest(EmptyTest):
     '''
     def get_cancelled_psg_key(self):
 
-        svn = get_cmf_security_version()
-        dut_property = dut_properties()
-        if dut_property.dut_family == "stratix10":
+        # the CMF security version only depends on the acds in use
+        svn = self.get_key_cancellation_index().toolchain_value("cmf_security_version", self.get_toolchain_key(),
+            self.DUT_FAMILY, get_cmf_security_version)
+        if self.DUT_FAMILY == "stratix10":
             if svn == 0: #key 1 firmware
                 key_cancellation = 0
             elif svn == 1: #key 0 firmware
@@ -651,6 +921,14 @@ class JtagTest(EmptyTest):
     '''
 
     def get_fw_key(self,):
+        # the pregen sof only depends on the acds in use, convert it once per acds build
+        return self.get_key_cancellation_index().toolchain_value("fw_key", self.get_toolchain_key(),
+            self.DUT_FAMILY, self._read_fw_key)
+
+    '''
+    Output    : returns fw_key of the pregen sof of the acds in use, see get_fw_key()
+    '''
+    def _read_fw_key(self):
 
         #Copy sof file to current directory
         cv_logger.info("Getting FW Key from pregen sof, copying sof to current folder")
@@ -676,11 +954,7 @@ class JtagTest(EmptyTest):
           for other devices, oldest key is 0, then 1, 2, ... 30
     '''
     def is_fw_eq_or_newer(self, fw_key, check_key):
-        if (re.search('[Nn][Dd]', self._BASE_DIE) != None):
-            if (fw_key == 0 and check_key == 1) or (fw_key == 1 and check_key == 0): #for ND device, the oldest key is 1
-                return not (fw_key >= check_key)
-
-        return (fw_key >= check_key)
+        return self.get_key_cancellation_index().is_eq_or_newer(fw_key, check_key)
 
     '''
     Mod     : self -- sends EFUSE_WRITE_DISABLE via jtag
@@ -833,50 +1107,52 @@ class JtagTest(EmptyTest):
         flag = flag | (reserve << 16)
         flag = flag | ((num_row << 8) | (row))
 
-        #assume the fuse values were 0 before writing them
-        before_values = [0] * len(values)
-        # if check_before, read user efuse before write
-        if check_before:
-            before_values = self.efuse_read_user_defined_fuses(row=row, num_row=len(values) ,success=True)
-            for fuse in before_values:
-                if fuse != 0:
-                    cv_logger.warning("The fuse is already written!")
-                    break
+        # the reads and the program share one packet service claim
+        with self.packet_session():
+            #assume the fuse values were 0 before writing them
+            before_values = [0] * len(values)
+            # if check_before, read user efuse before write
+            if check_before:
+                before_values = self.efuse_read_user_defined_fuses(row=row, num_row=len(values) ,success=True)
+                for fuse in before_values:
+                    if fuse != 0:
+                        cv_logger.warning("The fuse is already written!")
+                        break
 
-        #update the expectations of values for fuses
-        exp_values = []
-        if success:
-            for i in range(len(values)):
-                exp_values.append( before_values[i] | values[i] )
+            #update the expectations of values for fuses
+            exp_values = []
+            if success:
+                for i in range(len(values)):
+                    exp_values.append( before_values[i] | values[i] )
 
-            if exp_values != values:
-                cv_logger.warning("Since the fuse is already written, the result after your fuse virtual write may be different than your write value")
+                if exp_values != values:
+                    cv_logger.warning("Since the fuse is already written, the result after your fuse virtual write may be different than your write value")
 
-            if skip_same and exp_values == before_values:
-                cv_logger.info("Skipping virtual write because all the fuse we are writing, has already been written.")
-                return
+                if skip_same and exp_values == before_values:
+                    cv_logger.info("Skipping virtual write because all the fuse we are writing, has already been written.")
+                    return
 
-        try:
-            local_respond=[]
-            local_respond = self.jtag_send_sdmcmd(SDM_CMD['EFUSE_USER_DEFINED_FUSES_PROGRAM'], 0x55736572, flag, *values)
+            try:
+                local_respond=[]
+                local_respond = self.jtag_send_sdmcmd(SDM_CMD['EFUSE_USER_DEFINED_FUSES_PROGRAM'], 0x55736572, flag, *values)
 
-        except Exception as e:
-            if success:
-                assert_err(0, "ERROR :: efuse_user_defined_fuses_program command failed")
-            else:
-                cv_logger.info("efuse_user_defined_fuses_program Command failed as EXPECTED")
+            except Exception as e:
+                if success:
+                    assert_err(0, "ERROR :: efuse_user_defined_fuses_program command failed")
+                else:
+                    cv_logger.info("efuse_user_defined_fuses_program Command failed as EXPECTED")
 
-        #if check, get the actual fuse values after writing
-        after_values = [0] * len(values)
-        #read user efuse after write
-        if check_after:
-            after_values = self.efuse_read_user_defined_fuses(row=row, num_row=num_row ,success=True)
-            if success and (after_values != exp_values):
-                cv_logger.error("Expected virtual write to succeed with correct value")
-                assert_err(not ast, "ERROR :: expected values %s, measured values %s" %(exp_values, after_values))
-            if not success and (after_values != before_values):
-                cv_logger.error("Expected virtual write to fail with unchanged fuse")
-                assert_err(not ast, "ERROR :: expected (unchanged) values %s, measured values %s" %(before_values, after_values))
+            #if check, get the actual fuse values after writing
+            after_values = [0] * len(values)
+            #read user efuse after write
+            if check_after:
+                after_values = self.efuse_read_user_defined_fuses(row=row, num_row=num_row ,success=True)
+                if success and (after_values != exp_values):
+                    cv_logger.error("Expected virtual write to succeed with correct value")
+                    assert_err(not ast, "ERROR :: expected values %s, measured values %s" %(exp_values, after_values))
+                if not success and (after_values != before_values):
+                    cv_logger.error("Expected virtual write to fail with unchanged fuse")
+                    assert_err(not ast, "ERROR :: expected (unchanged) values %s, measured values %s" %(before_values, after_values))
 
         cv_logger.info("------------------------Response check here-------------------------------")
         if check_before:
@@ -1467,7 +1743,7 @@ class JtagTest(EmptyTest):
             if cancel: #we cancel psg cancellation fuse
                 exp_row_27 = self.get_cancelled_psg_key()
                 if (self.is_as_device() == True):
-                    if (re.search('[Nn][Dd]', self._BASE_DIE) != None):
+                    if (self.run_profile.nd_die):
                         exp_row_27 = 2 | exp_row_27 #If it is AS/SFE device then key 1 is physically cancelled in ND
                     else:
                         exp_row_27 = 1 | exp_row_27 #If it is AS/SFE device then key 0 is physically cancelled in FM
@@ -2148,7 +2424,7 @@ class JtagTest(EmptyTest):
         security_datatype = SecurityDataTypes('BIT AUTH')
 
         # syscon will see ccert data loss in emulator
-        if os.environ.get('FWVAL_PLATFORM') == "emulator" :
+        if self.run_profile.emulator :
             try :
                 # force syscon to release platform
                 if self.dut.system_console != None :
@@ -2211,7 +2487,7 @@ class JtagTest(EmptyTest):
         security_datatype = SecurityDataTypes('BIT AUTH')
 
         # syscon will see ccert data loss in emulator
-        if os.environ.get('FWVAL_PLATFORM') == "emulator" :
+        if self.run_profile.emulator :
             try :
                 # force syscon to release platform
                 if self.dut.system_console != None :
@@ -2332,7 +2608,7 @@ class JtagTest(EmptyTest):
         security_datatype = SecurityDataTypes('ANTI TAMPER')
 
         # syscon will see ccert data loss in emulator
-        if os.environ.get('FWVAL_PLATFORM') == "emulator" :
+        if self.run_profile.emulator :
 
             try :
                 # force syscon to release platform
@@ -2415,7 +2691,7 @@ class JtagTest(EmptyTest):
         security_datatype = SecurityDataTypes('AES KEY')
 
         # syscon will see ccert data loss in emulator
-        if os.environ.get('FWVAL_PLATFORM') == "emulator" :
+        if self.run_profile.emulator :
             try :
                 return_msg = ""
                 qpgm_cmd = "quartus_pgm -c%d -mJTAG -o\"p;%s\"" % (self.dut.dut_cable, ccert_file)
@@ -2622,6 +2898,7 @@ class JtagTest(EmptyTest):
     Example : self.verify_pin(init_done_en=0)
     Note    : do not set avst_ready_en=1 unless you are using AvstTest
     '''
+    @traced("status")
     def verify_pin(self, nstatus_en=1, init_done_en=0, config_done_en=1, avst_ready_en=0, ast=0, log_error=1, wait_time_out_check=False, index=""):
         cv_logger.info("V%d :: Verify Pin" %(self._verify_counter))
         self._verify_counter = self._verify_counter + 1
@@ -2650,83 +2927,34 @@ class JtagTest(EmptyTest):
                     config_done_en = 0
 
         #check the enabled pins
-        if(nstatus_en):
-            nstatus_output  = self.nstatus.get_output()
-            if((wait_time_out_check)):
-                counter = 0
-                while((nstatus_output != self.exp_pin['NSTATUS']) and (counter <= self.DUT_FILTER.time_out_pin)):
-                    nstatus_output  = self.nstatus.get_output()
-                    fwval.delay(5)
-                    counter = counter + 5
-                if(counter <= self.DUT_FILTER.time_out_pin):
-                    cv_logger.info("Time took for  nSTATUS=%d  is = %dms" %(self.exp_pin['NSTATUS'],counter))
-                else:
-                    cv_logger.debug("Time out waiting for nSTATUS=%d after %dms" %(self.exp_pin['NSTATUS'],counter))
-
-            cv_logger.info("NSTATUS = %d" % nstatus_output)
-            if nstatus_output != self.exp_pin['NSTATUS']:
-                local_pass = False
-                err_msgs.append("ERROR :: Expected NSTATUS: %d, Measured NSTATUS: %d" %(self.exp_pin['NSTATUS'], nstatus_output))
-            else :
-                cv_logger.info("Measured NSTATUS: %d matched expectation" % nstatus_output)
-
-        if(init_done_en):
-            init_done_output  = self.init_done.get_output()
-            if((wait_time_out_check)):
-                counter = 0
-                while((init_done_output != self.exp_pin['INIT_DONE']) and (counter <= self.DUT_FILTER.time_out_pin)):
-                    init_done_output  = self.init_done.get_output()
-                    fwval.delay(5)
-                    counter = counter + 5
-                if(counter <= self.DUT_FILTER.time_out_pin):
-                    cv_logger.info("Time took for  INIT_DONE=%d  is = %dms" %(self.exp_pin['INIT_DONE'],counter))
-                else:
-                    cv_logger.debug("Time out waiting for INIT_DON=%d  after %dms" %(self.exp_pin['INIT_DONE'],counter))
-
-            cv_logger.info("INIT_DONE = %d" % init_done_output)
-            if init_done_output != self.exp_pin['INIT_DONE']:
-                local_pass = False
-                err_msgs.append("ERROR :: Expected INIT_DONE: %d, Measured INIT_DONE: %d" %(self.exp_pin['INIT_DONE'], init_done_output))
-            else :
-                cv_logger.info("Measured INIT_DONE: %d matched expectation" % init_done_output)
-        if(config_done_en):
-            config_done_output  = self.config_done.get_output()
-            if((wait_time_out_check)):
-                counter = 0
-                while((config_done_output != self.exp_pin['CONFIG_DONE']) and (counter <= self.DUT_FILTER.time_out_pin)):
-                    config_done_output  = self.config_done.get_output()
-                    fwval.delay(5)
-                    counter = counter + 5
-                if(counter <= self.DUT_FILTER.time_out_pin):
-                    cv_logger.info("Time took for  CONFIG_DONE=%d is = %dms" %(self.exp_pin['CONFIG_DONE'],counter))
+        pins = [(name, connector) for name, connector, enabled in [
+                    ("NSTATUS", "nstatus", nstatus_en), ("INIT_DONE", "init_done", init_done_en),
+                    ("CONFIG_DONE", "config_done", config_done_en), ("AVST_READY", "avst_ready", avst_ready_en)] if enabled]
+        if(wait_time_out_check):
+            # all the pins are watched together, see fwval_lib.configuration.pinwait
+            # nSTATUS falling low again after it was high is the only early error, the other pins (and
+            # nSTATUS still low from nCONFIG release or power cycle) get the full timeout
+            error_values = {"NSTATUS": 0} if self.exp_pin["NSTATUS"] == 1 else {}
+            result = wait_pins(dict((name, (getattr(self, connector).get_output, self.exp_pin[name])) for name, connector in pins),
+                self.DUT_FILTER.time_out_pin, self.get_pin_settle_stats(), error_values)
+            outputs = result.values
+            for name, _ in pins:
+                if result.settle_ms[name] != None:
+                    cv_logger.info("Time took for  %s=%d  is = %dms" %(name, self.exp_pin[name], result.settle_ms[name]))
+                elif name == result.error_pin:
+                    cv_logger.debug("%s settled at %d instead of %d after %dms" %(name, outputs[name], self.exp_pin[name], result.elapsed_ms))
                 else:
-                    cv_logger.debug("Time out waiting for CONFIG_DONE=%d  after %dms" %(self.exp_pin['CONFIG_DONE'],counter))
-
-            cv_logger.info("CONFIG_DONE = %d" % config_done_output)
-            if config_done_output != self.exp_pin['CONFIG_DONE']:
-                local_pass = False
-                err_msgs.append("ERROR :: Expected CONFIG_DONE: %d, Measured CONFIG_DONE: %d" %(self.exp_pin['CONFIG_DONE'], config_done_output))
-            else :
-                cv_logger.info("Measured CONFIG_DONE: %d matched expectation" % config_done_output)
-        if(avst_ready_en):
-            avst_ready_output  = self.avst_ready.get_output()
-            if((wait_time_out_check)):
-                counter = 0
-                while((avst_ready_output != self.exp_pin['AVST_READY']) and (counter <= self.DUT_FILTER.time_out_pin)):
-                    avst_ready_output  = self.avst_ready.get_output()
-                    fwval.delay(5)
-                    counter = counter + 5
-                if(counter <= self.DUT_FILTER.time_out_pin):
-                    cv_logger.info("Time took for  AVST_READY=%d is = %dms" %(self.exp_pin['AVST_READY'],counter))
-                else:
-                    cv_logger.debug("Time out waiting for AVST_READY =%d after %dms" %(self.exp_pin['AVST_READY'],counter))
+                    cv_logger.debug("Time out waiting for %s=%d after %dms" %(name, self.exp_pin[name], result.elapsed_ms))
+        else:
+            outputs = dict((name, getattr(self, connector).get_output()) for name, connector in pins)
 
-            cv_logger.info("AVST_READY = %d" % avst_ready_output)
-            if avst_ready_output != self.exp_pin['AVST_READY']:
+        for name, _ in pins:
+            cv_logger.info("%s = %d" % (name, outputs[name]))
+            if outputs[name] != self.exp_pin[name]:
                 local_pass = False
-                err_msgs.append("ERROR :: Expected AVST_READY: %d, Measured AVST_READY: %d" %(self.exp_pin['AVST_READY'], avst_ready_output))
+                err_msgs.append("ERROR :: Expected %s: %d, Measured %s: %d" %(name, self.exp_pin[name], name, outputs[name]))
             else :
-                cv_logger.info("Measured AVST_READY: %d matched expectation" % avst_ready_output)
+                cv_logger.info("Measured %s: %d matched expectation" % (name, outputs[name]))
 
         #print the pins with unexpected values
         if err_msgs:
@@ -2742,6 +2970,15 @@ class JtagTest(EmptyTest):
             cv_logger.info("Pin result same as expectation")
         return local_pass
 
+    '''
+    Output  : returns the PinSettleStats (fwval_lib.configuration.pinwait) of this test, the time every pin
+              took to settle in verify_pin(wait_time_out_check=True)
+    '''
+    def get_pin_settle_stats(self) :
+        if not hasattr(self, "_pin_settle_stats") :
+            self._pin_settle_stats = PinSettleStats()
+        return self._pin_settle_stats
+
     def get_raw_prov_data(self) :
         '''
         Input   : None
@@ -2755,6 +2992,7 @@ class JtagTest(EmptyTest):
         cv_logger.info(local_respond)
         return local_respond
 
+    @traced("status")
     def verify_prov_status(self, ast=0) :
         '''
         Input   : None
@@ -3169,6 +3407,7 @@ class JtagTest(EmptyTest):
               Prints mismatching fields
     Note    : Checks all the status fields except 'ERROR_LOCATION', 'ERROR_DETAILS' (last 2)
     '''
+    @traced("status")
     def verify_status(self, cmf_state=2, pr=False, ast=0, fpga=False, pr_bad=False, skip_ver=0):
         # if ND5 RevA and IDLE state
         if ((re.search('[Nn][Dd]5', self._BASE_DIE) != None) and (re.search('[aA]', self._REV) != None) and (self.exp_status['NCONFIG'] == 0) and (self.exp_status['NSTATUS'] == 0)):
@@ -3229,7 +3468,7 @@ class JtagTest(EmptyTest):
         if (cmf_state == 0):
             #Added by SatyaS to Handle FMx Bootrom processing which returns 4 Words response
             #First Word <> length of data followed; Second <> Bootrom Version, Third <> Bootrom State and Fourth <> Bootrom MSEL, nCONFIG, nSTATUS etc latching
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
+            if(self.run_profile.agilex_like):
                 assert_err(local_lst_length == 4, "ERROR :: Expected device at Bootrom stage.\nCONFIG_STATUS should return 4 elements, but received %d" %local_lst_length)
                 local_extract = int(local_respond[3])
                 nstatus = (local_extract >> 31) & 0x00000001
@@ -3269,8 +3508,8 @@ class JtagTest(EmptyTest):
             assert_err(((local_lst_length-1) == local_number_element), "ERROR :: Expected device in CMF stage.\nExpected Length as per header = %d, but receieved length = %d" %(local_number_element, (local_lst_length-1)))
 
             # Define current acds version & build
-            acds_version = os.environ["ACDS_VERSION"]
-            acds_build = float(os.environ["ACDS_BUILD_NUMBER"])
+            acds_version = self.run_profile.acds_version
+            acds_build = self.run_profile.acds_build
 
             # Define the affected version and build
             self.expected_acds = { "21.4.1" : 99,
@@ -3370,7 +3609,7 @@ class JtagTest(EmptyTest):
                     local_pass = False
 
             # Bypass VERSION checking if it is Simics until the fwval_lib is ready for FW latest version feature
-            if os.environ.get("PYCV_PLATFORM") != "simics" :
+            if not self.run_profile.simics :
                 if(config_status['VERSION'] != self.exp_status['VERSION'] and not skip_ver):
                     err_msgs.append("ERROR :: VERSION value mismatched Measured = 0x%x and Expected = 0x%x" %(config_status['VERSION'], self.exp_status['VERSION']))
                     local_pass = False
@@ -3402,15 +3641,16 @@ class JtagTest(EmptyTest):
                 err_msgs.append("ERROR :: CVP_DONE value mismatched Measured = 0x%x and Expected = 0x%x" %(config_status['CVP_DONE'], self.exp_status['CVP_DONE']))
                 local_pass = False
 
-            if os.environ.get("PYCV_PLATFORM") != "simics" :
+            if not self.run_profile.simics :
                 if(config_status['SEU_ERROR'] != self.exp_status['SEU_ERROR']):
                     err_msgs.append("ERROR :: SEU_ERROR value mismatched Measured = 0x%x and Expected = 0x%x" %(config_status['SEU_ERROR'], self.exp_status['SEU_ERROR']))
-                    for count in range (0,10):
-                        cv_logger.info("***************************************************")
-                        cv_logger.info("Read SEU ERROR counter: %d" %(count))
-                        local_respond = self.jtag_send_sdmcmd(SDM_CMD['READ_SEU_ERROR'])
-                        cv_logger.info("Read SEU ERROR :: Response %s" %str(local_respond))
-                        cv_logger.info("***************************************************")
+                    with self.packet_session():
+                        for count in range (0,10):
+                            cv_logger.info("***************************************************")
+                            cv_logger.info("Read SEU ERROR counter: %d" %(count))
+                            local_respond = self.jtag_send_sdmcmd(SDM_CMD['READ_SEU_ERROR'])
+                            cv_logger.info("Read SEU ERROR :: Response %s" %str(local_respond))
+                            cv_logger.info("***************************************************")
                     local_pass = False
 
             if(config_status['POR_WAIT'] != self.exp_status['POR_WAIT']):
@@ -3442,7 +3682,7 @@ class JtagTest(EmptyTest):
         else:
             cv_logger.info("(RE)CONFIG_STATUS result same as expectation")
 
-        if os.environ.get('FWVAL_PLATFORM') == "emulator" :
+        if self.run_profile.emulator :
             cv_logger.info("Wait 100s")
             delay(100000)
 
@@ -3773,33 +4013,66 @@ class JtagTest(EmptyTest):
 
     '''
     Input   : file_path -- path for the bitstream file (usually rbf file)
-    Output  : returns the file as a byte array
+    Optional: use_mmap -- True to return a Bitstream instead of a byte array copy, backed by the
+                          cached contents or else a memory map of the file, corruptions on it are
+                          kept in a copy-on-write overlay
+              bit_reversed -- with use_mmap, True to read the file bit reversed (rpd)
+    Output  : returns the file as a byte array (or Bitstream if use_mmap)
     Exception: Throws IOError if file not found, or file is empty
+    Note    : the file is read through get_bitstream_cache() (kept only with FWVAL_BITSTREAM_CACHE=1),
+              the byte array is a private copy
     '''
-    def read_bitstream(self, file_path):
+    def read_bitstream(self, file_path, use_mmap=False, bit_reversed=False):
         cv_logger.info("Reading Bitstream")
-        with open(file_path, "rb") as file:
-            if(not file):
-                print_err("ERROR :: Failed to Open the file %s" %file)
-                raise IOError
-            else:
-                cv_logger.info("Opening file ==> %s successfully to read the bitstream content" %file_path )
+        cache = self.get_bitstream_cache()
+        if use_mmap:
+            cached = cache.get(file_path)
+            if cached:
+                cv_logger.info("Using cached content of file ==> %s" %file_path )
+                return Bitstream(cached, file_path=file_path, bit_reversed=bit_reversed)
+            try:
+                bitstream_buffer = Bitstream.open(file_path, bit_reversed=bit_reversed)
+            except IOError as e:
+                print_err("ERROR :: %s" %e)
+                raise
+            cv_logger.info("Mapped file ==> %s to read the bitstream content" %file_path )
+            return bitstream_buffer
 
-            bitstream_buffer        = bytearray(file.read())
-            bitstream_buffer_size   = len(bitstream_buffer)
-            if(bitstream_buffer_size == 0):
-                print_err("ERROR :: Source File %s size is empty" %file_path)
-                raise IOError
+        try:
+            bitstream_buffer = bytearray(cache.read(file_path))
+        except (IOError, OSError) as e:
+            print_err("ERROR :: Failed to Open the file %s: %s" %(file_path, e))
+            raise IOError(str(e))
+        cv_logger.info("Read file ==> %s successfully to read the bitstream content" %file_path )
+        if(len(bitstream_buffer) == 0):
+            print_err("ERROR :: Source File %s size is empty" %file_path)
+            raise IOError
 
         return bitstream_buffer
 
     '''
-    Input   :   bitstream -- bytearray of the bitstream
+    Output  : returns the BitstreamCache (fwval_lib.configuration.bitstreamcache) of this test,
+              every bitstream read of the test goes through it, files are only kept if it is enabled
+    '''
+    def get_bitstream_cache(self) :
+        if not hasattr(self, "_bitstream_cache") :
+            self._bitstream_cache = BitstreamCache()
+        return self._bitstream_cache
+
+    '''
+    Input   :   bitstream -- bytearray (or Bitstream) of the bitstream
                 file_path -- the bitstream filename generated by the bitstream(usually rbf file)
     Exception: Throws IOError if file not found, or file is empty
     '''
     def write_bitstream_to_file(self, bitstream=None, start=0, end=None, file_path=None):
-        cv_logger.info("Writing Bitstream from %d to %d to File %s"%(start, end, file_path))
+        cv_logger.info("Writing Bitstream from %d to %s to File %s"%(start, end, file_path))
+        if isinstance(bitstream, Bitstream):
+            if(len(bitstream) == 0):
+                print_err("ERROR :: Bitstream bytearray size is empty")
+                raise IOError
+            bitstream.write_to_file(file_path, start, end)
+            return
+
         file = open(file_path, "wb")
         if(not file):
             print_err("ERROR :: Failed to Open the file %s to write" %file)
@@ -3857,12 +4130,13 @@ class JtagTest(EmptyTest):
     '''
     Modify  : self, sends CONFIG_JTAG command
     '''
+    @traced("send")
     def config_jtag(self, success=1):
         cv_logger.info("")
         local_respond = [None]
         try:
             timeout = 60
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+            if(self.run_profile.emulator):
                 timeout = 5000
             local_respond = self.jtag.packet_send_cmd(32, SDM_CMD['CONFIG_JTAG'], timeout=timeout)
 
@@ -3895,6 +4169,7 @@ class JtagTest(EmptyTest):
     Modify  : self, sends RECONFIG command via JTAG
     Note    : this command is not for full reconfiguration, it is for PR!
     '''
+    @traced("send")
     def reconfig_jtag(self):
         cv_logger.info("")
         try:
@@ -3919,21 +4194,21 @@ class JtagTest(EmptyTest):
     Modify  : self, sends SDM command via JTAG
     Note    : this command is to switch RSU image
     '''
+    @traced("send")
     def jtag_send_sdmcmd(self, sdm_cmd, *arg):
         input_length = len(arg)
         input_id = 0 #does not matter
         input_client = 0 #zero for jtag
         input_cmd = sdm_cmd
         header = input_cmd | (input_length << 12) | (input_id << 24) | (input_client << 28)
-        timeout = 60
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
-            timeout = 240
+        timeout = self.transfer_timeout("jtag", "sdmcmd_0x%x" % sdm_cmd, None, self.run_profile.sdmcmd_timeout)
         cv_logger.info("===jtag_send_sdmcmd command===")
         cv_logger.info("header: [" + str(hex(header)) + "]")
         cv_logger.info("body  : " + '[{}]'.format(' '.join(hex(x) for x in arg)))
         cv_logger.info("===jtag_send_sdmcmd command===")
-        resp = self.jtag.packet_send_cmd(32, header, *arg, timeout=timeout)
-        self.jtag.unclaim_services(service="packet")
+        with self.measured_transfer("jtag", "sdmcmd_0x%x" % sdm_cmd):
+            resp = self.jtag.packet_send_cmd(32, header, *arg, timeout=timeout)
+        self.jtag_unclaim_packet()
         cv_logger.info("===jtag_send_sdmcmd response===")
         if isinstance(resp, list):
             cv_logger.info("response: " + '[{}]'.format(' '.join(hex(x) for x in resp)))
@@ -3946,21 +4221,85 @@ class JtagTest(EmptyTest):
     Modify  : self, sends SDM command via JTAG
     Note    : this command is send sdm cmd and check fw with noop and sync
     '''
+    @traced("send")
     def jtag_send_sdmcmd_noop(self, sdm_cmd, *arg):
         input_length = len(arg)
         input_id = 0 #does not matter
         input_client = 0 #zero for jtag
         input_cmd = sdm_cmd
         header = input_cmd | (input_length << 12) | (input_id << 24) | (input_client << 28)
-        timeout = 60
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
-            timeout = 240
-        resp = self.jtag.packet_send_cmd(32, header, *arg, timeout=timeout)
+        timeout = self.transfer_timeout("jtag", "sdmcmd_0x%x" % sdm_cmd, None, self.run_profile.sdmcmd_timeout)
+        with self.measured_transfer("jtag", "sdmcmd_0x%x" % sdm_cmd):
+            resp = self.jtag.packet_send_cmd(32, header, *arg, timeout=timeout)
         self.jtag_send_noop()
         self.jtag_send_sync()
-        self.jtag.unclaim_services(service="packet")
+        self.jtag_unclaim_packet()
         return resp
 
+    '''
+    Modify  : self, unclaims the JTAG packet service, unless a packet_session() keeps it claimed
+    '''
+    def jtag_unclaim_packet(self):
+        if not getattr(self, "_packet_session_depth", 0):
+            self.jtag.unclaim_services(service="packet")
+
+    '''
+    Modify  : self, keeps the JTAG packet service claimed for the whole with block, the SDM commands
+              sent inside it do not claim/unclaim the service one by one
+    Note    : sessions nest, the service is unclaimed when the outermost one exits
+    Example : with self.packet_session():
+                  for row in range(8): self.efuse_read(bank=0, row=row, num_row=1)
+    '''
+    @contextlib.contextmanager
+    def packet_session(self):
+        self._packet_session_depth = getattr(self, "_packet_session_depth", 0) + 1
+        try:
+            yield self
+        finally:
+            self._packet_session_depth -= 1
+            self.jtag_unclaim_packet()
+
+    '''
+    Input   : commands -- list of SDM commands, each a command code or a tuple (command code, arg, ...)
+    Output  : returns the list of responses, in command order
+    Note    : all commands are sent in one packet_session(), eg.
+              [config_status, rsu_status] = self.jtag_send_sdmcmd_batch([SDM_CMD['CONFIG_STATUS'], SDM_CMD['RSU_STATUS']])
+    '''
+    @traced("send")
+    def jtag_send_sdmcmd_batch(self, commands):
+        responses = []
+        start = time.time()
+        with self.packet_session():
+            for command in commands:
+                if not isinstance(command, (list, tuple)):
+                    command = (command,)
+                responses.append(self.jtag_send_sdmcmd(*command))
+        if commands:
+            elapsed = time.time() - start
+            cv_logger.info("Sent %d SDM commands in %.1f ms (%.1f ms per command)" %
+                (len(commands), elapsed * 1e3, elapsed * 1e3 / len(commands)))
+        return responses
+
+    '''
+    Optional: count -- number of commands sent each way
+              sdm_cmd -- command to send, NOOP by default
+    Output  : returns (ms per command claiming the packet service per command, ms per command in a packet_session())
+    Note    : reports what packet_session()/jtag_send_sdmcmd_batch() save on this board
+    '''
+    def measure_sdmcmd_latency(self, count=16, sdm_cmd=None):
+        if sdm_cmd == None:
+            sdm_cmd = SDM_CMD['NOOP']
+        start = time.time()
+        for _ in range(count):
+            self.jtag_send_sdmcmd(sdm_cmd)
+        unclaimed = (time.time() - start) * 1e3 / count
+        start = time.time()
+        self.jtag_send_sdmcmd_batch([sdm_cmd] * count)
+        session = (time.time() - start) * 1e3 / count
+        cv_logger.info("SDM command latency: %.1f ms claiming the packet service per command, %.1f ms in a session (%.1fx)" %
+            (unclaimed, session, unclaimed / max(session, 1e-6)))
+        return unclaimed, session
+
     '''
     Modify  : self, sends the certificate via jtag
               This command will not process the certificate status. It will check the error code of the sdm cmd only.
@@ -3972,6 +4311,7 @@ class JtagTest(EmptyTest):
               success -- Checks if the command is successful or not, True if the command should respond with no error code, False if command should respond with error code
     Output  : local_respond -- the respond packet of the sdm command
     '''
+    @traced("send")
     def jtag_send_certificate(self, cert_data, test_program = 1, reserve=0, success=True, skip_check=False, ast=1):
         cv_logger.info("CERTIFICATE")
         flag = 0
@@ -4083,12 +4423,10 @@ class JtagTest(EmptyTest):
         input_client = 0xF #This command is the only command sent through client 0xF so clients can use it as part of discarding unwanted responses from within the data stream.
         input_cmd = SDM_CMD['SYNC']
         header = input_cmd | (input_length << 12) | (input_id << 24) | (input_client << 28)
-        timeout = 60
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
-            timeout = 240
+        timeout = self.run_profile.sdmcmd_timeout
         try:
             local_respond = self.jtag.packet_send_cmd(32, header, *arg, timeout=timeout)
-            self.jtag.unclaim_services(service="packet")
+            self.jtag_unclaim_packet()
             cv_logger.info("Send SYNC :: Response %s (%s)" % (str(local_respond), get_hex(local_respond)))
         except:
             assert_err(0, "ERROR :: SYNC command failed")
@@ -4165,6 +4503,7 @@ class JtagTest(EmptyTest):
     Modify  : self, sends RSU_SWITCH_IMAGE command via JTAG
     Note    : this command is to switch RSU image
     '''
+    @traced("send")
     def rsu_switch_image(self, address):
         cv_logger.info("Update RSU to 0x%x "%address)
         address_high = (address >> 32) & 0xffffffff
@@ -4212,19 +4551,103 @@ class JtagTest(EmptyTest):
 
         return temp_32bit_2complement_8bitdec
 
+    '''
+    Input   : exp_err -- expected error message of a configuration expected to fail
+    Output  : returns True if the transfer can be aborted as soon as the device rejects the bitstream, ie.
+              exp_err is the error of a transfer running into its timeout, opt-in with FWVAL_EARLY_ABORT=1
+    '''
+    def early_abort_enabled(self, exp_err):
+        if exp_err == None or not self.run_profile.early_abort:
+            return False
+        return re.search(exp_err, STALLED_TRANSFER_ERROR) != None
+
+    '''
+    Output  : returns the rejectwatch probe of nSTATUS going low, None if it is not high before the transfer
+    '''
+    def nstatus_rejection_probe(self):
+        if getattr(self, "nstatus", None) != None and self.nstatus.get_output() == 1:
+            return lambda: "nSTATUS low" if self.nstatus.get_output() == 0 else None
+        return None
+
+    '''
+    Input   : size -- bytes to send
+    Optional: nstatus_probe -- see nstatus_rejection_probe()
+    Output  : returns the rejectwatch probes of a JTAG transfer: nSTATUS going low (if high before the transfer)
+              and the transfer running much longer than a successful one of the same size
+    '''
+    def jtag_rejection_probes(self, size, nstatus_probe=None):
+        probes = [nstatus_probe] if nstatus_probe != None else []
+        expected = self.get_timeout_model().estimate("jtag", "send", size)
+        if expected != None:
+            probes.append(stall_probe(expected))
+        return probes
+
+    '''
+    Modify  : self, closes the JTAG connector, so the transfer using it returns
+    Note    : pycv has no API to cancel a transfer in progress, this closes the connector under the
+              transfer thread and drops it from the private dut.connectors, the same way verify_design()
+              closes it. It depends on pycv internals (the transfer may raise any error or hang), so the
+              early abort is opt-in (FWVAL_EARLY_ABORT=1). The connector is only reopened once the
+              transfer returned, see send_jtag_watched()
+    '''
+    def abort_jtag_transfer(self):
+        cv_logger.info("Closing the JTAG connector to abort the transfer")
+        self.dut.connectors["jtag"].close()
+        self.dut.connectors.pop("jtag")
+        self.jtag = None
+
+    '''
+    Input   : file_path -- path for the bitstream file, expected to be rejected
+              timeout -- timeout for sending bistream
+    Optional: use_pgm -- see send_jtag()
+    Modify  : self, sends the bitstream via JTAG, aborting as soon as the device rejected it and reopening
+              the JTAG connector once the transfer returned
+    Note    : raises BitstreamRejected when aborted, its error holds what the device reported once the transfer
+              stopped (CONFIG_STATUS error fields, nSTATUS low) and the last error of the framework.
+              A transfer not returning after the abort fails the test, the connector is not reused then.
+    '''
+    def send_jtag_watched(self, file_path, timeout, use_pgm=False):
+        if self.run_profile.emulator:
+            send = lambda: self.jtag.send_data_file(file_path, timeout=timeout)
+        else:
+            send = lambda: self.jtag.send_data_file(file_path, timeout=timeout, use_pgm=use_pgm)
+        nstatus_probe = self.nstatus_rejection_probe()
+        try:
+            result = run_watched(send, self.jtag_rejection_probes(os.path.getsize(file_path), nstatus_probe),
+                self.abort_jtag_transfer)
+        except TransferNotStopped as e:
+            assert_err(0, "ERROR :: %s, JTAG connector left closed" % e)
+            raise
+        if result.rejection:
+            last_error = self.dut.get_last_error()
+            self.jtag = self.dut.get_connector("jtag",self._DEVICE_IDX)
+            assert_err(self.jtag != None, "ERROR :: Cannot reopen the JTAG Connector")
+            evidence = probe_reasons([self.config_status_rejection] + ([nstatus_probe] if nstatus_probe != None else []))
+            rejection = BitstreamRejected(result.rejection.reason, result.rejection.elapsed, evidence, last_error)
+            cv_logger.info("Transfer aborted after %.1fs instead of waiting up to %ds: %s" %
+                (result.elapsed, timeout, rejection.message))
+            raise rejection
+        if result.error != None:
+            raise result.error
+
     '''
     Require : config_jtag should be called beforehand
     Input   : file_path -- path for the bitstream file (usually rbf file)
     Optional: success -- 1 if sending should success, 0 otherwise
               exp_err -- expected error message from framework if success = 0
                          if the acquired error message contains exp_err, then it is handled
+                         if it is the error of a transfer timeout, the transfer is aborted as soon as the
+                         device rejects the bitstream, see send_jtag_watched()
               timeout -- timeout for sending bistream. default 60s
     Modify  : self, sends the bitstream via JTAG
     '''
+    @traced("send")
     def send_jtag(self, file_path, success=1, exp_err=None, timeout=60, use_pgm=False, skip_extract=0):
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
-            timeout = (4800 if success else 2000)
+        if(self.run_profile.emulator):
+            timeout = self.run_profile.send_timeout(timeout, success)
             cv_logger.info("Auto change timeout %ss" % (timeout))
+        size = os.path.getsize(file_path)
+        timeout = self.transfer_timeout("jtag", "send", size, timeout)
         if ((success == 1) and (skip_extract==0)):
             conf_done = extract_pin_table(file_path=file_path, pin_name="CONF_DONE")
             if conf_done != None :
@@ -4232,28 +4655,32 @@ class JtagTest(EmptyTest):
                 self._CONFIG_DONE = conf_done
         cv_logger.info("C%d :: Sending Bitstream Via JTAG" %(self._config_counter))
         self._config_counter = self._config_counter + 1
+        watched = (success == 0) and self.early_abort_enabled(exp_err)
         try:
-            if (os.environ.get("FWVAL_PLATFORM") == 'emulator'):
-                file = open(file_path, "rb")
-                if(not file):
-                    print_err("ERROR :: Failed to Open the file %s" %file)
-                    raise IOError
+            if (self.run_profile.emulator):
+                bitstream_buffer = bytearray(self.get_bitstream_cache().read(file_path))
+                cv_logger.info("Read file ==> %s successfully to read the bitstream content" %file_path )
+                bitstream_buffer_size = len(bitstream_buffer)
+                if watched:
+                    self.send_jtag_watched(file_path, timeout)
+                elif((bitstream_buffer_size == 0) or (success == 0)):
+                    self.jtag.send_data_file(file_path, timeout=timeout)
                 else:
-                    cv_logger.info("Opening file ==> %s successfully to read the bitstream content" %file_path )
-                    bitstream_buffer = bytearray(file.read())
-                    bitstream_buffer_size = len(bitstream_buffer)
-                    if((bitstream_buffer_size == 0) or (success == 0)):
-                        self.jtag.send_data_file(file_path, timeout=timeout)
-                    else:
+                    with self.measured_transfer("jtag", "send", bitstream_buffer_size):
                         self.jtag.send_data(bitstream_buffer, timeout=timeout)
 
-                    wait_time = 130
-                    cv_logger.info("Wait for %ds" % wait_time)
-                    delay(wait_time*1000)
+                wait_time = 130
+                cv_logger.info("Wait up to %ds for the configuration" % wait_time)
+                self.wait_for_config_settled(wait_time*1000, config_done=1 if success else None)
+            elif watched:
+                self.send_jtag_watched(file_path, timeout, use_pgm=use_pgm)
+            elif success:
+                with self.measured_transfer("jtag", "send", size):
+                    self.jtag.send_data_file(file_path, timeout=timeout, use_pgm=use_pgm)
             else:
                 self.jtag.send_data_file(file_path, timeout=timeout, use_pgm=use_pgm)
         except Exception as e:
-            local_respond = self.dut.get_last_error()
+            local_respond = e.error if isinstance(e, BitstreamRejected) else self.dut.get_last_error()
             cv_logger.error("EXCEPTION ::%s" %local_respond)
             if success:
                 print_err("ERROR :: Failed to load bitstream UNEXPECTEDLY")
@@ -4263,7 +4690,7 @@ class JtagTest(EmptyTest):
                 if(re.search(exp_err, local_respond)):
                     cv_logger.info("Failed to load the bitstream as EXPECTED")
                 else:
-                    if os.environ.get("PYCV_PLATFORM") == 'simics' :
+                    if self.run_profile.simics :
                         # For now it is ok to allow different Error (as long as it is still an error)
                         # Simics is not SysCon anyway, will unify the error after this
                         print("Simics Warning :: Expected error is \"%s\", but found \"%s\"" % (exp_err, local_respond))
@@ -4287,8 +4714,9 @@ class JtagTest(EmptyTest):
               timeout -- timeout for sending bistream. default 60s
     Modify  : self, sends the bitstream via JTAG
     '''
+    @traced("send")
     def send_pr_jtag_bad(self, file_path, exp_err=None, timeout=60):
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        if(self.run_profile.emulator):
             timeout = timeout * 300
         cv_logger.info("C%d :: Sending Bitstream Via JTAG" %(self._config_counter))
         self._config_counter = self._config_counter + 1
@@ -4301,7 +4729,7 @@ class JtagTest(EmptyTest):
             if(re.search(exp_err, local_respond)):
                 cv_logger.info("Failed to load the PR bitstream as EXPECTED")
             else:
-                if os.environ.get("PYCV_PLATFORM") == 'simics' :
+                if self.run_profile.simics :
                     # For now it is ok to allow different Error (as long as it is still an error)
                     # Simics is not SysCon anyway, will unify the error after this
                     print("Simics Warning :: Expected error is \"%s\", but found \"%s\"" % (exp_err, local_respond))
@@ -4343,6 +4771,7 @@ class JtagTest(EmptyTest):
     Output  : a list of True and False for pin and status checks
     Note    : nconfig and nstatus are constant throughout this method
     '''
+    @traced("config")
     def complete_jtag_config(self, file_path, before_cmf_state, timeout=60, skip=0, skip_after=0,skip_ver=0, failed_cmf_state=1, success=1, failed_state=1, retain=0, ast=0, exp_err=None,index="",send_efuse_write_disable=1, use_pgm=False, skip_extract=0, send_noop_sync=True, skip_ewd=0, test_mode=None):
         cv_logger.info("Run jtag configuration with %s" %file_path)
         local_success = []
@@ -4401,7 +4830,7 @@ class JtagTest(EmptyTest):
                 cv_logger.info("Send EFUSE_WRITE_DISABLE command again after reconfiguration to make sure it is SET")
                 self.efuse_write_disable(skip_program=False,test_mode=test_mode)
 
-        if os.environ.get('FWVAL_PLATFORM') == "emulator" :
+        if self.run_profile.emulator :
             wait_time = 130
             cv_logger.info("Wait for %ds" % wait_time)
             delay(wait_time*1000)
@@ -4426,6 +4855,7 @@ class JtagTest(EmptyTest):
     Output  : a list of True and False for pin and status checks
     Note    : nconfig and nstatus are constant throughout this method
     '''
+    @traced("config")
     def pr_jtag_config(self, file_path, success=1, timeout=60, ast=0, exp_err=None, cancel=0,index="", send_efuse_write_disable=1):
         cv_logger.info("Run partial configuration thru jtag with %s" %file_path)
         local_success = []
@@ -4485,6 +4915,7 @@ class JtagTest(EmptyTest):
 
         return local_success
 
+    @traced("config")
     def pr_jtag_fail(self, file_path, success=0, skip=0, timeout=60, ast=0, exp_err=None,index="", send_efuse_write_disable=1):
         cv_logger.info("Run partial configuration thru jtag with %s" %file_path)
         local_success = []
@@ -4695,7 +5126,7 @@ class JtagTest(EmptyTest):
               /p/psg/swip/w/checlim/tools/fw-tools/convert_nios_tr.sh cmf_main.elf sdm_nios.tr sdm_nios_tr_cmf.txt
     '''
     def dump_trace(self):
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        if(self.run_profile.emulator):
             signal_emulator_dump_trace()
 
     '''
@@ -4705,7 +5136,7 @@ class JtagTest(EmptyTest):
     Output  : gtrace printout on stdout
     '''
     def get_gtrace_dump(self):
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        if(self.run_profile.emulator):
             emu_command_get_gtrace()
 
     '''
@@ -4713,14 +5144,15 @@ class JtagTest(EmptyTest):
                the programmed device has the correct design
                dut_closed -- True if dut is closed, False otherwise
     '''
+    @traced("design")
     def verify_design(self, design_name, dut_closed=True):
 
         '-------------------------ADDING LOGIC TO SWITCH BETWEEN EMULATOR OR REAL SILICON VERIFICATION------------------'
-        if os.environ.get("PYCV_PLATFORM") == 'simics' :
+        if self.run_profile.simics :
 
             cv_logger.warning("Simics skip verifying design ...")
 
-        elif(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        elif(self.run_profile.emulator):
 
             self.emu_CRAMERAM_DUMP(design_name)
 
@@ -4854,6 +5286,7 @@ class JtagTest(EmptyTest):
     Input    : syscon -- system console script to run
                syscon_arg -- argument to run with system console
     '''
+    @traced("design")
     def verify_design_syscon(self, syscon, syscon_arg, ast=0, success=1, exp_err=None,dut_closed=False,sof_path=None):
         cv_logger.info("Verify Design with system-console using %s, run with %s %s" %(syscon, syscon_arg, sof_path))
         local_pass = True
@@ -4963,15 +5396,16 @@ class JtagTest(EmptyTest):
                the programmed device has the correct design
                ast      -- default 1 to assert error when failed, else will return failure without assertion
     '''
+    @traced("design")
     def verify_design_andor(self, design_name, ast=1, issp_tag="issp", issp_index=0, skip_crameram_dump=0): # GEN: + skip_cameraram_dump =0
 
         '-------------------------ADDING LOGIC TO SWITCH BETWEEN EMULATOR OR REAL SILICON VERIFICATION------------------'
-        if os.environ.get("PYCV_PLATFORM") == 'simics' :
+        if self.run_profile.simics :
 
             # Maybe support Simics CRAM/ERAM dump in the future
             return True
 
-        elif (os.environ.get("FWVAL_PLATFORM") == 'emulator') :
+        elif (self.run_profile.emulator) :
             dut_rev = os.environ['DUT_REV']
             return True
 
@@ -4982,9 +5416,9 @@ class JtagTest(EmptyTest):
 
         else: # Satya: Suggestion to take latest changes from jian kang implementation in testkit related to refresh connection
             cv_logger.info("\nV%d :: Verify Design: %s" %(self._verify_counter, design_name))
-            if self.DUT_FAMILY == "diamondmesa" or os.environ.get("PYCV_PLATFORM") == 'simics' :
+            if self.DUT_FAMILY == "diamondmesa" or self.run_profile.simics :
                 # diamondmesa do internal BRAM_HASH_CHECK. No external check available.
-                if os.environ.get("PYCV_PLATFORM") == 'simics' :
+                if self.run_profile.simics :
                     cv_logger.warning("Simics skip verifying design ...")
                 else :
                     cv_logger.info("INFO :: Skipping verify_design..")
@@ -5047,7 +5481,7 @@ class JtagTest(EmptyTest):
     '''
     def collect_pgm_trace(self, dump=True, trace=None) :
 
-        if os.environ.get("PYCV_PLATFORM") == 'simics' :
+        if self.run_profile.simics :
             cv_logger.warning("Simics skip collecting PGM trace ...")
         else :
             cv_logger.info("Collect trace")
@@ -5145,84 +5579,39 @@ class JtagTest(EmptyTest):
     '''
     def get_fw_add(self, bitstream, mode="as", puf_enable=0, a2_startaddr=0):
 
-        index_offset    = 0
-        index_size      = 1
-
         print("A2_address is %x" %a2_startaddr)
         cv_logger.info("Bitstream processing to get address")
 
+        # every descriptor field at the firmware start, decoded from one slice of the bitstream
+        header_fields = table_fields(CMF_DESCRIPTOR, ["fw_sec_size", "offset_trampol", "size_trampoline"], prefix="cmf.") + \
+            table_fields(BOOTROM_DESCRIPTOR, ["ssbl_offset", "ssbl_size"], prefix="bootrom.")
+        if (mode == "as"):
+            header_fields += table_fields(MAIN_IMAGE_POINTER, ["sec_num"] + MAIN_POINTER_FIELDS, prefix="mip.")
+        header = compile_layout(header_fields).unpack(bitstream, a2_startaddr)
+        main_descriptor = compile_layout(table_fields(MAIN_DESCRIPTOR, ["size_main_sec"]))
+
         if (mode == "as"):
             # Main Image Pointer - last 256 bytes  of the second 4kB block within the firmware section
-            # for each in MAIN_IMAGE_POINTER:
-                # index_start     = MAIN_IMAGE_POINTER[each][index_offset]
-                # index_end       = index_start + MAIN_IMAGE_POINTER[each][index_size]
-                # src_buff        = bitstream[index_start:index_end]
-                # src_buff_le     = reverse_arr(src_buff)
-                # add = int(binascii.hexlify(src_buff_le),16)
-                # cv_logger.info("Main Image Pointer %s: 0x%08x"%(each,add))
-
-            index_start     = MAIN_IMAGE_POINTER['sec_num'][index_offset] + a2_startaddr
-            index_end       = index_start + MAIN_IMAGE_POINTER['sec_num'][index_size]
-            add = self.read_add(bitstream, index_start, index_end)
-            cv_logger.info("Main Image Pointer MAIN_SEC_NUM: 0x%08x"% add)
+            self.MAIN_SEC_NUM = header["mip.sec_num"]
+            cv_logger.info("Main Image Pointer MAIN_SEC_NUM: 0x%08x"% self.MAIN_SEC_NUM)
             cv_logger.info("a2_startaddr: 0x%08x"% a2_startaddr)
-            self.MAIN_SEC_NUM = add
             self.MAIN_ADD = []
 
             # dummy add 0
             self.MAIN_ADD.append(0)
 
-            main_sec = 1
-            if self.MAIN_SEC_NUM >= 1 :
-                index_start     = MAIN_IMAGE_POINTER['1st_main_add'][index_offset] + a2_startaddr
-                index_end       = index_start + MAIN_IMAGE_POINTER['1st_main_add'][index_size]
-                add = self.read_add(bitstream, index_start, index_end)
-                #assert_err ( add != 0, "ERROR :: 1st main address cannot be 0")
+            for main_sec in range(1, min(self.MAIN_SEC_NUM, len(MAIN_POINTER_FIELDS)) + 1):
+                add = header["mip." + MAIN_POINTER_FIELDS[main_sec - 1]]
                 # if address == 0, it means we are using relative address
-                if add == 0 :
+                if add == 0 and main_sec == 1:
                     #For QSPI relative addressing mode, Main sections starting at 0x100000(ND) or 0x200000(FM/DM)
                     if self.DUT_FAMILY == "stratix10" :
                         add = 0x100000
                     else :
                         add = 0x200000 + a2_startaddr
-                cv_logger.info("MIP MAIN_ADD[%d]: 0x%08x"% (main_sec, add))
-                self.MAIN_ADD.append(add)
-
-
-            if self.MAIN_SEC_NUM >= 2 :
-                index_start     = MAIN_IMAGE_POINTER['2nd_main_add'][index_offset] + a2_startaddr
-                index_end       = index_start + MAIN_IMAGE_POINTER['2nd_main_add'][index_size]
-                add = self.read_add(bitstream, index_start, index_end)
-                # if address == 0, it means we are using relative address
-                if add == 0 :
-                    index_start = self.MAIN_ADD[1] + MAIN_DESCRIPTOR['size_main_sec'][index_offset]
-                    index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                    add = self.MAIN_ADD[1] + self.read_add(bitstream, index_start, index_end)
-                main_sec += 1
-                cv_logger.info("MIP MAIN_ADD[%d]: 0x%08x"% (main_sec, add))
-                self.MAIN_ADD.append(add)
-
-            if self.MAIN_SEC_NUM >= 3 :
-                index_start     = MAIN_IMAGE_POINTER['3rd_main_add'][index_offset] + a2_startaddr
-                index_end       = index_start + MAIN_IMAGE_POINTER['3rd_main_add'][index_size]
-                add = self.read_add(bitstream, index_start, index_end)
-                if add == 0 :
-                    index_start = self.MAIN_ADD[2] + MAIN_DESCRIPTOR['size_main_sec'][index_offset]
-                    index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                    add = self.MAIN_ADD[2] + self.read_add(bitstream, index_start, index_end)
-                main_sec += 1
-                cv_logger.info("MIP MAIN_ADD[%d]: 0x%08x"% (main_sec, add))
-                self.MAIN_ADD.append(add)
-
-            if self.MAIN_SEC_NUM >= 4 :
-                index_start     = MAIN_IMAGE_POINTER['4th_main_add'][index_offset] + a2_startaddr
-                index_end       = index_start + MAIN_IMAGE_POINTER['4th_main_add'][index_size]
-                add = self.read_add(bitstream, index_start, index_end)
-                if add == 0 :
-                    index_start = self.MAIN_ADD[3] + MAIN_DESCRIPTOR['size_main_sec'][index_offset]
-                    index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                    add = self.MAIN_ADD[3] + self.read_add(bitstream, index_start, index_end)
-                main_sec += 1
+                elif add == 0:
+                    previous = self.MAIN_ADD[main_sec - 1]
+                    add = previous + main_descriptor.unpack(bitstream, previous)["size_main_sec"]
                 cv_logger.info("MIP MAIN_ADD[%d]: 0x%08x"% (main_sec, add))
                 self.MAIN_ADD.append(add)
 
@@ -5233,9 +5622,7 @@ class JtagTest(EmptyTest):
 
         else:
             # Main address for non flash mode
-            index_start = CMF_DESCRIPTOR['fw_sec_size'][index_offset]
-            index_end   = index_start + CMF_DESCRIPTOR['fw_sec_size'][index_size]
-            add = self.read_add(bitstream, index_start, index_end)
+            add = compile_layout(table_fields(CMF_DESCRIPTOR, ["fw_sec_size"])).unpack(bitstream)["fw_sec_size"]
 
             self.MAIN_ADD = []
 
@@ -5247,43 +5634,23 @@ class JtagTest(EmptyTest):
                 cv_logger.info("MAIN_ADD[%d]: 0x%08x"% (main_sec, add))
                 self.MAIN_ADD.append(add)
 
-                # 'Read from bitstream file'
-                index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset]
-                index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-
                 # 'base address of the main'
-                add = add + self.read_add(bitstream, index_start, index_end)
+                add = add + main_descriptor.unpack(bitstream, add)["size_main_sec"]
                 main_sec +=1
             self.MAIN_SEC_NUM = len(self.MAIN_ADD) - 1
             cv_logger.info("Total main section %d" %self.MAIN_SEC_NUM)
 
-        # SSBL/TSBL start add
-        index_start     = BOOTROM_DESCRIPTOR['ssbl_offset'][index_offset] + a2_startaddr
-        index_end       = index_start + BOOTROM_DESCRIPTOR['ssbl_offset'][index_size]
-        add = self.read_add(bitstream, index_start, index_end)
-        cv_logger.info("%s_START_ADD: 0x%08x"% (self.SSBL_TSBL,add))
-        self.SSBL_START_ADD = add
-
-        # SSBL/TSBL end address
-        index_start     = BOOTROM_DESCRIPTOR['ssbl_size'][index_offset] + a2_startaddr
-        index_end       = index_start + BOOTROM_DESCRIPTOR['ssbl_size'][index_size]
-        add             = add + self.read_add(bitstream, index_start, index_end) - 1
-        cv_logger.info("%s_END_ADD: 0x%08x"% (self.SSBL_TSBL,add))
-        self.SSBL_END_ADD = add
-
-        # Trampoline start add
-        index_start     = CMF_DESCRIPTOR['offset_trampol'][index_offset] + a2_startaddr
-        index_end       = index_start + CMF_DESCRIPTOR['offset_trampol'][index_size]
-        add = self.read_add(bitstream, index_start, index_end)
-        cv_logger.info("TRAMPOLINE_START_ADD: 0x%08x"% add)
-        self.TRAMPOLINE_START_ADD = add
-
-        # Trampoline end address
-        index_start     = CMF_DESCRIPTOR['size_trampoline'][index_offset] + a2_startaddr
-        index_end       = index_start + CMF_DESCRIPTOR['size_trampoline'][index_size]
-        add             = add + self.read_add(bitstream, index_start, index_end) - 1
-        cv_logger.info("TRAMPOLINE_END_ADD: 0x%08x"% add)
-        self.TRAMPOLINE_END_ADD = add
+        # SSBL/TSBL start and end address
+        self.SSBL_START_ADD = header["bootrom.ssbl_offset"]
+        cv_logger.info("%s_START_ADD: 0x%08x"% (self.SSBL_TSBL,self.SSBL_START_ADD))
+        self.SSBL_END_ADD = self.SSBL_START_ADD + header["bootrom.ssbl_size"] - 1
+        cv_logger.info("%s_END_ADD: 0x%08x"% (self.SSBL_TSBL,self.SSBL_END_ADD))
+
+        # Trampoline start and end address
+        self.TRAMPOLINE_START_ADD = header["cmf.offset_trampol"]
+        cv_logger.info("TRAMPOLINE_START_ADD: 0x%08x"% self.TRAMPOLINE_START_ADD)
+        self.TRAMPOLINE_END_ADD = self.TRAMPOLINE_START_ADD + header["cmf.size_trampoline"] - 1
+        cv_logger.info("TRAMPOLINE_END_ADD: 0x%08x"% self.TRAMPOLINE_END_ADD)
 
         # Sync start add
         self.SYNC_START_ADD=self.TRAMPOLINE_END_ADD
@@ -5296,6 +5663,12 @@ class JtagTest(EmptyTest):
         else:
             cv_logger.info("No Sync Block")
 
+        self.FW_LAYOUT = FirmwareLayout(MAIN_START_ADD=self.MAIN_ADD, MAIN_SEC_NUM=self.MAIN_SEC_NUM,
+            SSBL_START_ADD=self.SSBL_START_ADD, SSBL_END_ADD=self.SSBL_END_ADD,
+            TRAMPOLINE_START_ADD=self.TRAMPOLINE_START_ADD, TRAMPOLINE_END_ADD=self.TRAMPOLINE_END_ADD,
+            SYNC_START_ADD=self.SYNC_START_ADD,
+            SYNC_END_ADD=self.SYNC_END_ADD if self.SYNC_START_ADD != self.SSBL_START_ADD else None)
+
 
     '''
     Require  :  get_fw_add() must be called beforehand
@@ -5507,7 +5880,7 @@ class JtagTest(EmptyTest):
                 except:
                     assert_err(0, "ERROR :: Unsupported item %s" %location )
         #------SatyaS Added Code making address Byte Alligned----------#
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
+        if(self.run_profile.agilex_like):
             cv_logger.debug("Original Address selected by test ---> 0x%x" %offset)
             temp_offset = int(offset/4)
             offset      = temp_offset*4
@@ -5546,17 +5919,17 @@ class JtagTest(EmptyTest):
 
         signature_block_offset = section_offset + 4*1024
 
-        #offset to the field that stores 1st entry offset
-        first_entry_offset =  signature_block_offset +  SIGNATURE_DESC[self.DUT_FAMILY][signature_offset][0]
+        #offsets from the beginning of bitstream, the signature descriptor stores the offset of the 1st entry
+        root_entry_0_offset = signature_block_offset + compile_layout(table_fields(SIGNATURE_DESC[self.DUT_FAMILY],
+            [signature_offset])).unpack(bitstream, signature_block_offset)[signature_offset]
 
-        #offsets from the beginning of bitstream
-        root_entry_0_offset = signature_block_offset + self.read_add(bitstream, first_entry_offset, first_entry_offset + SIGNATURE_DESC[self.DUT_FAMILY][signature_offset][1])
+        # the length of every key entry (ie. the offset to the next entry) is at +4
+        entry_length = compile_layout((("length", 4, 4),))
+        public_entry_1_offset = root_entry_0_offset + entry_length.unpack(bitstream, root_entry_0_offset)["length"]
 
-        public_entry_1_offset = root_entry_0_offset + self.read_add(bitstream , root_entry_0_offset + 4, root_entry_0_offset + 8)
+        block0_entry_2_offset = public_entry_1_offset + entry_length.unpack(bitstream, public_entry_1_offset)["length"]
 
-        block0_entry_2_offset = public_entry_1_offset + self.read_add(bitstream , public_entry_1_offset + 4, public_entry_1_offset + 8)
-
-        new_signature_chain_offset = block0_entry_2_offset + self.read_add(bitstream , block0_entry_2_offset + 4, block0_entry_2_offset + 8)
+        new_signature_chain_offset = block0_entry_2_offset + entry_length.unpack(bitstream, block0_entry_2_offset)["length"]
 
         entries_offsets = [root_entry_0_offset, public_entry_1_offset, block0_entry_2_offset]
 
@@ -5764,16 +6137,16 @@ class JtagTest(EmptyTest):
             assert_err(0, "ERROR :: Unsupported item : puf_block at %s" %puf_block )
 
     '''
-    Input    :  bitstream -- the bytearray of the read bitstream
+    Input    :  bitstream -- the bytearray (or Bitstream) of the read bitstream
                 offset -- the offset to corrupt
                 size -- number of size to read before corrupt
-    Output   : returns the corrupted bitstream
+    Output   : returns the corrupted bitstream, same type as the input bitstream
     '''
     def corrupt_bitstream(self, bitstream, offset=0, size=1):
         cv_logger.info("Corrupted bitstream at offset 0x%08x with size %d" %(offset, size))
 
         assert_err( offset < len(bitstream), "ERROR :: offset 0x%08x cannot less than length of bitstream 0x%08x" %(offset, len(bitstream)) )
-        corrupted_bitstream        = bytearray(bitstream)
+        corrupted_bitstream        = copy_bitstream(bitstream)
         src_buff        = bitstream[offset:offset+size]
 
         # corrupt the particular location of the bitstream with 0xFF, the offset of 0x100 is chosen so that data falls in psuedo mid'
@@ -5809,16 +6182,16 @@ class JtagTest(EmptyTest):
         return corrupted_bitstream
 
     '''
-    Input    :  bitstream -- the bytearray of the read bitstream
+    Input    :  bitstream -- the bytearray (or Bitstream) of the read bitstream
                 assigned_bitstream -- the replacement bitstream
                 offset -- the offset to replace
-    Output   : returns the corrupted bitstream with assigned bitstream at offset
+    Output   : returns the corrupted bitstream with assigned bitstream at offset, same type as the input bitstream
     '''
     def corrupt_bitstream_assigned(self, bitstream, assigned_bitstream, offset=0):
         cv_logger.info("Corrupted bitstream at offset 0x%08x with assigned bitstream" %offset)
 
         assert_err( offset < len(bitstream), "ERROR :: offset 0x%08x cannot less than length of bitstream 0x%08x" %(offset, len(bitstream)) )
-        corrupted_bitstream = bytearray(bitstream)
+        corrupted_bitstream = copy_bitstream(bitstream)
 
         for ith in range( 0, len(assigned_bitstream)) :
             corrupted_bitstream[offset+ith] = assigned_bitstream[ith]
@@ -5827,8 +6200,8 @@ class JtagTest(EmptyTest):
 
     def generate_corrupted_bitstream(self, ori_file, new_file, corrupt, cmf_copy=1, size=1) :
 
-        #read bitstream into byte array
-        bitstream = self.read_bitstream(ori_file)
+        #map the bitstream, corruptions below only go into its overlay
+        bitstream = self.read_bitstream(ori_file, use_mmap=True)
 
         offset = self.select_addr(bitstream=bitstream, location=corrupt, cmf_copy=cmf_copy)
         cv_logger.info("Generate corrupted bitstream at offset 0x%08x" % offset)
@@ -5843,9 +6216,8 @@ class JtagTest(EmptyTest):
                 cmf_copy = cmf_copy-1
 
         # Write into new_file
-        fw1 = open(new_file, "wb")
-        fw1.write(corrupted_bitstream)
-        fw1.close()
+        self.write_bitstream_to_file(bitstream=corrupted_bitstream, file_path=new_file)
+        bitstream.close()
 
         return offset
 
@@ -5853,7 +6225,7 @@ class JtagTest(EmptyTest):
     Corrupt the section of bitstream given by [start, stop], the corruption is done randomly, but with the rightmost
     set bit of the original bitstream unset so we don't randomly get the same value as original value
     Note : the byte at stop index is exclusive, it will not be corrupted
-    Input    :  bitstream -- the bytearray of the read bitstream
+    Input    :  bitstream -- the bytearray (or Bitstream) of the read bitstream
                 new_file -- the replacement bitstream
                 start_index -- the start offset to corrupted
                 stop_index -- the end offset to be corrupted
@@ -5874,8 +6246,7 @@ class JtagTest(EmptyTest):
         for i in range(start_index, stop_index):
             corrupted_bitstream[i] = (corrupted_field_value & (0xFF << (i-start_index)*8)) >> (i-start_index)*8
 
-        with open(new_file, "wb") as fw1:
-            fw1.write(corrupted_bitstream)
+        self.write_bitstream_to_file(bitstream=corrupted_bitstream, file_path=new_file)
 
         return corrupted_field_value
 
@@ -5902,7 +6273,7 @@ class JtagTest(EmptyTest):
 
 
             if((cfg_status_nBOOTROM_DEBUG) and (verdict_gen)):
-                if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+                if(self.run_profile.emulator):
                     if(local_lst_length == 4):
                         local_success.append(True)
                         cv_logger.debug("In bootrom stage  <> OK")
@@ -6099,6 +6470,7 @@ class JtagTest(EmptyTest):
     Fpga connector - sends SDM command
     Note    : this command is send sdm commadn thru FPGA connector
     '''
+    @traced("send")
     def fpga_send_sdmcmd(self, sdm_cmd, *arg):
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
         input_length = len(arg)
@@ -6139,6 +6511,7 @@ class JtagTest(EmptyTest):
     Fpga connector - rsu_switch_image
     Output: return the responds
     '''
+    @traced("send")
     def fpga_rsu_switch_image(self, address):
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
@@ -6179,6 +6552,7 @@ class JtagTest(EmptyTest):
     Modify  : self, prepares AVST configuration by writing bitstream into RAM
     Output  : returns the length of the bitstream (number of bytes)
     '''
+    @traced("program")
     def fpga_prepare_data(self, file_path, check_ram=0, ast=0, offset=0):
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
@@ -6187,10 +6561,9 @@ class JtagTest(EmptyTest):
 
         #prepare the RAM
         cv_logger.info("Writing Bitstream from %s into RAM..." % file_path)
-        self.dut.test_time()
-        self.fpga.prepare_data(bitstream, offset)
-        self._prepared_file_path = file_path
-        cv_logger.info("Time to write data into RAM: %s" % self.dut.elapsed_time())
+        with self.span("write data into RAM", "program"):
+            self.fpga.prepare_data(bitstream, offset)
+            self._prepared_file_path = file_path
 
         #if user specified, check the RAM bistream
         if check_ram:
@@ -6212,15 +6585,21 @@ class JtagTest(EmptyTest):
               timeout -- timeout in seconds, default 10s
     Modify  : self, sends the bitstream via AVST
     '''
+    @traced("send")
     def fpga_send_data(self, length, success=1, exp_err=None, offset=0, timeout=10):
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
         cv_logger.info("C%d :: Sending Bitstream Via FPGA Mailbox" %(self._config_counter))
         self._config_counter = self._config_counter + 1
 
+        timeout = self.transfer_timeout("fpga", "send", length, timeout)
         try:
             self.dut.test_time()
-            status = self.fpga.send_data(offset, length, timeout)
+            if success:
+                with self.measured_transfer("fpga", "send", length):
+                    status = self.fpga.send_data(offset, length, timeout)
+            else:
+                status = self.fpga.send_data(offset, length, timeout)
         except Exception as e:
             local_respond = self.dut.get_last_error()
             cv_logger.error("EXCEPTION ::%s" %local_respond)
@@ -6232,7 +6611,7 @@ class JtagTest(EmptyTest):
                 if(re.search(exp_err, local_respond)):
                     cv_logger.info("Failed to load the bitstream as EXPECTED")
                 else:
-                    if os.environ.get("PYCV_PLATFORM") == 'simics' :
+                    if self.run_profile.simics :
                         # For now it is ok to allow different Error (as long as it is still an error)
                         # Simics is not SysCon anyway, will unify the error after this
                         print("Simics Warning :: Expected error is \"%s\", but found \"%s\"" % (exp_err, local_respond))
@@ -6256,6 +6635,7 @@ class JtagTest(EmptyTest):
               timeout -- timeout in seconds, default 10s
     Modify  : self, sends the bitstream via AVST
     '''
+    @traced("send")
     def fpga_send_data_pr_bad(self, length, exp_err=None, offset=0, timeout=10):
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
@@ -6272,7 +6652,7 @@ class JtagTest(EmptyTest):
             if(re.search(exp_err, local_respond)):
                 cv_logger.info("Failed to load the bitstream as EXPECTED for pr_fpga_bad case")
             else:
-                if os.environ.get("PYCV_PLATFORM") == 'simics' :
+                if self.run_profile.simics :
                     # For now it is ok to allow different Error (as long as it is still an error)
                     # Simics is not SysCon anyway, will unify the error after this
                     print("Simics Warning :: Expected error is \"%s\", but found \"%s\"" % (exp_err, local_respond))
@@ -6292,6 +6672,7 @@ class JtagTest(EmptyTest):
     Modify  : self, prepares FPGA PR configuration by writing bitstream into RAM
     Output  : return 1 if good, 0 if bad
     '''
+    @traced("verify")
     def check_ram(self, file_path, ast=0):
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
@@ -6301,9 +6682,8 @@ class JtagTest(EmptyTest):
         cv_logger.info("Checking RAM...")
         local_pass = True
         read_back_data=[]
-        self.dut.test_time()
-        read_back_data = self.fpga.read_back(0x0,bitstream_length)
-        cv_logger.info("Time to read data from RAM: %s" % self.dut.elapsed_time())
+        with self.span("read data from RAM", "verify"):
+            read_back_data = self.fpga.read_back(0x0,bitstream_length)
         assert_err((not ast) or (len(read_back_data) == bitstream_length),
             "ERROR :: Readback RAM data length is %d, expected %d bytes"
             %(len(read_back_data), bitstream_length))
@@ -6312,12 +6692,11 @@ class JtagTest(EmptyTest):
             print_err("ERROR :: Readback RAM data length is %d, expected %d bytes"
                 %(len(read_back_data), bitstream_length))
 
-        self.dut.test_time()
-        for i in xrange(bitstream_length):
-            if(bitstream_buffer[i]^read_back_data[i]):
-                local_pass = False
-                cv_logger.error("Expected data = 0x%x; read data = 0x%x; offset=%d" %(bitstream_buffer[i],read_back_data[i],i))
-        cv_logger.info("Time to Compare content: %s" % self.dut.elapsed_time())
+        with self.span("compare content", "verify"):
+            comparison = compare_buffers(bitstream_buffer, read_back_data)
+            local_pass = comparison.ok
+            for line in comparison.summary_lines():
+                cv_logger.error(line)
 
         assert_err(((not ast) or local_pass),
             "ERROR :: Readback RAM data is different than expected")
@@ -6363,6 +6742,8 @@ class JtagTest(EmptyTest):
 
         cv_logger.info("FPGAMBOX send QSPI_SET_CS %d"%cs_setting)
         self.fpga_send_sdmcmd(SDM_CMD['QSPI_SET_CS'], cs_setting)
+        # remembered to pick the flash manifest of the selected flash
+        self._qspi_cs = cs_setting
         responds = self.fpga_read_respond()
         # assert_err(responds[0] == 0, "ERROR :: FPGAMBOX --> QSPI_SET_CS response is not [0]!")
         return len(responds) == 1 and responds[0] == 0
@@ -6373,6 +6754,7 @@ class JtagTest(EmptyTest):
                         2. Number of bytes to erase (either match or multiples of erase size options in QSPI_SETUP)
     Return          : Status
     '''
+    @traced("erase")
     def fpga_qspi_erase(self, address, size) :
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
@@ -6463,6 +6845,87 @@ class JtagTest(EmptyTest):
             self.platform.print_warning_msg("QSPI_READ Failed at 0x%08x" % address)
         return status, responds
 
+    '''
+    Output   : returns a name unique to the board under test, FWVAL_BOARD_ID if defined,
+               otherwise host name + platform + device index
+    '''
+    def get_board_id(self) :
+        board_id = os.environ.get("FWVAL_BOARD_ID")
+        if board_id == None :
+            board_id = "%s_%s_dev%d" % (socket.gethostname(), self._sdmio.platform, self._DEVICE_IDX)
+        return board_id
+
+    '''
+    Input    : chip_select -- QSPI chip select of the flash
+    Output   : returns the FlashManifest (sector hashes last programmed) of this board's flash
+    '''
+    def get_flash_manifest(self, chip_select=0) :
+        if not hasattr(self, "_flash_manifests") :
+            self._flash_manifests = {}
+        if chip_select not in self._flash_manifests :
+            self._flash_manifests[chip_select] = FlashManifest(self.get_board_id(), chip_select)
+        return self._flash_manifests[chip_select]
+
+    '''
+    Input    : start_address, size -- flash range written where the selected chip select is not known
+    Modify   : forgets the range in the flash manifests of every chip select of this board
+    '''
+    def forget_flash_range(self, start_address, size) :
+        FlashManifest.forget_all(self.get_board_id(), start_address, size)
+        for manifest in getattr(self, "_flash_manifests", {}).values() :
+            manifest.forget(start_address, size, save=False)
+
+    '''
+    Output   : returns the LayoutCache (parsed map/rpd layouts) shared by the parse methods of this test
+    '''
+    def get_layout_cache(self) :
+        if not hasattr(self, "_layout_cache") :
+            self._layout_cache = LayoutCache()
+        return self._layout_cache
+
+    '''
+    Require  : the base rpd of patch_set is already programmed at start_address
+    Input    : patch_set -- PatchSet (fwval_lib.configuration.patchset) against the base rpd
+    Optional : rpd_file_name -- base rpd (file order), default patch_set.base_path
+               start_address -- QSPI address the base rpd is programmed at
+               sector_size -- erase size of erase_func, default 4KB
+               erase_sizes -- erase sizes the flash allows (see ERASE_SIZES), when given the patches are
+                              rounded up to the smallest of them and sector_size is ignored
+               erase_func -- function(address) erasing one sector, default fpga_qspi_sector_erase for
+                             64KB sectors, else fpga_qspi_4k_erase
+               write_func -- function(address, *words) programming up to 4KB, default fpga_qspi_write
+               revert -- True to program the original bytes back (recover the good image)
+    Modify   : erases and re-programs ONLY the flash sectors touched by patch_set
+    Output   : returns status
+    '''
+    @traced("program")
+    def program_patch_set(self, patch_set, rpd_file_name=None, start_address=0, sector_size=4<<10, erase_sizes=None, erase_func=None, write_func=None, revert=False) :
+        if erase_sizes != None :
+            sector_size = min(erase_sizes)
+        if erase_func == None :
+            erase_func = self.fpga_qspi_sector_erase if sector_size == 64<<10 else self.fpga_qspi_4k_erase
+        write_func = write_func or self.fpga_qspi_write
+        rpd_file_name = rpd_file_name or patch_set.base_path
+        assert_err( rpd_file_name!=None, "ERROR :: Base rpd of the patch set is unknown")
+
+        status = True
+        base = self.read_bitstream(rpd_file_name, use_mmap=True)
+        file_order_patch_set = patch_set.in_file_order()
+        sectors = file_order_patch_set.sectors(sector_size)
+        cv_logger.info("Programming %d patched bytes of %s: %d sector(s) of %d bytes instead of %d bytes"
+            % (patch_set.patched_bytes(), rpd_file_name, len(sectors), sector_size, len(base)))
+        for sector in sectors :
+            data = file_order_patch_set.sector_image(base, sector, sector_size, revert=revert)
+            data_words, chunks = qspi_program_plan(data)
+            status = erase_func(start_address + sector)
+            for offset, bytes_to_pgm in chunks :
+                status = status and write_func(start_address + sector + offset, *data_words[offset/4:(offset + bytes_to_pgm + 3)/4])
+            if not status :
+                cv_logger.warning("Failed to program patched sector 0x%08x" % (start_address + sector))
+                break
+        base.close()
+        return status
+
     '''
     Fpga connector - add_new_qspi_image
     Functionality   : Verify flash content
@@ -6471,65 +6934,93 @@ class JtagTest(EmptyTest):
                     update -    1 for update mode that involved QSPI_ERASE;
                                 0 for add to new flash offset that do not need QSPI_ERASE
                     verify - Read back and verify the flash content
+                    patch_set - PatchSet against rpd_file_name (already in flash), when given only
+                                the sectors it touches are erased and re-programmed (4KB, 64KB on 18.0)
+                    incremental - 1 to only erase/program the sectors that differ from what the flash
+                                manifest says was last programmed on this board (see FlashManifest)
         Output   : returns status
     '''
-    def fpga_add_new_qspi_image(self, rpd_file_name, start_address=0, update=True, verify=False) :
+    @traced("program")
+    def fpga_add_new_qspi_image(self, rpd_file_name, start_address=0, update=True, verify=False, patch_set=None, incremental=False) :
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
+        manifest = self.get_flash_manifest(getattr(self, '_qspi_cs', 0))
+
+        erase_sizes = ERASE_SIZES
+        if update or incremental or patch_set != None :
+            # 18.0 only erases 64KB sectors
+            if os.environ['QUARTUS_VERSION'] == '18.0' :
+                erase_sizes = (64<<10,)
+        erase_size = erase_sizes[-1]
+
+        if patch_set != None :
+            cv_logger.info("FPGAMBOX to program QSPI Flash with patch set")
+            for sector in patch_set.sectors(erase_size) :
+                manifest.forget(start_address + sector, erase_size, save=False)
+            manifest.try_save()
+            status = self.program_patch_set(patch_set, rpd_file_name, start_address, erase_sizes=erase_sizes)
+            if status and verify :
+                base = self.read_bitstream(rpd_file_name or patch_set.base_path, use_mmap=True)
+                expected = patch_set.in_file_order().apply(base)
+                for sector in patch_set.sectors(erase_size) :
+                    sector_data = expected[sector:sector + erase_size]
+                    status = status and self.fpga_read_flash(len(sector_data), start_address + sector, sector_data)[0]
+                base.close()
+            return status
+
         cv_logger.info("FPGAMBOX to program QSPI Flash")
 
         status = True
         bitstream = self.read_bitstream(rpd_file_name)
         bitstream_size = len(bitstream)
 
-        # 1. Erase
-        if update:
+        # 0. Sectors to erase/program, all of them unless incremental
+        if incremental and start_address % erase_size == 0 :
+            sectors, hashes = manifest.changed_sectors(bitstream, start_address, erase_size)
+            cv_logger.info("Incremental programming: %d of %d sectors changed" % (len(sectors), (bitstream_size + erase_size - 1) / erase_size))
+        else :
+            sectors = [(offset, min(erase_size, bitstream_size - offset)) for offset in range(0, bitstream_size, erase_size)]
+            hashes = manifest.image_hashes(bitstream, start_address) if start_address % (4<<10) == 0 else None
+        # sectors the manifest knows are blank need no erase, only trusted in incremental mode
+        erase_plan = plan_erase([(start_address + offset, length) for offset, length in sectors], erase_sizes,
+            is_blank=manifest.is_blank if incremental else None, legacy_size=erase_size)
+        # until programming passes the flash content of the erased range is unknown
+        manifest.forget(start_address, ((bitstream_size + erase_size - 1) / erase_size) * erase_size)
+
+        # 1. Erase (changed sectors always need it in incremental mode)
+        if update or incremental:
             cv_logger.info("Erasing flash...")
-            offset = 0
-            while status and offset < bitstream_size :
-                if os.environ['QUARTUS_VERSION'] == '18.0':
-                    status = self.fpga_qspi_sector_erase(start_address + offset)
-                    offset +=  64<<10
-                else:
-                    status = self.fpga_qspi_4k_erase(start_address + offset)
-                    offset +=  4<<10
+            for address, size in erase_plan :
+                status = self.fpga_qspi_erase(address, size)
+                if not status :
+                    break
+            cv_logger.info("QSPI %s" % erase_plan.report())
         else:
             cv_logger.info("Skip QSPI_ERASE")
 
         # 2. Program
         if status :
-            offset = 0
-            max_data = 4096
             cv_logger.info("Programming %s..." % rpd_file_name)
-            while status and offset < bitstream_size :
-                # Check whether there is 4K bytes or less data
-                if (offset + max_data) <= bitstream_size :
-                    bytes_to_pgm = max_data
-                else :
-                    bytes_to_pgm = bitstream_size - 1
-                data_words = []
-                for i in range (offset/4, (offset + bytes_to_pgm)/4) :
-                    # convert bytes to words
-                    data_word = bitstream[i * 4] << 24 | bitstream[i * 4 + 1] << 16 | bitstream[i * 4 + 2] << 8 | bitstream[i * 4 + 3]
-                    # reverse bit order
-                    reversed_data = 0
-                    if data_word != 0xFFFFFFFF and data_word != 0:
-                        for j in xrange(32) :
-                            if (data_word >> j) & 1 :
-                                reversed_data |= 1 << (31 - j)
-                    else :
-                        reversed_data = data_word
-                    data_words.append(reversed_data)
-                # Program if data is not blank
-                if data_words != ([0xFFFFFFFF] * len(data_words)) :
-                    status = self.fpga_qspi_write(start_address + offset, *data_words)
-                offset += bytes_to_pgm
+            # bit reversed words for the whole image + the 4KB chunks that are not blank
+            data_words, chunks = qspi_program_plan(bitstream)
+            changed = set(offset for offset, length in sectors)
+            chunks = [(offset, bytes_to_pgm) for offset, bytes_to_pgm in chunks if (offset - offset % erase_size) in changed]
+            cv_logger.info("%d of %d chunks (4KB) to program" % (len(chunks), (bitstream_size + 4095) / 4096))
+            for offset, bytes_to_pgm in chunks :
+                status = self.fpga_qspi_write(start_address + offset, *data_words[offset/4:(offset + bytes_to_pgm + 3)/4])
+                if not status :
+                    break
             cv_logger.info("Programming completed")
 
         # 3. Verify
         if status and verify :
             status = self.fpga_qspi_verify(rpd_file_name, start_address)
 
+        if status and hashes != None :
+            manifest.update(hashes)
+        if incremental :
+            cv_logger.info("QSPI %s" % manifest.report())
+
         return status
 
     '''
@@ -6539,6 +7030,7 @@ class JtagTest(EmptyTest):
                             2. Start address (1 word)
         Return          : Status
     '''
+    @traced("verify")
     def fpga_qspi_verify(self, rpd_file_name, start_address=0) :
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
@@ -6547,46 +7039,81 @@ class JtagTest(EmptyTest):
         [status, read_data] = self.fpga_read_flash(len(bitstream), start_address, bitstream)
         return status
 
+    '''
+    Input    : address -- flash address of the first read
+    Output   : returns the bytes per QSPI_READ, the largest size the firmware accepts, negotiated once
+    '''
+    def fpga_qspi_read_size(self, address=0) :
+        if getattr(self, '_qspi_read_size', None) == None :
+            cv_logger.info("Negotiating the QSPI_READ transfer size, a failed read is expected if it is not supported")
+            for size in QSPI_READ_SIZES :
+                [status, response] = self.fpga_qspi_read(address, size / 4)
+                if status :
+                    break
+            self._qspi_read_size = size
+            cv_logger.info("QSPI_READ transfer size: %d bytes" % size)
+        return self._qspi_read_size
+
+    '''
+    Input    : comparisons -- list of (address, Pending compare_buffers()) of the chunks read
+    Output   : returns True if all chunks matched, logs the mismatches of every chunk
+    '''
+    def _report_flash_comparisons (self, comparisons) :
+        matched = True
+        for address, pending in comparisons :
+            comparison = pending.result()
+            for line in comparison.summary_lines(address):
+                cv_logger.error(line)
+            matched = matched and comparison.ok
+        del comparisons[:]
+        return matched
+
+    '''
+    Input    : n_bytes -- bytes to read
+    Optional : start_address -- flash address
+               expected_data -- data to compare the readback with (file order), None to only read
+    Output   : returns [status, read_data], status is False on a read failure or any mismatch,
+               read_data holds all bytes read (up to a read failure)
+    Note     : the QSPI_READ mailbox calls stay on the calling thread, only the compare of a chunk
+               runs in the background, overlapping the read of the next one. Every mismatching
+               chunk is logged, the read goes on to the end
+    '''
     def fpga_read_flash (self, n_bytes, start_address=0, expected_data=None) :
         assert_err( self.fpga!=None, "ERROR :: You must get FPGA connector first")
 
         status = True
+        matched = True
         offset = 0
-        max_data = 4096
-        read_data = bytearray()
+        read_data = bytearray(n_bytes)
+        comparisons = []
+        start = time.time()
         self.platform.start_progress()
-        while status and offset < n_bytes :
-            # Check whether there is 4K bytes or less data
-            if (offset + max_data) <= n_bytes :
-                bytes_to_read = max_data
-            else :
-                bytes_to_read = n_bytes
-            [status, response] = self.fpga_qspi_read(start_address + offset, bytes_to_read / 4)
-            response_bytes = bytearray(bytes_to_read)
-            for i in range (1, len(response)) :
-                # reverse bit order
-                reversed_response = 0
-                if response[i] != 0xFFFFFFFF and response[i] != 0 :
-                    for j in xrange (32) :
-                        if (response[i] >> j) & 1 :
-                            reversed_response |= 1 << (31 - j)
-                else :
-                    reversed_response = response[i]
-                # convert word to byte
-                for k, n in enumerate([24, 16, 8, 0]) :
-                    response_bytes[(i-1) * 4 + k] = (reversed_response >> n & 0xff)
-            read_data += response_bytes
-            if status and expected_data != None :
-                if read_data[offset:offset+bytes_to_read] != bytearray(expected_data[offset:offset+bytes_to_read]) :
-                    for x in range(bytes_to_read) :
-                        bitstream_address = offset + x
-                        if read_data[bitstream_address] != expected_data[bitstream_address] :
-                            cv_logger.error("Data mismatched at 0x%08x: Expected 0x%02x but found 0x%02x" % ((start_address + offset + x), expected_data[bitstream_address], read_data[bitstream_address]))
-                            status = False
+        while offset < n_bytes :
+            bytes_to_read = min(self.fpga_qspi_read_size(start_address), n_bytes - offset)
+            [status, response] = self.fpga_qspi_read(start_address + offset, (bytes_to_read + 3) / 4)
+            if not status :
+                break
+            # response[0] is the header, then the bit reversed words
+            if len(response) - 1 < (bytes_to_read + 3) / 4 :
+                print_err("ERROR :: QSPI read at 0x%x returned %d words, expected %d" %
+                    (start_address + offset, len(response) - 1, (bytes_to_read + 3) / 4))
+                status = False
+                break
+            chunk = unpack_reversed_words(response[1:])[:bytes_to_read]
+            read_data[offset:offset+bytes_to_read] = chunk
+            if expected_data != None :
+                # the previous chunk was compared during this read
+                matched = self._report_flash_comparisons(comparisons) and matched
+                comparisons.append((start_address + offset,
+                    Pending(compare_buffers, expected_data[offset:offset+bytes_to_read], chunk)))
             offset += bytes_to_read
             self.platform.print_progress_msg((offset * 100)/n_bytes)
+        matched = self._report_flash_comparisons(comparisons) and matched
         self.platform.end_progress()
-        return status, read_data
+        del read_data[offset:]
+        elapsed = time.time() - start
+        cv_logger.info("Read %d bytes of flash in %.2f s (%.2f MB/s)" % (offset, elapsed, offset / max(elapsed, 1e-6) / (1<<20)))
+        return status and matched, read_data
 
     '''
     Input   : external_clock_in_mhz -- 125 by default to drive external clock (125mhz)
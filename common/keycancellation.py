@@ -0,0 +1,109 @@
+'''
+    Indexed lookup of the firmware key cancellation database.
+
+    KEY_CANCELLATION_DATABASE lists ("<acds version>/<build>", cancelled key) entries, one list
+    for ND devices and one for the others. get_cancelled_key_based_on_acds_version() scanned it
+    on every call, splitting and regex normalizing every entry again, and compared the builds as
+    strings ("99" > "140"). cancellation_index() parses a list once per process into sorted
+    (version tuple, build number) keys, and a lookup is a bisect:
+        index = cancellation_index(KEY_CANCELLATION_DATABASE[0], nd=True)
+        index.cancelled_key(toolchain_key("22.1", "140"))   -> key of the last entry <= 22.1/140
+        index.is_eq_or_newer(fw_key, check_key)             -> firmware key order of the device
+    The index also remembers values only depending on the toolchain, so get_fw_key() converts
+    the pregen sof and get_cancelled_psg_key() reads the CMF security version once per ACDS build.
+'''
+import bisect
+import re
+
+# firmware keys of ND devices out of numeric order, oldest first: 1, then 0, 2, ... 30
+ND_KEY_ORDER = (1, 0)
+
+'''
+    Input   : version -- acds version string, eg. "19.0", "21.4.1"
+    Output  : returns the version as a tuple of int, trailing zeros dropped ("19.0" == "19")
+'''
+def version_tuple(version):
+    numbers = [int(number) for number in re.findall(r'\d+', str(version))]
+    while numbers and numbers[-1] == 0:
+        numbers.pop()
+    return tuple(numbers)
+
+'''
+    Input   : build -- acds build number, str or number, eg. "140", 140.0, "140b"
+    Output  : returns the build as an int
+'''
+def build_number(build):
+    if isinstance(build, (int, float)):
+        return int(build)
+    match = re.match(r'\s*(\d+)', str(build))
+    assert match, "Invalid ACDS build number %r" % (build,)
+    return int(match.group(1))
+
+'''
+    Input   : version, build -- acds version and build, see version_tuple() and build_number()
+    Output  : returns the sortable (version tuple, build number) of the toolchain
+'''
+def toolchain_key(version, build):
+    return (version_tuple(version), build_number(build))
+
+class KeyCancellationIndex(object):
+    '''
+    Input   : entries -- list of ("<version>/<build>", cancelled key), in any order
+    Optional: nd -- True for the firmware key order of ND devices, see ND_KEY_ORDER
+    '''
+    def __init__(self, entries, nd=False):
+        parsed = sorted((toolchain_key(*version_build.split("/")[:2]), position, cancelled_key)
+                        for position, (version_build, cancelled_key) in enumerate(entries))
+        self._keys = [key for key, _, _ in parsed]
+        self._cancelled = [cancelled_key for _, _, cancelled_key in parsed]
+        self.nd = nd
+        self._values = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    '''
+    Input   : toolchain -- toolchain_key() of the acds in use
+    Output  : returns the key cancelled by the last entry not newer than toolchain, 0 if none is
+    '''
+    def cancelled_key(self, toolchain):
+        position = bisect.bisect_right(self._keys, toolchain)
+        return self._cancelled[position - 1] if position else 0
+
+    '''
+    Input   : key -- firmware key id
+    Output  : returns the age rank of the key, older keys rank lower
+    '''
+    def rank(self, key):
+        if self.nd and key in ND_KEY_ORDER:
+            return ND_KEY_ORDER.index(key)
+        return key
+
+    def is_eq_or_newer(self, fw_key, check_key):
+        return self.rank(fw_key) >= self.rank(check_key)
+
+    '''
+    Input   : name -- what is read, eg. "fw_key"
+              toolchain -- toolchain_key() of the acds in use
+              family -- DUT family the value is read for
+              read -- function() reading the value, called once per name, toolchain and family
+    Output  : returns the value read for the toolchain
+    '''
+    def toolchain_value(self, name, toolchain, family, read):
+        if (name, toolchain, family) not in self._values:
+            self._values[(name, toolchain, family)] = read()
+        return self._values[(name, toolchain, family)]
+
+_INDEXES = {}
+
+'''
+    Input   : entries -- one list of KEY_CANCELLATION_DATABASE
+    Optional: nd -- see KeyCancellationIndex
+    Output  : returns the KeyCancellationIndex of entries, built once per process
+'''
+def cancellation_index(entries, nd=False):
+    cached = _INDEXES.get((id(entries), nd))
+    # the list is kept with its index, so its id cannot be reused by another list
+    if cached is None or cached[0] is not entries or len(cached[1]) != len(entries):
+        cached = _INDEXES[(id(entries), nd)] = (entries, KeyCancellationIndex(entries, nd))
+    return cached[1]
@@ -0,0 +1,181 @@
+'''
+    Persistent cache of parsed RPD/map layouts.
+
+    Every RSU test parses the same pfg outputs again: map_get_rsu_add() runs its regexes
+    over the whole map file, and rpd_get_rsu_fw_add() reads and bit-reverses the whole RPD
+    just to walk a few descriptors for FACTORY/P1..P5. The result only depends on the file
+    contents (and on the descriptor tables), so it is cached on disk as a small json entry:
+        key   -- sha1 of (kind, content digest of the inputs, parse parameters)
+        value -- the attributes the parse would have set
+    The content digest of a file is remembered per (path, size, mtime, inode), so a rerun on
+    untouched artifacts does not even read them. Entries are evicted least recently used.
+
+    Cache lives in $FWVAL_LAYOUT_CACHE_DIR (default ~/.fwval/layout_cache). It is opt-in, set
+    FWVAL_LAYOUT_CACHE=1 to enable it; while disabled nothing is hashed nor written.
+'''
+import hashlib
+import json
+import os
+
+LAYOUT_CACHE_VERSION = 2
+# entries kept before the least recently used ones are evicted
+MAX_ENTRIES = 128
+# bytes hashed per read() when computing a file digest
+DIGEST_CHUNK_SIZE = 1 << 20
+DIGEST_INDEX = "digests.json"
+
+# attributes set by QspiTest.map_get_rsu_add()
+MAP_LAYOUT_ATTRS = [name % part for part in ["MBR", "A2_PARTITION", "BOOT_INFO", "FACTORY_IMAGE", "SPT0", "SPT1",
+    "CPB0", "CPB1", "P1", "P2", "P3", "P4", "P5", "PUF", "PARTITION_48", "PARTITION_A3"]
+    for name in ["%s_START_ADD", "%s_END_ADD"] if name % part != "MBR_END_ADD"] + ["MBR_INFO_END_ADD"]
+
+class LayoutCache(object):
+    '''
+    Optional: cache_dir -- directory holding the entries
+              max_entries -- LRU size
+    '''
+    def __init__(self, cache_dir=None, max_entries=MAX_ENTRIES):
+        self.cache_dir = cache_dir or os.environ.get("FWVAL_LAYOUT_CACHE_DIR") or \
+            os.path.join(os.path.expanduser("~"), ".fwval", "layout_cache")
+        self.max_entries = max_entries
+        self.enabled = os.environ.get("FWVAL_LAYOUT_CACHE", "0") == "1"
+        self.hits = 0
+        self.misses = 0
+        self._digests = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _write_json(self, path, content):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        temp_path = path + ".%d.tmp" % os.getpid()
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(content, file)
+            os.rename(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _load_digests(self):
+        if self._digests is None:
+            self._digests = {}
+            try:
+                with open(os.path.join(self.cache_dir, DIGEST_INDEX), "r") as file:
+                    self._digests = json.load(file)
+            except (IOError, OSError, ValueError):
+                pass
+        return self._digests
+
+    '''
+    Input   : file_path -- file to identify
+    Output  : returns the sha1 of the file content
+    Note    : remembered per (path, size, mtime, inode), the file is only read when it changed
+    '''
+    def file_digest(self, file_path):
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        signature = [stat.st_size, repr(stat.st_mtime), stat.st_ino]
+        digests = self._load_digests()
+        entry = digests.get(file_path)
+        if entry and entry[:3] == signature:
+            return entry[3]
+        sha1 = hashlib.sha1()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(DIGEST_CHUNK_SIZE), b''):
+                sha1.update(chunk)
+        digests[file_path] = signature + [sha1.hexdigest()]
+        if self.enabled:
+            try:
+                self._write_json(os.path.join(self.cache_dir, DIGEST_INDEX), digests)
+            except (IOError, OSError):
+                pass
+        return sha1.hexdigest()
+
+    '''
+    Input   : kind -- name of the parse, eg. "map_get_rsu_add"
+              files -- list of input files, identified by content
+    Optional: params -- anything else (json serializable) the parse depends on
+    Output  : returns the cache key
+    '''
+    def key(self, kind, files, params=None):
+        content = [LAYOUT_CACHE_VERSION, kind, [self.file_digest(path) for path in files], params]
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    '''
+    Input   : key -- from key()
+    Output  : returns the cached value, None on a miss
+    '''
+    def get(self, key):
+        value = None
+        if self.enabled:
+            try:
+                with open(self._path(key), "r") as file:
+                    value = json.load(file)
+                # LRU: the entry mtime is its last use
+                os.utime(self._path(key), None)
+            except (IOError, OSError, ValueError):
+                value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    '''
+    Input   : key -- from key()
+              value -- json serializable value
+    Modify  : stores the entry and evicts the least recently used ones beyond max_entries
+    '''
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        try:
+            self._write_json(self._path(key), value)
+            self.evict()
+        except (IOError, OSError, TypeError, ValueError):
+            # a failed cache write is only a missed optimization
+            pass
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json") and name != DIGEST_INDEX:
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.cache_dir, name))
+        self._digests = None
+
+    def report(self):
+        return "layout cache: %d hits, %d misses" % (self.hits, self.misses)
+
+'''
+    Input   : obj -- object to snapshot
+              names -- attribute names
+    Output  : returns {name: value} of the attributes of obj that exist
+'''
+def get_attributes(obj, names):
+    return dict((name, getattr(obj, name)) for name in names if hasattr(obj, name))
+
+'''
+    Input   : obj -- object to restore
+              attributes -- {name: value}, from get_attributes()
+'''
+def set_attributes(obj, attributes):
+    for name, value in attributes.items():
+        setattr(obj, str(name), value)
@@ -0,0 +1,208 @@
+'''
+    Readback comparison for RAM/flash images.
+
+    check_ram()/fpga_read_flash() used to compare the readback byte by byte in a Python loop
+    and log one line per mismatched byte, so a badly programmed 100MB image took minutes and
+    flooded the log. compare_buffers() compares 1MB windows at C speed (bytes equality, or
+    NumPy when importable), only looks at the bytes of windows that differ, and returns the
+    mismatches as runs of consecutive bytes:
+        result = compare_buffers(expected, actual)
+        if not result.ok:
+            for line in result.summary_lines(base_address): cv_logger.error(line)
+    The summary is capped, however many bytes differ.
+
+    Run this file directly to benchmark it against the old loop on clean and worst-case images:
+        python memcompare.py [size_in_MB]        (default: 100)
+'''
+import binascii
+import collections
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# bytes compared per window, equal windows cost one C level compare
+COMPARE_CHUNK_SIZE = 1 << 20
+# runs recorded by default, the mismatched byte count is always exact
+MAX_RUNS = 1024
+# runs written by summary_lines() by default
+MAX_LOG_LINES = 16
+
+'''
+    offset -- offset of the first mismatched byte
+    length -- number of consecutive mismatched bytes
+    expected, actual -- first expected and actual byte of the run, actual is None past the end of the readback
+'''
+MismatchRun = collections.namedtuple("MismatchRun", "offset length expected actual")
+
+class Comparison(object):
+    '''
+    Input   : expected_length, actual_length -- sizes of the compared buffers
+    '''
+    def __init__(self, expected_length, actual_length):
+        self.expected_length = expected_length
+        self.actual_length = actual_length
+        self.runs = []
+        self.total_runs = 0
+        self.mismatched_bytes = 0
+        # end offset of the last run when it reaches the end of the last window compared
+        self._open_end = None
+
+    @property
+    def ok(self):
+        return self.mismatched_bytes == 0 and self.expected_length == self.actual_length
+
+    def __bool__(self):
+        return self.ok
+    __nonzero__ = __bool__
+
+    '''
+    Input   : offset -- offset of the compared window
+              window_length -- size of the window
+              diff -- _diff_runs() of the window
+              max_runs -- runs to record in total
+    '''
+    def _add(self, offset, window_length, diff, max_runs):
+        runs, mismatched_bytes, total_runs, ends_with_mismatch = diff
+        self.mismatched_bytes += mismatched_bytes
+        self.total_runs += total_runs
+        if runs and runs[0][0] == 0 and self._open_end == offset:
+            # continuation of the run the previous window ended with
+            self.total_runs -= 1
+            last = self.runs[-1] if self.runs else None
+            if last and last.offset + last.length == offset:
+                self.runs[-1] = last._replace(length=last.length + runs[0][1])
+            runs = runs[1:]
+        for run_offset, length, expected, actual in runs[:max(0, max_runs - len(self.runs))]:
+            self.runs.append(MismatchRun(offset + run_offset, length, expected, actual))
+        self._open_end = offset + window_length if ends_with_mismatch else None
+
+    '''
+    Optional: base_address -- added to the offsets, eg. flash start address
+              max_lines -- runs to describe, the rest is only counted
+    Output  : returns the log lines summarizing the mismatches, empty if the buffers match
+    '''
+    def summary_lines(self, base_address=0, max_lines=MAX_LOG_LINES):
+        lines = []
+        if self.expected_length != self.actual_length:
+            lines.append("Readback length is %d, expected %d bytes" % (self.actual_length, self.expected_length))
+        if self.mismatched_bytes:
+            lines.append("%d bytes mismatched in %d runs" % (self.mismatched_bytes, self.total_runs))
+        for run in self.runs[:max_lines]:
+            actual = "nothing" if run.actual is None else "0x%02x" % run.actual
+            lines.append("Data mismatched at 0x%08x (%d bytes): expected 0x%02x but found %s" %
+                (base_address + run.offset, run.length, run.expected, actual))
+        if self.total_runs > max_lines:
+            lines.append("... %d more mismatched runs not shown" % (self.total_runs - max_lines))
+        return lines
+
+# maps every non zero byte to 1
+_NONZERO = bytes(bytearray([0] + [1] * 255))
+
+def _chunk(data, start, end):
+    chunk = data[start:end]
+    return chunk if isinstance(chunk, bytearray) else bytearray(chunk)
+
+'''
+    Input   : expected, actual -- equal size bytearrays
+              limit -- number of runs to return
+    Output  : returns (runs, mismatched_bytes, total_runs, ends_with_mismatch)
+              runs -- the first limit runs as (offset, length, expected, actual)
+'''
+def _diff_runs(expected, actual, limit, use_numpy):
+    if use_numpy:
+        different = numpy.frombuffer(bytes(expected), dtype=numpy.uint8) != numpy.frombuffer(bytes(actual), dtype=numpy.uint8)
+        positions = numpy.flatnonzero(different)
+        breaks = numpy.flatnonzero(numpy.diff(positions) != 1)
+        starts = positions[numpy.concatenate(([0], breaks + 1))].tolist()
+        ends = (positions[numpy.concatenate((breaks, [len(positions) - 1]))] + 1).tolist()
+        bounds = list(zip(starts, ends))
+        mismatched_bytes, total_runs, ends_with_mismatch = len(positions), len(bounds), bool(different[-1])
+    else:
+        # XOR of the two windows as one big int, then the non zero bytes are mismatches, all at C speed
+        xor = int(binascii.hexlify(expected), 16) ^ int(binascii.hexlify(actual), 16)
+        flags = b'\x00' + binascii.unhexlify('%0*x' % (2 * len(expected), xor)).translate(_NONZERO) + b'\x00'
+        mismatched_bytes = len(flags) - flags.count(b'\x00')
+        total_runs = flags.count(b'\x00\x01')
+        ends_with_mismatch = flags[-2:-1] == b'\x01'
+        # flags[i + 1] is byte i, so a "\x00\x01" at i starts a run at i and a "\x01\x00" at i ends it before i
+        bounds = []
+        start = flags.find(b'\x00\x01')
+        while start >= 0 and len(bounds) < limit:
+            end = flags.find(b'\x01\x00', start + 1)
+            bounds.append((start, end))
+            start = flags.find(b'\x00\x01', end)
+    runs = [(start, end - start, expected[start], actual[start]) for start, end in bounds[:limit]]
+    return runs, mismatched_bytes, total_runs, ends_with_mismatch
+
+'''
+    Input   : expected, actual -- bytes/bytearray/Bitstream/list of byte values
+    Optional: max_runs -- runs recorded in the result, the others are only counted
+              use_numpy -- False to force the pure Python path
+    Output  : returns a Comparison, true if both buffers are identical
+'''
+def compare_buffers(expected, actual, max_runs=MAX_RUNS, use_numpy=True):
+    use_numpy = use_numpy and numpy is not None
+    if isinstance(actual, list):
+        actual = bytearray(actual)
+    result = Comparison(len(expected), len(actual))
+    length = min(len(expected), len(actual))
+    for start in range(0, length, COMPARE_CHUNK_SIZE):
+        end = min(start + COMPARE_CHUNK_SIZE, length)
+        old, new = _chunk(expected, start, end), _chunk(actual, start, end)
+        if old == new:
+            result._open_end = None
+            continue
+        # one more than needed, so a run continuing the previous window is always seen
+        limit = max(0, max_runs - len(result.runs)) + 1
+        result._add(start, end - start, _diff_runs(old, new, limit, use_numpy), max_runs)
+    if len(actual) < len(expected):
+        missing = len(expected) - length
+        result._add(length, missing, ([(0, missing, _chunk(expected, length, length + 1)[0], None)], missing, 1, True), max_runs)
+    return result
+
+###########################################################################################
+#   Benchmark
+###########################################################################################
+# The legacy loop takes minutes on 100MB, so it is timed on a LEGACY_SAMPLE sized slice
+# and extrapolated linearly (without the per byte logging, which made it even slower).
+LEGACY_SAMPLE = 1 << 20
+
+def _legacy_compare(expected, actual):
+    mismatches = 0
+    for i in range(len(expected)):
+        if expected[i] ^ actual[i]:
+            mismatches += 1
+    return mismatches
+
+def _timeit(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+def benchmark(size_mb=100):
+    import os
+    expected = bytearray(os.urandom(size_mb << 20))
+    # worst case: every other byte differs, ie. one run per 2 bytes
+    worst = bytearray(expected)
+    worst[::2] = expected[::2].translate(bytes(bytearray((i ^ 0xFF) for i in range(256))))
+    images = [("clean", bytearray(expected)), ("worst case", worst)]
+    for name, actual in images:
+        print("%s image: %d MB" % (name, size_mb))
+        t_legacy, _ = _timeit(_legacy_compare, expected[:LEGACY_SAMPLE], actual[:LEGACY_SAMPLE])
+        t_legacy = t_legacy * len(expected) / LEGACY_SAMPLE
+        print("  legacy loop   : %8.2f s (extrapolated from %d KB)" % (t_legacy, LEGACY_SAMPLE >> 10))
+        t_pure, result = _timeit(compare_buffers, expected, actual, MAX_RUNS, False)
+        print("  compare       : %8.3f s (%.0fx), %d bytes in %d runs" %
+            (t_pure, t_legacy / max(t_pure, 1e-9), result.mismatched_bytes, result.total_runs))
+        if numpy is not None:
+            t_np, result = _timeit(compare_buffers, expected, actual)
+            print("  numpy         : %8.3f s (%.0fx)" % (t_np, t_legacy / max(t_np, 1e-9)))
+        else:
+            print("  numpy         : not installed, skipped")
+
+if __name__ == "__main__":
+    benchmark(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,196 @@
+'''
+    Partition table of a pfg .map file.
+
+    A .map file lists one flash block per line:
+        BLOCK                   START ADDRESS   END ADDRESS
+        MBR                     0x00000000      0x000001FF
+        PARTITION_A2 (CONFIG)   0x00100000      0x03FFFFFF
+        BOOT_INFO               0x00000000      0x0020FFFF
+        P1                      0x00730000      0x00C2FFFF
+    QspiTest.map_get_rsu_add() used to run one re.search per block name on every line, and
+    unanchored patterns such as r'P1\s+' also matched inside other block names. PartitionTable
+    tokenizes every line once with a single anchored pattern and looks the block name up.
+
+    The blocks of the RSU image (BOOT_INFO, FACTORY_IMAGE, SPTn, CPBn, Pn, PUF) are relative
+    to PARTITION_A2 when the flash has partitions, the others are absolute flash addresses.
+
+    Run this file directly to benchmark the tokenizer against the old per-pattern loop:
+        python partitiontable.py [n_images ...]      (default: 5 64 512)
+'''
+import collections
+import re
+import sys
+import time
+
+# block name (with an optional " (LABEL)"), start and end address, anything after is ignored
+_ENTRY = re.compile(r'\s*([A-Za-z]\w*)(?:\s+\((\w+)\))?\s+(0[xX][0-9a-fA-F]+|\d+)\s+(0[xX][0-9a-fA-F]+|\d+)(?:\s|$)')
+# blocks inside PARTITION_A2, ie. the RSU image
+_A2_RELATIVE = re.compile(r'(BOOT_INFO|FACTORY_IMAGE|SPT\d+|CPB\d+|P\d+|PUF)$')
+A2_PARTITION = "PARTITION_A2"
+
+# block name -> prefix of the legacy QspiTest attributes, eg. P1 -> P1_START_ADD / P1_END_ADD
+LEGACY_NAMES = collections.OrderedDict([
+    ("MBR", "MBR"), (A2_PARTITION, "A2_PARTITION"), ("BOOT_INFO", "BOOT_INFO"), ("FACTORY_IMAGE", "FACTORY_IMAGE"),
+    ("SPT0", "SPT0"), ("SPT1", "SPT1"), ("CPB0", "CPB0"), ("CPB1", "CPB1"),
+    ("P1", "P1"), ("P2", "P2"), ("P3", "P3"), ("P4", "P4"), ("P5", "P5"), ("PUF", "PUF"),
+    ("PARTITION_48", "PARTITION_48"), ("PARTITION_A3", "PARTITION_A3")])
+
+'''
+    name -- block name, eg. "P1", "PARTITION_A2"
+    label -- text in brackets after the name, eg. "CONFIG", None if there is none
+    start, end -- addresses as written in the map file (relative to PARTITION_A2 for the RSU image blocks)
+    absolute_start, absolute_end -- flash addresses
+'''
+Partition = collections.namedtuple("Partition", "name label start end absolute_start absolute_end")
+
+class PartitionTable(object):
+    '''
+    Input   : partitions -- list of Partition, in map file order
+    '''
+    def __init__(self, partitions=None):
+        self._partitions = collections.OrderedDict()
+        for partition in (partitions or []):
+            self._partitions[partition.name] = partition
+
+    '''
+    Input   : lines -- lines of a .map file (str or bytes)
+    Output  : returns the PartitionTable, the last line wins if a block is listed twice
+    '''
+    @classmethod
+    def parse(cls, lines):
+        entries = collections.OrderedDict()
+        match = _ENTRY.match
+        for line in lines:
+            if isinstance(line, bytes) and not isinstance(line, str):
+                line = line.decode()
+            entry = match(line)
+            if entry:
+                name, label, start, end = entry.groups()
+                entries[name] = (label, int(start, 0), int(end, 0))
+        a2_start = entries[A2_PARTITION][1] if A2_PARTITION in entries else 0
+        partitions = []
+        for name, (label, start, end) in entries.items():
+            offset = a2_start if _A2_RELATIVE.match(name) else 0
+            partitions.append(Partition(name, label, start, end, start + offset, end + offset))
+        return cls(partitions)
+
+    '''
+    Input   : file_path -- path of the .map file
+    Output  : returns the PartitionTable of the file
+    '''
+    @classmethod
+    def from_file(cls, file_path):
+        with open(file_path, "rb") as file:
+            return cls.parse(file.read().splitlines())
+
+    def __contains__(self, name):
+        return name in self._partitions
+
+    def __getitem__(self, name):
+        return self._partitions[name]
+
+    def __iter__(self):
+        return iter(self._partitions.values())
+
+    def __len__(self):
+        return len(self._partitions)
+
+    def __repr__(self):
+        return "<PartitionTable %s>" % ", ".join(self._partitions)
+
+    def names(self):
+        return list(self._partitions)
+
+    '''
+    Output  : returns the flash address of PARTITION_A2, 0 if the flash has no partitions
+    '''
+    def a2_start(self):
+        return self[A2_PARTITION].absolute_start if A2_PARTITION in self else 0
+
+    '''
+    Output  : returns {attribute: address} of the QspiTest attributes map_get_rsu_add() always set,
+              eg. P1_START_ADD/P1_END_ADD, all absolute flash addresses
+    Note    : MBR end is MBR_INFO_END_ADD and A2_PARTITION_START_ADD is 0 without partitions, as before
+    '''
+    def legacy_attributes(self):
+        attributes = {"A2_PARTITION_START_ADD": 0}
+        for name, prefix in LEGACY_NAMES.items():
+            if name in self:
+                partition = self[name]
+                attributes[prefix + "_START_ADD"] = partition.absolute_start
+                attributes[prefix + ("_INFO_END_ADD" if name == "MBR" else "_END_ADD")] = partition.absolute_end
+        return attributes
+
+    '''
+    Output  : returns the table as a json serializable list, see from_list()
+    '''
+    def to_list(self):
+        return [list(partition) for partition in self]
+
+    @classmethod
+    def from_list(cls, content):
+        return cls([Partition(*[str(item) if isinstance(item, type(u"")) else item for item in partition])
+                    for partition in content])
+
+###########################################################################################
+#   Benchmark
+###########################################################################################
+'''
+    Input   : lines -- lines of a .map file
+    Output  : the original map_get_rsu_add() loop (one re.search per block per line), kept for the
+              benchmark only, returns {attribute: address}
+'''
+def _legacy_parse(lines):
+    attributes = {"A2_PARTITION_START_ADD": 0}
+    patterns = [(r'MBR\s+(\w+)\s+(\w+)', "MBR", False), (r'PARTITION_A2 \(CONFIG\)\s+(\w+)\s+(\w+)', "A2_PARTITION", False),
+        (r'BOOT_INFO\s+(\w+)\s+(\w+)', "BOOT_INFO", True), (r'FACTORY_IMAGE\s+(\w+)\s+(\w+)', "FACTORY_IMAGE", True),
+        (r'SPT0\s+(\w+)\s+(\w+)', "SPT0", True), (r'SPT1\s+(\w+)\s+(\w+)', "SPT1", True),
+        (r'CPB0\s+(\w+)\s+(\w+)', "CPB0", True), (r'CPB1\s+(\w+)\s+(\w+)', "CPB1", True),
+        (r'P1\s+(\w+)\s+(\w+)', "P1", True), (r'P2\s+(\w+)\s+(\w+)', "P2", True), (r'P3\s+(\w+)\s+(\w+)', "P3", True),
+        (r'P4\s+(\w+)\s+(\w+)', "P4", True), (r'P5\s+(\w+)\s+(\w+)', "P5", True), (r'PUF\s+(\w+)\s+(\w+)', "PUF", True),
+        (r'PARTITION_48 \(LITTLEFS\)\s+(\w+)\s+(\w+)', "PARTITION_48", False),
+        (r'PARTITION_A3 \(BACKUP\)\s+(\w+)\s+(\w+)', "PARTITION_A3", False)]
+    for line in lines:
+        for pattern, prefix, relative in patterns:
+            searchObj = re.search(pattern, line)
+            if searchObj:
+                offset = attributes["A2_PARTITION_START_ADD"] if relative else 0
+                attributes[prefix + "_START_ADD"] = int(searchObj.group(1), 0) + offset
+                attributes[prefix + ("_INFO_END_ADD" if prefix == "MBR" else "_END_ADD")] = int(searchObj.group(2), 0) + offset
+    return attributes
+
+def _synthetic_map(n_images):
+    # a pfg map with MBR/partitions, the RSU blocks and n_images application images
+    lines = ["BLOCK                   START ADDRESS   END ADDRESS", "",
+             "MBR                     0x00000000      0x000001FF",
+             "PARTITION_A2 (CONFIG)   0x00100000      0x7FFFFFFF",
+             "BOOT_INFO               0x00000000      0x0020FFFF",
+             "FACTORY_IMAGE           0x00210000      0x0070FFFF",
+             "SPT0                    0x00710000      0x00717FFF",
+             "SPT1                    0x00718000      0x0071FFFF",
+             "CPB0                    0x00720000      0x00727FFF",
+             "CPB1                    0x00728000      0x0072FFFF"]
+    for image in range(1, n_images + 1):
+        start = 0x00730000 + (image - 1) * 0x00500000
+        lines.append("P%-22d 0x%08X      0x%08X" % (image, start, start + 0x004FFFFF))
+    lines += ["PUF                     0x7FF00000      0x7FF0FFFF",
+              "PARTITION_48 (LITTLEFS) 0x80000000      0x8FFFFFFF",
+              "PARTITION_A3 (BACKUP)   0x90000000      0x9FFFFFFF", "",
+              "Notes:", "- Data checksum for this conversion is 0x12345678"]
+    return lines
+
+def benchmark(image_counts=(5, 64, 512)):
+    for n_images in image_counts:
+        lines = _synthetic_map(n_images)
+        start = time.time()
+        expected = _legacy_parse(lines)
+        t_legacy = time.time() - start
+        start = time.time()
+        attributes = PartitionTable.parse(lines).legacy_attributes()
+        t_table = time.time() - start
+        assert attributes == expected, "PartitionTable differs from the legacy parser"
+        print("map with %4d images (%5d lines): legacy %8.3f ms, PartitionTable %8.3f ms (%.0fx)" %
+            (n_images, len(lines), t_legacy * 1e3, t_table * 1e3, t_legacy / max(t_table, 1e-9)))
+
+if __name__ == "__main__":
+    benchmark([int(arg) for arg in sys.argv[1:]] or (5, 64, 512))
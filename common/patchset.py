@@ -0,0 +1,195 @@
+'''
+    Patch set: a sparse corruption of a base image.
+
+    Corruption tests usually flip 1-8 bytes of a multi-hundred MB RPD. Instead of writing
+    (and re-uploading) a full corrupted copy, a PatchSet records only
+        (offset, original, corrupted)
+    runs against the base image. It can be saved/loaded as a small JSON file, applied to a
+    bitstream, inverted (to recover the good image) and mapped onto the flash sectors that
+    actually need to be re-programmed.
+
+    bit_reversed -- True when the patch bytes are in the bit reversed domain, ie. taken from
+                    the bitstream returned by rpd_get_fw_add()/rpd_get_rsu_fw_add() (the same
+                    domain the QSPI BFM RAM uses); False when they are in rpd file order.
+'''
+import binascii
+import bisect
+import json
+
+from fwval_lib.configuration.bitrev import reverse_bits
+from fwval_lib.configuration.bitstream import Bitstream, copy_bitstream
+
+PATCH_SET_VERSION = 1
+# bytes compared per step when diffing two full images
+DIFF_CHUNK_SIZE = 1 << 16
+
+class PatchSet(object):
+    '''
+    Input   : base_path -- path of the base rpd (file order) the patches apply to
+    Optional: base_size -- size of the base image, taken from base_path if not given
+              patches -- list of (offset, original, corrupted), original/corrupted are bytes
+              bit_reversed -- see module note
+    '''
+    def __init__(self, base_path=None, base_size=None, patches=None, bit_reversed=False):
+        self.base_path = base_path
+        self.base_size = base_size
+        self.bit_reversed = bit_reversed
+        self.patches = []
+        # offsets of self.patches, for bisect
+        self._offsets = []
+        for offset, original, corrupted in (patches or []):
+            self.add(offset, original, corrupted)
+
+    def __len__(self):
+        return len(self.patches)
+
+    def __repr__(self):
+        return "<PatchSet %s: %d patches, %d bytes>" % (self.base_path, len(self.patches), self.patched_bytes())
+
+    '''
+    Input   : offset -- offset in the base image
+              original, corrupted -- byte values (int) or equal length byte strings
+    Modify  : self.patches, runs are kept sorted and adjacent runs are merged
+    '''
+    def add(self, offset, original, corrupted):
+        if isinstance(original, int):
+            original, corrupted = bytearray([original]), bytearray([corrupted])
+        new_original, new_corrupted = bytearray(original), bytearray(corrupted)
+        assert len(new_original) == len(new_corrupted), "PatchSet original and corrupted must have the same size"
+        assert offset >= 0 and (self.base_size is None or offset + len(new_original) <= self.base_size), \
+            "PatchSet offset 0x%08x out of the base image" % offset
+        # bisect on the offsets, only the neighbours can touch the new run
+        position = bisect.bisect_left(self._offsets, offset)
+        if position > 0 and self._offsets[position - 1] + len(self.patches[position - 1][1]) == offset:
+            # extend the previous run in place, diff() adds contiguous bytes one by one
+            position -= 1
+            offset, original, corrupted = self.patches[position]
+            original.extend(new_original)
+            corrupted.extend(new_corrupted)
+        else:
+            original, corrupted = new_original, new_corrupted
+            self.patches.insert(position, (offset, original, corrupted))
+            self._offsets.insert(position, offset)
+        if position + 1 < len(self.patches) and offset + len(original) == self._offsets[position + 1]:
+            _, next_original, next_corrupted = self.patches.pop(position + 1)
+            del self._offsets[position + 1]
+            original.extend(next_original)
+            corrupted.extend(next_corrupted)
+
+    def patched_bytes(self):
+        return sum(len(original) for _, original, _ in self.patches)
+
+    '''
+    Input   : bitstream -- Bitstream whose overlay holds the corruptions
+    Optional: base_path, bit_reversed -- see PatchSet()
+    Output  : returns the PatchSet of every byte that differs from the Bitstream backing image
+    '''
+    @classmethod
+    def from_bitstream(cls, bitstream, base_path=None, bit_reversed=False):
+        assert isinstance(bitstream, Bitstream), "PatchSet.from_bitstream() needs a Bitstream, use diff() for bytearrays"
+        patch_set = cls(base_path or bitstream.file_path, len(bitstream), bit_reversed=bit_reversed)
+        for offset, original, corrupted in bitstream.patches():
+            patch_set.add(offset, original, corrupted)
+        return patch_set
+
+    '''
+    Input   : base, corrupted -- two images of the same size (bytearray or Bitstream)
+    Optional: base_path, bit_reversed -- see PatchSet()
+    Output  : returns the PatchSet that turns base into corrupted
+    '''
+    @classmethod
+    def diff(cls, base, corrupted, base_path=None, bit_reversed=False):
+        assert len(base) == len(corrupted), "PatchSet.diff() images have different size"
+        patch_set = cls(base_path, len(base), bit_reversed=bit_reversed)
+        for start in range(0, len(base), DIFF_CHUNK_SIZE):
+            old = bytearray(base[start:start + DIFF_CHUNK_SIZE])
+            new = bytearray(corrupted[start:start + DIFF_CHUNK_SIZE])
+            if old == new:
+                continue
+            for ith in range(len(old)):
+                if old[ith] != new[ith]:
+                    patch_set.add(start + ith, old[ith], new[ith])
+        return patch_set
+
+    '''
+    Output  : returns the PatchSet that undoes this one (corrupted -> original)
+    '''
+    def inverse(self):
+        return PatchSet(self.base_path, self.base_size,
+            [(offset, corrupted, original) for offset, original, corrupted in self.patches], self.bit_reversed)
+
+    '''
+    Output  : returns this PatchSet with the patch bytes in rpd file order, as needed to
+              build QSPI_WRITE words
+    '''
+    def in_file_order(self):
+        if not self.bit_reversed:
+            return self
+        return PatchSet(self.base_path, self.base_size,
+            [(offset, reverse_bits(original), reverse_bits(corrupted)) for offset, original, corrupted in self.patches])
+
+    '''
+    Input   : bitstream -- bytearray or Bitstream of the base image (same domain as the patches)
+    Optional: revert -- True to write the original bytes back instead
+              check -- True to assert the bytes being replaced match the expected ones
+    Output  : returns a patched copy of bitstream, same type as the input
+    '''
+    def apply(self, bitstream, revert=False, check=True):
+        patched = copy_bitstream(bitstream)
+        for offset, original, corrupted in self.patches:
+            old, new = (corrupted, original) if revert else (original, corrupted)
+            if check:
+                assert bytearray(patched[offset:offset + len(old)]) == old, \
+                    "PatchSet does not match the base image at 0x%08x" % offset
+            patched[offset:offset + len(new)] = new
+        return patched
+
+    '''
+    Input   : sector_size -- flash erase/program granularity in bytes
+    Output  : returns the sorted list of sector offsets touched by the patches
+    '''
+    def sectors(self, sector_size=4096):
+        sectors = set()
+        for offset, original, _ in self.patches:
+            for sector in range(offset - offset % sector_size, offset + len(original), sector_size):
+                sectors.add(sector)
+        return sorted(sectors)
+
+    '''
+    Input   : base -- bytearray or Bitstream of the base image (same domain as the patches)
+              sector -- sector offset, from sectors()
+              sector_size -- sector size used for sectors()
+    Optional: revert -- True to build the sector with the original bytes
+    Output  : returns a bytearray of the full sector content with the patches applied
+    '''
+    def sector_image(self, base, sector, sector_size=4096, revert=False):
+        data = bytearray(base[sector:sector + sector_size])
+        for offset, original, corrupted in self.patches:
+            new = original if revert else corrupted
+            start, end = max(offset, sector), min(offset + len(new), sector + len(data))
+            if start < end:
+                data[start - sector:end - sector] = new[start - offset:end - offset]
+        return data
+
+    '''
+    Input   : file_path -- json file to save/load the patch set
+    '''
+    def save(self, file_path):
+        with open(file_path, "w") as file:
+            json.dump({
+                "version"       : PATCH_SET_VERSION,
+                "base_path"     : self.base_path,
+                "base_size"     : self.base_size,
+                "bit_reversed"  : self.bit_reversed,
+                "patches"       : [[offset, binascii.hexlify(original).decode(), binascii.hexlify(corrupted).decode()]
+                                   for offset, original, corrupted in self.patches],
+            }, file, indent=1)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, "r") as file:
+            content = json.load(file)
+        assert content.get("version") == PATCH_SET_VERSION, "Unsupported patch set version in %s" % file_path
+        return cls(content["base_path"], content["base_size"],
+            [(offset, binascii.unhexlify(original), binascii.unhexlify(corrupted))
+             for offset, original, corrupted in content["patches"]], content["bit_reversed"])
@@ -0,0 +1,163 @@
+'''
+    Concurrent wait for several device pins.
+
+    verify_pin(wait_time_out_check=True) polled nSTATUS, INIT_DONE, CONFIG_DONE and AVST_READY
+    one after the other, every 5ms, each up to DUT_FILTER.time_out_pin: the worst case was
+    the sum of the timeouts, and the connector was read 200 times a second per pin.
+    wait_pins() watches all pins in one loop and returns as soon as every pin reads its
+    expected value:
+        result = wait_pins({"NSTATUS": (nstatus.get_output, 1), "CONFIG_DONE": (config_done.get_output, 1)},
+                           timeout_ms, stats)
+        result.values["NSTATUS"], result.settle_ms["NSTATUS"], result.error_pin
+    PinSettleStats remembers how long every pin took to settle. The poll interval follows it
+    (sleep until a pin is due, then poll at a tenth of its usual settle time, backing off) instead
+    of a fixed 5ms. A pin falling from its expected value to an explicit error value (eg. nSTATUS
+    high then low again) and staying there for ERROR_SETTLE_FACTOR times its slowest settle so far,
+    at least a quarter of the timeout, is reported as settled in an error state without waiting for
+    the full timeout:
+        result = wait_pins(pins, timeout_ms, stats, error_values={"NSTATUS": 0})
+    Only that edge counts: nSTATUS is legitimately low after nCONFIG release or a power cycle until
+    the device is ready, so a pin that never read its expected value during the wait, like a pin
+    merely not at its expected value yet (eg. CONFIG_DONE still low), is waited for until the timeout.
+'''
+import collections
+import time
+
+# poll interval bounds, in millisecond
+MIN_POLL_MS = 1
+MAX_POLL_MS = 50
+# first poll interval of a pin without settle history, doubled after every poll
+INITIAL_POLL_MS = 5
+# settle times kept per pin
+HISTORY_SIZE = 32
+# settle times needed before the settle history shortens the wait for an error value
+MIN_HISTORY = 3
+# a pin at its error value this many times its slowest settle time is in error, but never before this
+# fraction of the timeout (the fraction alone without settle history)
+ERROR_SETTLE_FACTOR = 4
+ERROR_MIN_TIMEOUT_FRACTION = 0.25
+
+class PinSettleStats(object):
+    def __init__(self):
+        self._history = {}
+
+    '''
+    Input   : pin -- pin name, eg. "NSTATUS"
+              settle_ms -- time the pin took to read its expected value
+    '''
+    def record(self, pin, settle_ms):
+        self._history.setdefault(pin, collections.deque(maxlen=HISTORY_SIZE)).append(settle_ms)
+
+    def samples(self, pin):
+        return list(self._history.get(pin, ()))
+
+    '''
+    Output  : returns the median settle time of the pin, None without history
+    '''
+    def typical(self, pin):
+        samples = sorted(self._history.get(pin, ()))
+        return samples[len(samples) // 2] if samples else None
+
+    '''
+    Input   : timeout_ms -- timeout of the wait
+    Output  : returns the time after which a pin reading its error value is in error
+    '''
+    def error_after(self, pin, timeout_ms):
+        samples = self._history.get(pin, ())
+        if len(samples) < MIN_HISTORY:
+            return timeout_ms * ERROR_MIN_TIMEOUT_FRACTION
+        return max(max(samples) * ERROR_SETTLE_FACTOR, timeout_ms * ERROR_MIN_TIMEOUT_FRACTION)
+
+    def report(self):
+        return ", ".join("%s %dms median (%d samples)" % (pin, self.typical(pin), len(self._history[pin]))
+            for pin in sorted(self._history))
+
+class PinWaitResult(object):
+    '''
+    Input   : values -- {pin: last value read}
+              settle_ms -- {pin: time the pin took to read its expected value, None if it never did}
+              elapsed_ms -- time waited
+              polls -- polling rounds
+              error_pin -- pin found settled at its error value, None if none
+    '''
+    def __init__(self, values, settle_ms, elapsed_ms, polls, error_pin=None):
+        self.values = values
+        self.settle_ms = settle_ms
+        self.elapsed_ms = elapsed_ms
+        self.polls = polls
+        self.error_pin = error_pin
+
+    @property
+    def ok(self):
+        return all(settle is not None for settle in self.settle_ms.values()) and self.error_pin is None
+
+    def __bool__(self):
+        return self.ok
+    __nonzero__ = __bool__
+
+def _next_poll_ms(stats, pending, elapsed_ms, backoff_ms):
+    intervals = []
+    for pin in pending:
+        typical = stats.typical(pin)
+        if typical is None:
+            intervals.append(backoff_ms)
+        elif elapsed_ms < typical:
+            # not due yet, sleep half of the remaining usual settle time
+            intervals.append((typical - elapsed_ms) / 2.0)
+        else:
+            # overdue, a tenth of the usual settle time at first, then backing off
+            intervals.append(max(typical / 10.0, backoff_ms))
+    return max(MIN_POLL_MS, min(MAX_POLL_MS, min(intervals)))
+
+'''
+    Input   : pins -- {pin name: (function() reading the pin, expected value)}
+              timeout_ms -- deadline for all the pins together
+    Optional: stats -- PinSettleStats, updated with the settle times and used for the poll interval
+              error_values -- {pin name: value reporting an error}, the only values ending the wait early,
+                              once the pin read its expected value before
+              sleep, clock -- time functions (seconds), for tests
+    Output  : returns the PinWaitResult, once every pin read its expected value in the same round, a pin
+              settled at its error value, or the deadline is over
+    Note    : every pin is read again each round, a pin dropping back from its expected value is waited for again
+'''
+def wait_pins(pins, timeout_ms, stats=None, error_values=None, sleep=time.sleep, clock=time.time):
+    stats = stats if stats is not None else PinSettleStats()
+    error_values = error_values or {}
+    start = clock()
+    settle_ms = dict((pin, None) for pin in pins)
+    # since when a pin reads its error value, to find pins settled in an error state
+    in_error = {}
+    # pins read at their expected value, only those can fall to their error value
+    seen_expected = set()
+    backoff_ms = INITIAL_POLL_MS
+    polls = 0
+    while True:
+        values = dict((pin, read()) for pin, (read, _) in pins.items())
+        polls += 1
+        elapsed_ms = (clock() - start) * 1000.0
+        error_pin = None
+        for pin, (_, expected) in pins.items():
+            if values[pin] == expected:
+                if settle_ms[pin] is None:
+                    settle_ms[pin] = elapsed_ms
+                seen_expected.add(pin)
+                in_error.pop(pin, None)
+                continue
+            settle_ms[pin] = None
+            if pin not in error_values or values[pin] != error_values[pin] or pin not in seen_expected:
+                in_error.pop(pin, None)
+                continue
+            in_error.setdefault(pin, elapsed_ms)
+            if elapsed_ms - in_error[pin] >= stats.error_after(pin, timeout_ms):
+                error_pin = pin
+        pending = [pin for pin in pins if settle_ms[pin] is None]
+        if not pending or error_pin is not None or elapsed_ms >= timeout_ms:
+            break
+        poll_ms = _next_poll_ms(stats, pending, elapsed_ms, backoff_ms)
+        sleep(min(poll_ms, max(0, timeout_ms - elapsed_ms)) / 1000.0)
+        backoff_ms = min(backoff_ms * 2, MAX_POLL_MS)
+
+    if not pending:
+        for pin in pins:
+            stats.record(pin, settle_ms[pin])
+    return PinWaitResult(values, settle_ms, elapsed_ms, polls, error_pin)
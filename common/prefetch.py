@@ -0,0 +1,96 @@
+'''
+    Background prefetching of an iterator.
+
+    Programming or reading the flash alternates CPU work (bit reversal, word packing, decoding)
+    with device round trips. prefetch() runs the producing iterator in a worker thread, so the
+    next item is prepared while the caller is busy with the current one:
+        for sector_offset, plan in prefetch(plans(image)):
+            program(sector_offset, plan)
+    At most depth items are prepared ahead. An exception of the iterator is raised in the caller,
+    and leaving the loop early stops the worker.
+
+    When the device traffic itself must stay on the calling thread (mailbox commands), Pending
+    runs the host side work of one item in the background instead:
+        pending = Pending(compare_buffers, expected, chunk)
+        ...                                 -> next device round trip
+        comparison = pending.result()
+'''
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# seconds between checks whether the consumer went away
+_POLL_INTERVAL = 0.1
+
+'''
+    Input   : iterable -- items to produce in the worker thread
+    Optional: depth -- items prepared ahead of the caller
+    Output  : generator of the items of iterable, in order
+'''
+def prefetch(iterable, depth=1):
+    items = queue.Queue(max(1, depth))
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((True, item, None)):
+                    return
+        except Exception:
+            put((False, None, sys.exc_info()[1]))
+            return
+        put((False, None, None))
+
+    worker = threading.Thread(target=produce)
+    worker.daemon = True
+    worker.start()
+    try:
+        while True:
+            more, item, error = items.get()
+            if error is not None:
+                raise error
+            if not more:
+                return
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
+class Pending(object):
+    '''
+    Input   : func, args -- call to run in a worker thread, started right away
+    '''
+    def __init__(self, func, *args):
+        self._outcome = None
+        self._worker = threading.Thread(target=self._run, args=(func, args))
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _run(self, func, args):
+        try:
+            self._outcome = (func(*args), None)
+        except Exception:
+            self._outcome = (None, sys.exc_info()[1])
+
+    '''
+    Output  : returns the value of the call once it finished, raises its exception in the caller
+    '''
+    def result(self):
+        self._worker.join()
+        value, error = self._outcome
+        if error is not None:
+            raise error
+        return value
@@ -0,0 +1,194 @@
+'''
+    Stratified sampling verification of an image written into QSPI RAM.
+
+    QspiTest.check_ram(random_check=1) read back 16 random 32 bytes windows, reseeding random
+    every time: most regions of the image were never looked at and a failure could not be
+    reproduced. plan_samples() instead picks windows from every region of the firmware layout
+    (descriptors, SSBL/TSBL, trampoline, sync block, main sections, SPT/CPB and the other
+    partitions) and from every flash sector, with a seeded random.Random:
+        plan = plan_samples(len(image), layout_regions(test, len(image)), seed=ram_check_seed())
+        for offset, length in plan: compare image[offset:offset + length] with the read back
+    The windows per region are sized for a detection confidence: a region where at least
+    defect_rate of the windows are corrupted is caught with probability >= confidence.
+    Every window costs a read_back() round trip, so the plan is capped to MAX_READS reads:
+    windows are taken one region at a time in turn, then one flash sector at a time, and a window
+    next to one already taken (MERGE_GAP) is read with it for free. report() gives the confidence
+    reached per region when the budget cut its windows.
+    Rerun with FWVAL_RAM_CHECK_SEED=<seed of the report> to sample the same windows.
+'''
+import bisect
+import collections
+import math
+import os
+import random
+
+DEFAULT_CONFIDENCE = 0.99
+# smallest fraction of corrupted windows in a region that must be detected at DEFAULT_CONFIDENCE
+DEFAULT_DEFECT_RATE = 0.01
+# bytes per sampled window
+SAMPLE_WINDOW = 32
+# every flash sector gets at least one window
+FLASH_SECTOR_SIZE = 64<<10
+# windows closer than this are read back in one go
+MERGE_GAP = 256
+# read_back() calls of a plan
+MAX_READS = 64
+# CMF descriptor in the first 4KB, main image pointer at the end of the second 4KB block
+DESCRIPTOR_SIZE = 8<<10
+
+'''
+    name -- region name, eg. "SSBL", "main2", "SPT0"
+    start, end -- image offsets of the region, end excluded
+'''
+Region = collections.namedtuple("Region", "name start end")
+
+'''
+    Input   : n_windows -- windows in the region
+    Optional: confidence, defect_rate -- see DEFAULT_CONFIDENCE, DEFAULT_DEFECT_RATE
+    Output  : returns the windows to sample so that defect_rate corrupted windows are seen with
+              probability confidence, ie. 1 - (1 - defect_rate)^n >= confidence, capped to n_windows
+'''
+def sample_size(n_windows, confidence=DEFAULT_CONFIDENCE, defect_rate=DEFAULT_DEFECT_RATE):
+    if n_windows <= 0:
+        return 0
+    if confidence >= 1 or defect_rate <= 0:
+        return n_windows
+    if defect_rate >= 1:
+        return 1
+    return max(1, min(n_windows, int(math.ceil(math.log(1 - confidence) / math.log(1 - defect_rate)))))
+
+'''
+    Input   : test -- JtagTest/QspiTest, after get_fw_add()/rpd_get_ssbl_add()/map_get_rsu_add()
+              image_size -- bytes of the image in RAM
+    Output  : returns the list of Region of the layout known by test, clipped to the image
+'''
+def layout_regions(test, image_size):
+    regions = [Region("descriptors", 0, DESCRIPTOR_SIZE)]
+    for name in ("SSBL", "TRAMPOLINE", "SYNC"):
+        start = getattr(test, name + "_START_ADD", None)
+        end = getattr(test, name + "_END_ADD", None)
+        if start is not None and end is not None:
+            regions.append(Region(name, start, end + 1))
+    # MAIN_ADD[0] is a dummy, a main section ends where the next one starts
+    main_starts = list(getattr(test, "MAIN_ADD", None) or [0])[1:]
+    for index, start in enumerate(main_starts):
+        end = main_starts[index + 1] if index + 1 < len(main_starts) else image_size
+        regions.append(Region("main%d" % (index + 1), start, end))
+    table = getattr(test, "PARTITION_TABLE", None)
+    for partition in (table or []):
+        regions.append(Region(partition.name, partition.absolute_start, partition.absolute_end + 1))
+    return [Region(name, start, min(end, image_size)) for name, start, end in regions if 0 <= start < min(end, image_size)]
+
+'''
+    Output  : returns the sampling seed, $FWVAL_RAM_CHECK_SEED if set, a fresh random one otherwise
+'''
+def ram_check_seed():
+    seed = os.environ.get("FWVAL_RAM_CHECK_SEED")
+    return int(seed, 0) if seed else random.SystemRandom().randint(0, 0xFFFFFFFF)
+
+class SamplePlan(object):
+    '''
+    Input   : windows -- list of (offset, length) to read back, in offset order
+              seed -- seed the windows were drawn with
+              regions -- list of (Region, windows sampled in it, windows wanted for the confidence)
+    Optional: defect_rate -- see sample_size()
+    '''
+    def __init__(self, windows, seed, regions, defect_rate=DEFAULT_DEFECT_RATE):
+        self.windows = windows
+        self.seed = seed
+        self.regions = regions
+        self.defect_rate = defect_rate
+
+    def __iter__(self):
+        return iter(self.windows)
+
+    def __len__(self):
+        return len(self.windows)
+
+    @property
+    def sampled_bytes(self):
+        return sum(length for _, length in self.windows)
+
+    '''
+    Output  : returns the probability to catch defect_rate corrupted windows in the region with n windows sampled
+    '''
+    def confidence(self, n):
+        return 1 - (1 - self.defect_rate) ** n if self.defect_rate < 1 else 1.0
+
+    def report(self):
+        regions = ["%s %d" % (region.name, n) if n >= wanted else
+                   "%s %d/%d (%.0f%%)" % (region.name, n, wanted, 100 * self.confidence(n))
+                   for region, n, wanted in self.regions]
+        return "RAM sampling seed %d: %d bytes in %d reads over %d regions (%s)" % (self.seed, self.sampled_bytes,
+            len(self.windows), len(self.regions), ", ".join(regions))
+
+def _sample_indices(rng, start, stop, n):
+    if 2 * n >= stop - start:
+        return rng.sample(list(range(start, stop)), n)
+    indices = set()
+    while len(indices) < n:
+        indices.add(rng.randrange(start, stop))
+    return indices
+
+'''
+    Input   : image_size -- bytes of the image
+    Optional: regions -- list of Region to sample, eg. layout_regions(), the whole image is always one
+              seed -- sampling seed, see ram_check_seed(), the same seed gives the same windows
+              confidence, defect_rate -- see sample_size()
+              window -- bytes per sampled window
+              sector_size -- every sector of this size gets a window, budget permitting
+              max_reads -- read_back() calls of the plan, None for no limit
+    Output  : returns the SamplePlan
+'''
+def plan_samples(image_size, regions=(), seed=None, confidence=DEFAULT_CONFIDENCE, defect_rate=DEFAULT_DEFECT_RATE,
+                 window=SAMPLE_WINDOW, sector_size=FLASH_SECTOR_SIZE, max_reads=MAX_READS):
+    if seed is None:
+        seed = ram_check_seed()
+    rng = random.Random(seed)
+    n_windows = (image_size + window - 1) // window
+    regions = [Region("image", 0, image_size)] + list(regions)
+    draws = []
+    for region in regions:
+        first, last = region.start // window, min(n_windows, (region.end + window - 1) // window)
+        indices = sorted(_sample_indices(rng, first, last, sample_size(last - first, confidence, defect_rate)))
+        rng.shuffle(indices)
+        draws.append(indices)
+    sectors = [rng.randrange(sector // window, min(n_windows, (sector + sector_size + window - 1) // window))
+               for sector in range(0, image_size, sector_size)]
+    rng.shuffle(sectors)
+
+    # windows within MERGE_GAP of a taken one join its read, the others need a read of their own
+    gap = (MERGE_GAP + window - 1) // window
+    picks = []
+    budget = [max_reads]
+    def take(index):
+        position = bisect.bisect_left(picks, index)
+        if position < len(picks) and picks[position] == index:
+            return True
+        joins = (position > 0 and index - picks[position - 1] <= gap) or \
+                (position < len(picks) and picks[position] - index <= gap)
+        if not joins:
+            if budget[0] is not None and budget[0] <= 0:
+                return False
+            if budget[0] is not None:
+                budget[0] -= 1
+        picks.insert(position, index)
+        return True
+
+    taken = [0] * len(regions)
+    for turn in range(max([len(indices) for indices in draws] + [0])):
+        for number, indices in enumerate(draws):
+            if turn < len(indices) and take(indices[turn]):
+                taken[number] += 1
+    for index in sectors:
+        take(index)
+    sampled = [(region, taken[number], len(draws[number])) for number, region in enumerate(regions)]
+
+    windows = []
+    for index in sorted(picks):
+        offset, length = index * window, min(window, image_size - index * window)
+        if windows and offset - (windows[-1][0] + windows[-1][1]) < MERGE_GAP:
+            windows[-1] = (windows[-1][0], offset + length - windows[-1][0])
+        else:
+            windows.append((offset, length))
+    return SamplePlan(windows, seed, sampled, defect_rate)
@@ -0,0 +1,192 @@
+'''
+    Early detection of a rejected configuration.
+
+    Negative tests expecting "JTAG programming time exceeds the maximum" (complete_jtag_config(
+    success=0), pr_jtag_fail()) let the transfer run into its timeout, 60s or 2000s+ on the
+    emulator, although the SDM refused the bitstream in the first seconds and just stopped
+    reading it; nconfig1_qspi(success=0) likewise polls the pins until its timeout. run_watched()
+    runs the transfer in a worker thread and polls rejection probes meanwhile (nSTATUS low,
+    CONFIG_STATUS error state, transfer stalled):
+        result = run_watched(send, [nstatus_probe, stall_probe], abort)
+        if result.rejection: ...        -> aborted early, see result.rejection.reason
+    A probe returns the reason the device rejected the bitstream, or None. Only a reason seen
+    SETTLE_POLLS times in a row counts, then abort() is called to stop the transfer; a transfer
+    still running ABORT_JOIN_TIMEOUT after that raises TransferNotStopped. Polling loops without
+    a transfer to run use RejectionMonitor directly.
+
+    The abort reason is not the error to check: once the transfer stopped, the caller reads what
+    the device reports (probe_reasons() of CONFIG_STATUS, nSTATUS) and the framework's last error,
+    and raises BitstreamRejected(reason, elapsed, evidence, last_error). Its error is what exp_err
+    is matched against. A rejection the device confirmed stands for STALLED_TRANSFER_ERROR, the
+    error the transfer would have run into, an abort without device evidence does not.
+
+    The mode is opt-in (FWVAL_EARLY_ABORT=1, see RunProfile): pycv has no API to cancel a
+    transfer, the abort() of jtag.py closes the connector under the transfer thread and so
+    depends on pycv internals.
+'''
+import threading
+import time
+
+# error the framework reports for a transfer the device stopped reading, what an early abort replaces
+STALLED_TRANSFER_ERROR = "JTAG programming time exceeds the maximum"
+# CONFIG_STATUS states of this class are configuration errors, eg. 0xf0090054
+CONFIG_ERROR_MASK = 0xF0000000
+# consecutive polls a probe must report the same reason for
+SETTLE_POLLS = 3
+# seconds between polls
+POLL_INTERVAL = 0.2
+# a transfer taking this many times as long as a successful one of the same size is stalled
+STALL_FACTOR = 3
+# seconds to wait for the transfer to return after abort()
+ABORT_JOIN_TIMEOUT = 30
+
+class BitstreamRejected(Exception):
+    '''
+    Input   : reason -- what showed the device rejected the bitstream
+              elapsed -- seconds into the transfer
+    Optional: evidence -- device errors read once the transfer stopped, eg. CONFIG_STATUS error fields
+              last_error -- error the framework reported for the aborted transfer
+    '''
+    def __init__(self, reason, elapsed, evidence=None, last_error=None):
+        self.reason = reason
+        self.elapsed = elapsed
+        self.evidence = list(evidence or [])
+        self.last_error = last_error
+        errors = self.evidence + ([str(last_error)] if last_error else [])
+        if self.evidence:
+            errors.insert(0, STALLED_TRANSFER_ERROR)
+        self.error = "; ".join(errors) or "no device error"
+        self.message = "%s (transfer aborted after %.1fs: %s)" % (self.error, elapsed, reason)
+        Exception.__init__(self, self.message)
+
+    @property
+    def confirmed(self):
+        return bool(self.evidence)
+
+class TransferNotStopped(Exception):
+    pass
+
+class WatchResult(object):
+    '''
+    Input   : error -- exception raised by the transfer, None if it returned
+              rejection -- BitstreamRejected if aborted early, None otherwise
+              elapsed -- seconds the transfer ran
+    '''
+    def __init__(self, error, rejection, elapsed):
+        self.error = error
+        self.rejection = rejection
+        self.elapsed = elapsed
+
+class RejectionMonitor(object):
+    '''
+    Input   : probes -- list of function() returning a rejection reason or None, an exception counts as None
+    Optional: settle_polls -- see SETTLE_POLLS
+    '''
+    def __init__(self, probes, settle_polls=SETTLE_POLLS):
+        self.probes = probes
+        self.settle_polls = settle_polls
+        self._reason = None
+        self._count = 0
+
+    '''
+    Output  : returns the rejection reason once a probe reported it settle_polls times in a row, None otherwise
+    '''
+    def poll(self):
+        reason = None
+        for probe in self.probes:
+            try:
+                reason = probe()
+            except Exception:
+                reason = None
+            if reason:
+                break
+        self._count = self._count + 1 if reason and reason == self._reason else (1 if reason else 0)
+        self._reason = reason
+        return reason if reason and self._count >= self.settle_polls else None
+
+'''
+    Input   : probes -- list of function() returning a rejection reason or None, an exception counts as None
+    Output  : returns the list of the reasons the probes report now
+'''
+def probe_reasons(probes):
+    reasons = []
+    for probe in probes:
+        try:
+            reason = probe()
+        except Exception:
+            reason = None
+        if reason:
+            reasons.append(reason)
+    return reasons
+
+'''
+    Input   : response -- CONFIG_STATUS/RECONFIG_STATUS response, [header, state, version, pins, done bits,
+                          error location, error details]
+    Output  : returns the rejection reason if the state is a configuration error, None otherwise
+'''
+def config_status_error(response):
+    if not isinstance(response, list) or len(response) < 2 or response[1] is None:
+        return None
+    state = int(response[1])
+    if state & CONFIG_ERROR_MASK != CONFIG_ERROR_MASK:
+        return None
+    details = [int(value) for value in response[5:7]]
+    return "CONFIG_STATUS state 0x%08x" % state + \
+        (" (error location 0x%x, details 0x%x)" % tuple(details) if len(details) == 2 else "")
+
+'''
+    Input   : expected -- seconds a successful transfer of the same size takes
+    Optional: factor -- see STALL_FACTOR
+    Output  : returns a probe reporting the transfer as stalled once it ran factor times longer, it
+              starts counting at its first call
+'''
+def stall_probe(expected, factor=STALL_FACTOR, clock=time.time):
+    start = []
+    def probe():
+        if not start:
+            start.append(clock())
+        elapsed = clock() - start[0]
+        if elapsed > expected * factor:
+            return "transfer stalled, %.1fs instead of %.1fs" % (elapsed, expected)
+        return None
+    return probe
+
+'''
+    Input   : send -- function() doing the transfer, blocking
+              probes -- list of function() returning a rejection reason or None, an exception counts as None
+              abort -- function() stopping the transfer, called once a rejection is settled
+    Optional: poll_interval -- seconds between polls
+              settle_polls -- see SETTLE_POLLS
+    Output  : returns the WatchResult
+    Note    : raises TransferNotStopped if send() still runs ABORT_JOIN_TIMEOUT after abort()
+'''
+def run_watched(send, probes, abort, poll_interval=POLL_INTERVAL, settle_polls=SETTLE_POLLS, sleep=time.sleep,
+                clock=time.time):
+    errors = []
+    def transfer():
+        try:
+            send()
+        except Exception as e:
+            errors.append(e)
+
+    start = clock()
+    worker = threading.Thread(target=transfer)
+    worker.daemon = True
+    worker.start()
+    monitor = RejectionMonitor(probes, settle_polls)
+    rejection = None
+    while worker.is_alive():
+        reason = monitor.poll()
+        if reason:
+            rejection = BitstreamRejected(reason, clock() - start)
+            abort()
+            worker.join(ABORT_JOIN_TIMEOUT)
+            if worker.is_alive():
+                raise TransferNotStopped("Transfer still running %ds after the abort (%s)" % (ABORT_JOIN_TIMEOUT, reason))
+            break
+        if sleep is time.sleep:
+            # returns as soon as the transfer does
+            worker.join(poll_interval)
+        else:
+            sleep(poll_interval)
+    return WatchResult(errors[0] if errors else None, rejection, clock() - start)
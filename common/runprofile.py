@@ -0,0 +1,108 @@
+'''
+    Resolved environment and toolchain profile of a test run.
+
+    Hot paths asked os.environ for FWVAL_PLATFORM/PYCV_PLATFORM, parsed ACDS_BUILD_NUMBER,
+    ran compare_quartus_version("22.1", ...) and re.search() on DUT_BASE_DIE/DUT_FAMILY on
+    every call (_lib_delay(), jtag_send_sdmcmd(), send_jtag(), prepare_qspi_using_bfm(),
+    rsu_set_prefetcher(), ...). None of it changes during a run, so RunProfile resolves it
+    once, frozen, and the call sites only read booleans:
+        self.run_profile = RunProfile.resolve(compare_quartus_version, dut_family=self.DUT_FAMILY, ...)
+        if self.run_profile.emulator: ...
+    Profiles are memoized per process for the same environment and DUT.
+'''
+import os
+import re
+
+# first build of ACDS 22.1 with the 0x1BC prefetcher entry and without the DCMF offset 0 entry
+PREFETCHER_0X1BC_VERSION = ("22.1", 140)
+# delays and timeouts are scaled on the emulator
+EMULATOR_DELAY_MULTIPLIER = 120
+SDMCMD_TIMEOUT = 60
+EMULATOR_SDMCMD_TIMEOUT = 240
+# send_jtag() timeouts on the emulator, for expected success and expected failure
+EMULATOR_SEND_TIMEOUTS = (4800, 2000)
+
+_PROFILES = {}
+
+class RunProfile(object):
+    '''
+    Input   : keyword arguments, the FIELDS below, missing ones are None
+    Note    : frozen, build it with resolve()
+    '''
+    FIELDS = ("platform", "pycv_platform", "acds_version", "acds_build", "dut_family", "base_die", "rev",
+              # precomputed
+              "emulator", "simics", "nd_die", "agilex_like", "acds_22_1_140", "prefetcher_0x1bc",
+              "delay_multiplier", "sdmcmd_timeout", "send_timeouts", "early_abort", "adaptive_timeouts")
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            object.__setattr__(self, name, fields.pop(name, None))
+        assert not fields, "RunProfile has no field %s" % ", ".join(fields)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RunProfile is frozen")
+
+    def __delattr__(self, name):
+        raise AttributeError("RunProfile is frozen")
+
+    def __repr__(self):
+        return "RunProfile(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.FIELDS)
+
+    '''
+    Input   : timeout -- send_jtag() timeout given by the caller
+              success -- 1 if the configuration is expected to pass
+    Output  : returns the timeout to use, scaled on the emulator
+    '''
+    def send_timeout(self, timeout, success=1):
+        if self.send_timeouts is None:
+            return timeout
+        return self.send_timeouts[0] if success else self.send_timeouts[1]
+
+    '''
+    Input   : compare_version -- compare_quartus_version(a, b), -1/0/1 as a is older/same/newer than b
+    Optional: dut_family, base_die, rev -- of the DUT, None while not identified yet
+              environ -- environment to read, default os.environ
+    Output  : returns the RunProfile, the same object for the same environment and DUT
+    '''
+    @classmethod
+    def resolve(cls, compare_version, dut_family=None, base_die=None, rev=None, environ=None):
+        environ = os.environ if environ is None else environ
+        platform, pycv_platform = environ.get("FWVAL_PLATFORM"), environ.get("PYCV_PLATFORM")
+        acds_version, acds_build = environ.get("ACDS_VERSION"), environ.get("ACDS_BUILD_NUMBER")
+        # FWVAL_EARLY_ABORT=1 stops expected failures once the device rejected the bitstream, see rejectwatch
+        early_abort = environ.get("FWVAL_EARLY_ABORT", "0") == "1"
+        # FWVAL_ADAPTIVE_TIMEOUT=1 lengthens the fixed timeouts of the call sites from measured throughput, see timeoutmodel
+        adaptive_timeouts = environ.get("FWVAL_ADAPTIVE_TIMEOUT", "0") == "1"
+        key = (platform, pycv_platform, acds_version, acds_build, dut_family, base_die, rev, early_abort,
+               adaptive_timeouts)
+        profile = _PROFILES.get(key)
+        if profile is not None:
+            return profile
+
+        try:
+            acds_build = float(acds_build)
+        except (TypeError, ValueError):
+            acds_build = None
+        emulator = platform == "emulator"
+        acds_22_1_140 = False
+        if acds_version:
+            version, build = PREFETCHER_0X1BC_VERSION
+            acds_22_1_140 = (compare_version(version, acds_version) == 0 and acds_build is not None and acds_build >= build) \
+                or compare_version(acds_version, version) == 1
+        family = dut_family or ""
+        profile = _PROFILES[key] = cls(
+            platform=platform, pycv_platform=pycv_platform, acds_version=acds_version, acds_build=acds_build,
+            dut_family=dut_family, base_die=base_die, rev=rev,
+            emulator=emulator,
+            simics=pycv_platform == "simics",
+            nd_die=re.search('[Nn][Dd]', base_die or "") is not None,
+            agilex_like=emulator or "agilex" in family or family == "diamondmesa",
+            acds_22_1_140=acds_22_1_140,
+            prefetcher_0x1bc=acds_22_1_140 and dut_family is not None and family != "stratix10",
+            delay_multiplier=EMULATOR_DELAY_MULTIPLIER if emulator else 1,
+            sdmcmd_timeout=EMULATOR_SDMCMD_TIMEOUT if emulator else SDMCMD_TIMEOUT,
+            send_timeouts=EMULATOR_SEND_TIMEOUTS if emulator else None,
+            early_abort=early_abort,
+            adaptive_timeouts=adaptive_timeouts)
+        return profile
@@ -0,0 +1,181 @@
+'''
+    Timing spans of a test, exported as Chrome trace and per-phase summary.
+
+    Timing was ad hoc self.dut.test_time()/elapsed_time() pairs logged as text around a few
+    steps, so where a 40 minute RSU run spends its time could only be guessed from the logs.
+    A Tracer records nested spans, from a with block or a decorated method:
+        with tracer.span("read data from RAM", "verify"): ...
+        @traced("erase")
+        def erase_qspi_die(self, ...): ...      -> span in self.get_tracer(), if the object has one
+    write() stores <test>.trace.json, to open in chrome://tracing or Perfetto, and <test>.summary.txt,
+    the calls, total and self time (total minus the nested spans) per phase and span name.
+    Files go to $FWVAL_TRACE_DIR, default the current directory.
+'''
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# trace events kept, later spans are only counted in the summary
+MAX_EVENTS = 200000
+
+class Span(object):
+    '''
+    Input   : name -- what is timed, eg. "send_jtag"
+              category -- phase the span belongs to, eg. "erase", "send", "verify"
+              start -- clock() at the start
+    '''
+    def __init__(self, name, category, start, args=None):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = None
+        self.args = args or {}
+        # time spent in the nested spans
+        self.children = 0.0
+
+    @property
+    def elapsed(self):
+        return (self.end if self.end is not None else time.time()) - self.start
+
+class Tracer(object):
+    '''
+    Optional: name -- test name, the file names of write(), default the script name
+    '''
+    def __init__(self, name=None, clock=time.time):
+        self.name = name or os.path.splitext(os.path.basename(sys.argv[0] or ""))[0] or "fwval"
+        self._clock = clock
+        self._origin = clock()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.events = []
+        self.dropped = 0
+        # (category, name): [calls, total, self, max]
+        self.totals = {}
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    '''
+    Output  : returns the innermost open span of the calling thread, None if none
+    '''
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start(self, name, category="step", **args):
+        span = Span(name, category, self._clock(), args)
+        self._stack().append(span)
+        return span
+
+    def finish(self, span, error=None):
+        span.end = self._clock()
+        stack = self._stack()
+        if span in stack:
+            del stack[stack.index(span):]
+        if stack:
+            stack[-1].children += span.elapsed
+        if error is not None:
+            span.args["error"] = error
+        with self._lock:
+            total = self.totals.setdefault((span.category, span.name), [0, 0.0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += span.elapsed
+            total[2] += span.elapsed - span.children
+            total[3] = max(total[3], span.elapsed)
+            if len(self.events) < MAX_EVENTS:
+                self.events.append((span, threading.current_thread().ident))
+            else:
+                self.dropped += 1
+
+    '''
+    Input   : name, category -- see Span
+    Optional: args -- values shown with the span in the trace viewer
+    Output  : context manager timing its with block, yields the Span
+    '''
+    def span(self, name, category="step", **args):
+        return _SpanContext(self, name, category, args)
+
+    def chrome_trace(self):
+        events = []
+        for span, thread in self.events:
+            events.append({"name": span.name, "cat": span.category, "ph": "X", "pid": os.getpid(), "tid": thread,
+                           "ts": int((span.start - self._origin) * 1e6), "dur": int(span.elapsed * 1e6),
+                           "args": dict((key, str(value)) for key, value in span.args.items())})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"test": self.name, "dropped_events": self.dropped}}
+
+    '''
+    Output  : returns the summary rows (category, name, calls, total, self, max), phases by self time first
+    '''
+    def summary(self):
+        phases = {}
+        for (category, _), total in self.totals.items():
+            phases[category] = phases.get(category, 0.0) + total[2]
+        return sorted(((category, name) + tuple(total) for (category, name), total in self.totals.items()),
+            key=lambda row: (-phases[row[0]], row[0], -row[4], row[1]))
+
+    def report(self):
+        wall = self._clock() - self._origin
+        lines = ["%-10s %-40s %7s %10s %10s %10s %6s" % ("phase", "span", "calls", "total s", "self s", "max s", "self%")]
+        for category, name, calls, total, self_time, longest in self.summary():
+            lines.append("%-10s %-40s %7d %10.3f %10.3f %10.3f %5.1f%%" % (category, name[:40], calls, total, self_time,
+                longest, 100.0 * self_time / wall if wall > 0 else 0))
+        lines.append("wall time %.3fs" % wall)
+        return "\n".join(lines)
+
+    '''
+    Optional: directory -- where to write, default $FWVAL_TRACE_DIR or the current directory
+    Output  : returns the paths of the trace and the summary written
+    '''
+    def write(self, directory=None):
+        directory = directory or os.environ.get("FWVAL_TRACE_DIR") or os.getcwd()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        trace_path = os.path.join(directory, "%s.trace.json" % self.name)
+        summary_path = os.path.join(directory, "%s.summary.txt" % self.name)
+        with open(trace_path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+        with open(summary_path, "w") as file:
+            file.write(self.report() + "\n")
+        return trace_path, summary_path
+
+class _SpanContext(object):
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.span = self.tracer.start(self.name, self.category, **self.args)
+        return self.span
+
+    def __exit__(self, error_type, error, traceback):
+        self.tracer.finish(self.span, error_type.__name__ if error_type is not None else None)
+        return False
+
+'''
+    Input   : category -- phase of the decorated method, see Span
+    Optional: name -- span name, default the method name
+    Output  : decorator timing a method in self.get_tracer(), the method runs untimed on objects without one
+    Note    : a method calling the method it overrides is timed once
+'''
+def traced(category, name=None):
+    def decorator(method):
+        span_name = name or method.__name__
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            get_tracer = getattr(self, "get_tracer", None)
+            tracer = get_tracer() if get_tracer is not None else None
+            current = tracer.current() if tracer is not None else None
+            if tracer is None or (current is not None and current.name == span_name):
+                return method(self, *args, **kwargs)
+            with tracer.span(span_name, category):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
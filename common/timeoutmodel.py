@@ -0,0 +1,173 @@
+'''
+    Transfer timeouts derived from measured throughput.
+
+    Timeouts were fixed per call site: send_jtag() 60s, prepare_qspi_using_bfm() 120s (300s on
+    the emulator), fpga_send_data() 10s, jtag_send_sdmcmd() 60/240s, 1200s for a die erase.
+    A hung transfer kept the test waiting for minutes, and a bitstream bigger than the one the
+    timeout was picked for failed spuriously. TimeoutModel keeps the duration of the last
+    successful transfers per platform, interface and operation, and derives a timeout from the
+    payload size:
+        model = TimeoutModel("emulator")
+        timeout = model.timeout("jtag", "send", size) or 60     -> None until MIN_SAMPLES were recorded
+        model.record("jtag", "send", size, elapsed)             -> after a successful transfer
+    Samples are kept per size bucket (a power of two range), a transfer is expected to take as long
+    as the slowest one of its bucket, scaled to its size. Without MIN_SAMPLES in its bucket, a fit of
+    overhead plus per byte rate over all the buckets is used, if the samples span several buckets
+    and the size is at most MAX_EXTRAPOLATION times the biggest one measured: a few 4 byte patches
+    say nothing about a 512MB image. The timeout is SAFETY_FACTOR times the expected duration, plus
+    MARGIN seconds. Operations without a payload (size None) use their slowest duration instead.
+    Callers never go below their own fixed timeout, see JtagTest.transfer_timeout().
+
+    Models are json files in $FWVAL_TIMEOUT_MODEL_DIR (default ~/.fwval/timeout_model), one per
+    platform.
+'''
+import json
+import os
+import time
+
+MODEL_VERSION = 1
+# durations kept per interface, operation and size bucket
+SAMPLES = 16
+# durations needed before a timeout is derived
+MIN_SAMPLES = 3
+# the overhead plus rate fit is not used for sizes beyond this many times the biggest one measured
+MAX_EXTRAPOLATION = 4
+# timeout = SAFETY_FACTOR * expected duration + MARGIN, at least MIN_TIMEOUT, in seconds
+SAFETY_FACTOR = 3
+MARGIN = 5
+MIN_TIMEOUT = 5
+# seconds between two saves of the model, the first sample of an operation is saved right away
+SAVE_INTERVAL = 30
+
+class TimeoutModel(object):
+    '''
+    Input   : platform -- platform name the durations are measured on, eg. "emulator"
+    Optional: model_dir -- directory holding the models
+    '''
+    def __init__(self, platform, model_dir=None, clock=time.time):
+        self.platform = platform or "default"
+        self.model_dir = model_dir or os.environ.get("FWVAL_TIMEOUT_MODEL_DIR") or \
+            os.path.join(os.path.expanduser("~"), ".fwval", "timeout_model")
+        self._clock = clock
+        self._saved = None
+        self.samples = {}
+        self.load()
+
+    @property
+    def path(self):
+        return os.path.join(self.model_dir, "%s.json" % self.platform.replace(os.sep, "_"))
+
+    def load(self):
+        self.samples = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as file:
+                    content = json.load(file)
+                if content.get("version") == MODEL_VERSION:
+                    self.samples = dict((key, [tuple(sample) for sample in samples])
+                        for key, samples in content["samples"].items())
+            except (IOError, ValueError):
+                # a corrupted model only costs the default timeouts, start from scratch
+                self.samples = {}
+
+    def save(self):
+        if not os.path.isdir(self.model_dir):
+            os.makedirs(self.model_dir)
+        temp_path = self.path + ".%d.tmp" % os.getpid()
+        with open(temp_path, "w") as file:
+            json.dump({"version": MODEL_VERSION, "platform": self.platform, "samples": self.samples}, file)
+        os.rename(temp_path, self.path)
+        self._saved = self._clock()
+
+    @staticmethod
+    def key(interface, operation):
+        return "%s/%s" % (interface, operation)
+
+    '''
+    Input   : interface, operation -- what was timed, eg. "jtag", "send"
+              size -- bytes transferred, None for an operation without payload
+              elapsed -- seconds the successful transfer took
+    Optional: save -- False to keep the sample in memory only, until the next save()
+    '''
+    def record(self, interface, operation, size, elapsed, save=True):
+        samples = self.samples.setdefault(self.key(interface, operation), [])
+        samples.append((size, elapsed))
+        bucket = [index for index, (sample_size, _) in enumerate(samples) if size_bucket(sample_size) == size_bucket(size)]
+        for index in reversed(bucket[:-SAMPLES]):
+            del samples[index]
+        if save and (len(samples) == 1 or self._saved is None or self._clock() - self._saved >= SAVE_INTERVAL):
+            try:
+                self.save()
+            except (IOError, OSError):
+                pass
+
+    '''
+    Output  : returns the seconds a transfer of size bytes is expected to take, from the slowest sample of
+              its size bucket or the overhead plus rate fit, None if neither has enough samples
+    '''
+    def estimate(self, interface, operation, size=None):
+        samples = self.samples.get(self.key(interface, operation), [])
+        if not size:
+            durations = [elapsed for sample_size, elapsed in samples if not sample_size]
+            return max(durations) if len(durations) >= MIN_SAMPLES else None
+        bucket = [(sample_size, elapsed) for sample_size, elapsed in samples
+                  if sample_size and size_bucket(sample_size) == size_bucket(size)]
+        if len(bucket) >= MIN_SAMPLES:
+            # sizes within a factor 2, the overhead is scaled too, which only errs on the long side
+            return max(elapsed * max(1.0, size / float(sample_size)) for sample_size, elapsed in bucket)
+        sized = [(sample_size, elapsed) for sample_size, elapsed in samples if sample_size]
+        if not sized or size > MAX_EXTRAPOLATION * max(sample_size for sample_size, _ in sized):
+            return None
+        fit = fit_transfer(sized)
+        if fit is None:
+            return None
+        overhead, rate, spread = fit
+        return (overhead + rate * size) * spread
+
+    '''
+    Output  : returns the timeout in seconds for a transfer of size bytes, None without MIN_SAMPLES durations
+    '''
+    def timeout(self, interface, operation, size=None):
+        expected = self.estimate(interface, operation, size)
+        if expected is None:
+            return None
+        return max(MIN_TIMEOUT, int(SAFETY_FACTOR * expected + MARGIN + 0.5))
+
+    def report(self):
+        lines = []
+        for key in sorted(self.samples):
+            interface, operation = key.split("/", 1)
+            sizes = [size for size, _ in self.samples[key] if size]
+            size = max(sizes) if sizes else None
+            timeout = self.timeout(interface, operation, size)
+            lines.append("%s: %d samples, timeout %s%s" % (key, len(self.samples[key]),
+                "%ds" % timeout if timeout is not None else "default", " for %d bytes" % size if size else ""))
+        return "; ".join(lines)
+
+'''
+    Input   : size -- bytes transferred, None for an operation without payload
+    Output  : returns the size bucket, sizes from 2**(n-1) to 2**n - 1 are in bucket n
+'''
+def size_bucket(size):
+    return int(size).bit_length() if size else None
+
+'''
+    Input   : samples -- list of (size, elapsed) of transfers with payload
+    Output  : returns (overhead, rate, spread), elapsed = (overhead + rate * size) * spread bounding every
+              sample from above, None without MIN_SAMPLES spread over at least two size buckets
+    Note    : least squares fit, overhead and rate are never negative
+'''
+def fit_transfer(samples):
+    if len(samples) < MIN_SAMPLES or len(set(size_bucket(size) for size, _ in samples)) < 2:
+        return None
+    count = float(len(samples))
+    mean_size = sum(size for size, _ in samples) / count
+    mean_elapsed = sum(elapsed for _, elapsed in samples) / count
+    variance = sum((size - mean_size) ** 2 for size, _ in samples)
+    covariance = sum((size - mean_size) * (elapsed - mean_elapsed) for size, elapsed in samples)
+    rate = max(0.0, covariance / variance)
+    overhead = max(0.0, mean_elapsed - rate * mean_size)
+    if overhead == 0 and rate == 0:
+        return None
+    spread = max([1.0] + [elapsed / (overhead + rate * size) for size, elapsed in samples])
+    return overhead, rate, spread
@@ -0,0 +1,91 @@
+'''
+    Event driven waits with exponential backoff and a deadline.
+
+    Configuration and switch flows slept for a fixed time after every connector open, RAM
+    write, power cycle or RSU switch (x120 on the emulator) whether the device was ready or not.
+    wait_for() polls a condition instead, quickly at first and then backing off, and returns
+    as soon as it holds or once the deadline is over:
+        result = wait_for(lambda: nstatus.get_output() == 1, timeout=20)
+        if not result: ...                          -> deadline reached, result.value is the last poll
+    WaitLedger records every wait against the fixed sleep it replaced, so the time saved can
+    be logged per wait and for the whole test.
+'''
+import time
+
+# seconds before the second poll, doubled after every poll up to MAX_INTERVAL
+INITIAL_INTERVAL = 0.005
+BACKOFF_FACTOR = 2
+MAX_INTERVAL = 0.5
+
+class WaitResult(object):
+    '''
+    Input   : ok -- True if the condition held before the deadline
+              elapsed -- seconds waited
+              polls -- times the condition was evaluated
+              value -- last value returned by the condition
+    '''
+    def __init__(self, ok, elapsed, polls, value):
+        self.ok = ok
+        self.elapsed = elapsed
+        self.polls = polls
+        self.value = value
+
+    def __bool__(self):
+        return self.ok
+    __nonzero__ = __bool__
+
+'''
+    Input   : condition -- function() returning a true value once the awaited event happened
+    Output  : returns condition, returning False instead of raising, eg. for a mailbox not answering yet
+'''
+def quiet(condition):
+    def probe():
+        try:
+            return condition()
+        except Exception:
+            return False
+    return probe
+
+'''
+    Input   : condition -- function() returning a true value once the awaited event happened
+              timeout -- deadline in seconds, the condition is always evaluated at least once
+    Optional: interval, factor, max_interval -- backoff between polls, in seconds
+              sleep, clock -- time functions, for tests
+    Output  : returns the WaitResult
+'''
+def wait_for(condition, timeout, interval=INITIAL_INTERVAL, factor=BACKOFF_FACTOR, max_interval=MAX_INTERVAL,
+             sleep=time.sleep, clock=time.time):
+    start = clock()
+    deadline = start + timeout
+    polls = 0
+    while True:
+        value = condition()
+        polls += 1
+        now = clock()
+        if value:
+            return WaitResult(True, now - start, polls, value)
+        if now >= deadline:
+            return WaitResult(False, now - start, polls, value)
+        sleep(max(0, min(interval, deadline - now)))
+        interval = min(interval * factor, max_interval)
+
+class WaitLedger(object):
+    def __init__(self):
+        # list of (name, seconds of the fixed sleep replaced, WaitResult)
+        self.records = []
+
+    def record(self, name, legacy, result):
+        self.records.append((name, legacy, result))
+
+    @property
+    def waited(self):
+        return sum(result.elapsed for _, _, result in self.records)
+
+    @property
+    def saved(self):
+        return sum(legacy - result.elapsed for _, legacy, result in self.records)
+
+    def report(self):
+        timeouts = sum(1 for _, _, result in self.records if not result.ok)
+        return "waits: %d (%d reached the deadline), %.1fs waited instead of %.1fs of fixed sleeps, %.1fs saved" % \
+            (len(self.records), timeouts, self.waited, self.waited + self.saved, self.saved)
@@ -11,6 +11,7 @@ import fwval
 
 #yi zhi's library
 import fwval_lib
+from fwval_lib.configuration.bitstream import Bitstream, as_bytearray
 
 # Dictionary holding the opcode enumeration for mbox cmds
 opcode = {
@@ -79,13 +80,14 @@ def main():
         test.map_get_rsu_add(map_file)
         
         # Get more FW address from .rpd file
-        bitstream = test.rpd_get_rsu_fw_add(rpd_file)
+        rsu_bitstream = test.rpd_get_rsu_fw_add(rpd_file)
+        # the bytes are corrupted and written below, so a real copy of the reversed view is needed
+        bitstream = as_bytearray(rsu_bitstream)
+        rsu_bitstream.close()
         
         # Write into reverse_file
         reverse_file = "reverse.rpd"
-        fw1 = open(reverse_file, "wb")
-        fw1.write(bitstream)
-        fw1.close()
+        test.write_bitstream_to_file(bitstream=bitstream, file_path=reverse_file)
 
         #******************* MBR signature corruption started******************#
         acds_version = os.environ.get("ACDS_VERSION")
@@ -93,14 +95,13 @@ def main():
         if(dut_opn=="FM7") and (fwval_lib.compare_quartus_version(acds_version , "22.1")==0):
             print("MBR signature corruption")
             # Prepare corrupted bitstream for MBR
-            corrupted_mbr_bitstream = bytearray(bitstream)
+            # zero-copy wrapper, corruptions are kept in an overlay on top of bitstream
+            corrupted_mbr_bitstream = Bitstream(bitstream)
             mbr_corrupt_offset = test.select_addr( location="mbr")
             corrupted_mbr_bitstream = test.corrupt_bitstream( corrupted_mbr_bitstream, offset=mbr_corrupt_offset, size=8)
             # Write into corrupted_file
             mbr_corrupted_file = "corrupted_mbr.rpd"
-            fw1 = open(mbr_corrupted_file, "wb")
-            fw1.write(corrupted_mbr_bitstream)
-            fw1.close()
+            test.write_bitstream_to_file(bitstream=corrupted_mbr_bitstream, file_path=mbr_corrupted_file)
             
             # Set nconfig low
             test.power.set_power(False)
@@ -139,7 +140,8 @@ def main():
         #******************* MBR signature corruption ended******************#
         
         # Prepare corrupted bitstream
-        corrupted_bitstream = bytearray(bitstream)
+        # zero-copy wrapper, corruptions are kept in an overlay on top of bitstream
+        corrupted_bitstream = Bitstream(bitstream)
         if ( re.search( r'P1', c_image) ):
             corrupt_image = "P1"
             
@@ -154,9 +156,7 @@ def main():
         
         # Write into corrupted_file
         corrupted_file = "corrupted.rpd"
-        fw1 = open(corrupted_file, "wb")
-        fw1.write(corrupted_bitstream)
-        fw1.close()
+        test.write_bitstream_to_file(bitstream=corrupted_bitstream, file_path=corrupted_file)
         
         # Set nconfig low
         test.power.set_power(False)
@@ -226,7 +226,7 @@ def main():
         
         # Switch image
         test.rsu_switch_image(switch_offset)
-        fwval_lib.delay(1000)
+        test.wait_for_reconfig(legacy_ms=1000)
         #test.verify_qspi_bfm_status()
         
         # verify RSU status
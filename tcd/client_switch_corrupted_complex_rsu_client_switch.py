@@ -11,6 +11,8 @@ import fwval
 
 #yi zhi's library
 import fwval_lib
+from fwval_lib.configuration.bitstream import Bitstream, as_bytearray
+from fwval_lib.configuration.patchset import PatchSet
 
 # Dictionary holding the opcode enumeration for mbox cmds
 opcode = {
@@ -78,26 +80,22 @@ def main():
         test.map_get_rsu_add(map_file)
         
         # Get more FW address from .rpd file
-        bitstream = test.rpd_get_rsu_fw_add(rpd_file)
-        
-        # Write into reverse_file
-        reverse_file = "reverse.rpd"
-        fw1 = open(reverse_file, "wb")
-        fw1.write(bitstream)
-        fw1.close()
+        rsu_bitstream = test.rpd_get_rsu_fw_add(rpd_file)
+        # the bytes are corrupted and written below, so a real copy of the reversed view is needed
+        bitstream = as_bytearray(rsu_bitstream)
+        rsu_bitstream.close()
 
         #******************* MBR signature corruption started******************#
         if(dut_opn=="FM7") and (fwval_lib.compare_quartus_version(acds_version , "22.1")==0):
             print("MBR signature corruption")
             # Prepare corrupted bitstream for MBR
-            corrupted_mbr_bitstream = bytearray(bitstream)
+            # zero-copy wrapper, corruptions are kept in an overlay on top of bitstream
+            corrupted_mbr_bitstream = Bitstream(bitstream)
             mbr_corrupt_offset = test.select_addr( location="mbr")
             corrupted_mbr_bitstream = test.corrupt_bitstream( corrupted_mbr_bitstream, offset=mbr_corrupt_offset, size=8)
             # Write into corrupted_file
             mbr_corrupted_file = "corrupted_mbr.rpd"
-            fw1 = open(mbr_corrupted_file, "wb")
-            fw1.write(corrupted_mbr_bitstream)
-            fw1.close()
+            test.write_bitstream_to_file(bitstream=corrupted_mbr_bitstream, file_path=mbr_corrupted_file)
             
             # Set nconfig low
             test.power.set_power(False)
@@ -136,7 +134,8 @@ def main():
         #******************* MBR signature corruption ended******************#
         
         # Prepare corrupted bitstream
-        corrupted_bitstream = bytearray(bitstream)
+        # zero-copy wrapper, corruptions are kept in an overlay on top of bitstream
+        corrupted_bitstream = Bitstream(bitstream)
         size = 1
         corrupt_image = "P1"
         corrupt_app1_offset = test.select_addr( location=corrupt, image=corrupt_image)
@@ -146,17 +145,11 @@ def main():
         corrupt_app3_offset = test.select_addr( location=corrupt, image=corrupt_image)
         corrupted_bitstream = test.corrupt_bitstream( corrupted_bitstream, offset=corrupt_app3_offset, size=size)
         
-        # prepare fastcorrupt file - must write all bitstream into RAM first
-        fastcorrupt_app1_file = "fastcorrupt_app1_"+rpd_file
-        fastcorrupt_app3_file = "fastcorrupt_app3_"+rpd_file
-        print("INFO :: Writing the recorrupt bitstream to file %s and %s" %(fastcorrupt_app1_file,fastcorrupt_app3_file))
-        test.write_bitstream_to_file(bitstream=corrupted_bitstream, start=corrupt_app1_offset, end=corrupt_app1_offset+size, file_path=fastcorrupt_app1_file)
-        fastcorrupt_app1_bitstream = corrupted_bitstream[corrupt_app1_offset:corrupt_app1_offset+size]
-        test.write_bitstream_to_file(bitstream=corrupted_bitstream, start=corrupt_app3_offset, end=corrupt_app3_offset+size, file_path=fastcorrupt_app3_file)
-        fastcorrupt_app3_bitstream = corrupted_bitstream[corrupt_app3_offset:corrupt_app3_offset+size]
-        
-        fullcorrupt_app1_app3_file = "fullcorrupt_app1_app3_"+rpd_file
-        test.write_bitstream_to_file(bitstream=corrupted_bitstream, start=0, end=len(corrupted_bitstream), file_path=fullcorrupt_app1_app3_file)
+        # record the app1/app3 corruption as a patch set - good bitstream must be written first
+        corrupt_patch_set = PatchSet.from_bitstream(corrupted_bitstream, base_path=rpd_file, bit_reversed=True)
+        corrupt_patch_file = "corrupt_app1_app3_"+rpd_file+".patch.json"
+        print("INFO :: Writing the corruption patch set %s to file %s" %(corrupt_patch_set, corrupt_patch_file))
+        corrupt_patch_set.save(corrupt_patch_file)
 
 
         # # prepare recover file
@@ -229,7 +222,7 @@ def main():
         
         try:
             test.rsu_switch_image(switch_offset)
-            fwval_lib.delay(1000)
+            test.wait_for_reconfig(legacy_ms=1000)
             #test.verify_qspi_bfm_status()
             
             # verify RSU status
@@ -254,7 +247,7 @@ def main():
         try:
             # switch image
             test.rsu_switch_image(switch_offset)
-            fwval_lib.delay(1000)
+            test.wait_for_reconfig(legacy_ms=1000)
             #test.verify_qspi_bfm_status()
             
             # verify RSU status
@@ -272,11 +265,14 @@ def main():
         # corrupt existing app1 image
         fwval_lib.print_stdout()
         print("TEST :: Corrupted existing app1 and app3")
-        # Write bitstream into RAM
+        # Write only the corrupted bytes into RAM
         if not test.daughter_card:
-            test.prepare_qspi_rsu( bitstream=fastcorrupt_app1_bitstream, offset=corrupt_app1_offset, check_ram=0) 
-            test.prepare_qspi_rsu( bitstream=fastcorrupt_app3_bitstream, offset=corrupt_app3_offset, check_ram=0) 
+            test.prepare_qspi_rsu(file_path=rpd_file, offset=0, check_ram=0, patch_set=corrupt_patch_set)
         else:
+            # daughter card: program the full corrupted image with reconfig=1, as before
+            fullcorrupt_app1_app3_file = "fullcorrupt_app1_app3_"+rpd_file
+            test.write_bitstream_to_file(bitstream=corrupted_bitstream, start=0, end=len(corrupted_bitstream), file_path=fullcorrupt_app1_app3_file)
+            fastcorrupt_app3_bitstream = corrupted_bitstream[corrupt_app3_offset:corrupt_app3_offset+size]
             test.prepare_qspi_rsu(file_path=fullcorrupt_app1_app3_file, bitstream=fastcorrupt_app3_bitstream, offset=0, reverse=True, reconfig=1)
         
         # Switch image to App 1
@@ -288,7 +284,7 @@ def main():
         
         try:
             test.rsu_switch_image(switch_offset)
-            fwval_lib.delay(1000)
+            test.wait_for_reconfig(legacy_ms=1000)
             #test.verify_qspi_bfm_status()
             
             # verify RSU status
@@ -312,7 +308,7 @@ def main():
         
         try:
             test.rsu_switch_image(switch_offset)
-            fwval_lib.delay(1000)
+            test.wait_for_reconfig(legacy_ms=1000)
             #test.verify_qspi_bfm_status()
             
             # verify RSU status
@@ -180,7 +180,7 @@ def main():
         ## Attempt RSU Switch image to a non-existent image
         #/ Expect fail to boot from the switch image & P1 image is used for boot up
         test.rsu_switch_image(switch_offset)
-        fwval_lib.delay(1000)
+        test.wait_for_reconfig(legacy_ms=1000)
         
         ## Verify RSU boot up from P1 Image & last failed image states switch offset value
         test.update_exp_rsu(current_image=test.P1_START_ADD, last_fail_image=switch_offset, state=1)
@@ -0,0 +1,19 @@
+'''
+    The modules of common/ are deployed as fwval_lib.configuration.<module>. Outside of the
+    test environment the package is mapped onto common/, so the pure helpers can be tested
+    from a checkout.
+'''
+import os
+import sys
+import types
+
+COMMON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common")
+
+try:
+    import fwval_lib.configuration
+except ImportError:
+    for name, path in (("fwval_lib", []), ("fwval_lib.configuration", [COMMON_DIR])):
+        sys.modules.pop(name, None)
+        module = sys.modules[name] = types.ModuleType(name)
+        module.__path__ = path
+    sys.modules["fwval_lib"].configuration = sys.modules["fwval_lib.configuration"]
@@ -0,0 +1,62 @@
+'''
+    plan_erase() against the per sector erase loop of fpga_add_new_qspi_image().
+'''
+import random
+
+import pytest
+
+from fwval_lib.configuration.eraseplan import ERASE_SIZES, plan_erase
+
+'''
+    Output  : returns the (address, size) commands the old loop sent, one per sector from start_address
+'''
+def per_sector_erase(start_address, length, sector_size):
+    return [(start_address + offset, sector_size) for offset in range(0, length, sector_size)]
+
+def erased_units(commands, unit):
+    units = set()
+    for address, size in commands:
+        units.update(range(address, address + size, unit))
+    return units
+
+@pytest.mark.parametrize("start_address, length", [
+    (0, 1), (0, 4 << 10), (0, 64 << 10), (4 << 10, 200 << 10), (60 << 10, 12 << 10), (0x100000, 5 << 20),
+    (0x3000, (1 << 20) + 123),
+])
+def test_erases_what_the_loop_erased(start_address, length):
+    legacy = per_sector_erase(start_address, length, 4 << 10)
+    plan = plan_erase([(start_address, length)], legacy_size=4 << 10)
+    assert erased_units(plan, 4 << 10) == erased_units(legacy, 4 << 10)
+    assert plan.legacy_commands == len(legacy)
+    assert len(plan) <= len(legacy)
+    for address, size in plan:
+        assert size in ERASE_SIZES
+        assert address % size == 0
+
+def test_biggest_sectors_inside():
+    plan = plan_erase([(0x3000, 0x22000)])
+    assert list(plan) == [(0x3000, 4 << 10), (0x4000, 4 << 10), (0x5000, 4 << 10), (0x6000, 4 << 10),
+                          (0x7000, 4 << 10), (0x8000, 32 << 10), (0x10000, 64 << 10), (0x20000, 4 << 10),
+                          (0x21000, 4 << 10), (0x22000, 4 << 10), (0x23000, 4 << 10), (0x24000, 4 << 10)]
+
+def test_64k_only():
+    legacy = per_sector_erase(0, 300 << 10, 64 << 10)
+    plan = plan_erase([(0, 300 << 10)], (64 << 10,))
+    assert list(plan) == legacy
+
+def test_known_blank_sectors():
+    rng = random.Random(0)
+    blank = set(address for address in range(0, 1 << 20, 4 << 10) if rng.random() < 0.5)
+    is_blank = lambda address, size: all(unit in blank for unit in range(address, address + size, 4 << 10))
+    plan = plan_erase([(0, 1 << 20)], is_blank=is_blank)
+    erased = erased_units(plan, 4 << 10)
+    # every dirty sector is erased, nothing outside the range
+    assert erased >= set(range(0, 1 << 20, 4 << 10)) - blank
+    assert max(erased) < 1 << 20
+    assert plan.blank_bytes == len(blank) * (4 << 10)
+
+def test_several_ranges():
+    ranges = [(0, 10 << 10), (0x20000, 70 << 10), (0x90000, 1)]
+    legacy = sum([per_sector_erase(address, length, 4 << 10) for address, length in ranges], [])
+    plan = plan_erase(ranges)
+    assert erased_units(plan, 4 << 10) == erased_units(legacy, 4 << 10)
@@ -0,0 +1,69 @@
+'''
+    Bisect lookup of the key cancellation index against the linear scan of
+    get_cancelled_key_based_on_acds_version() it replaced (builds compared as numbers).
+'''
+import random
+
+import pytest
+
+from fwval_lib.configuration.keycancellation import (KeyCancellationIndex, build_number, cancellation_index,
+    toolchain_key, version_tuple)
+
+DATABASE = [
+    ("19.1/240", 1),
+    ("19.3/222", 2),
+    ("20.1/177", 3),
+    ("20.1/99", 4),
+    ("21.1/156", 5),
+    ("21.4.1/23", 6),
+    ("22.1/140", 7),
+]
+
+'''
+    Output  : returns the key cancelled by the last entry not newer than version/build, scanning every entry
+'''
+def linear_scan(entries, version, build):
+    cancelled_key = 0
+    current = toolchain_key(version, build)
+    for version_build, key in sorted(entries, key=lambda entry: toolchain_key(*entry[0].split("/"))):
+        if toolchain_key(*version_build.split("/")) <= current:
+            cancelled_key = key
+    return cancelled_key
+
+def test_version_tuple():
+    assert version_tuple("19.0") == version_tuple("19") == (19,)
+    assert version_tuple("21.4.1") == (21, 4, 1)
+
+def test_build_number():
+    assert build_number("140") == build_number(140.0) == build_number("140b") == 140
+    # compared as strings "99" was newer than "140"
+    assert toolchain_key("20.1", "99") < toolchain_key("20.1", "140")
+
+@pytest.mark.parametrize("version, build", [
+    ("19.1", "239"), ("19.1", "240"), ("19.1", "241"), ("19.3", "1"), ("20.1", "98"), ("20.1", "99"),
+    ("20.1", "140"), ("20.1", "177"), ("21.4", "500"), ("21.4.1", "23"), ("22.1", "140"), ("23.2", "1"),
+])
+def test_matches_linear_scan(version, build):
+    index = KeyCancellationIndex(DATABASE)
+    assert index.cancelled_key(toolchain_key(version, build)) == linear_scan(DATABASE, version, build)
+
+def test_random_toolchains():
+    rng = random.Random(0)
+    index = KeyCancellationIndex(DATABASE)
+    for _ in range(500):
+        version = "%d.%d" % (rng.randint(18, 24), rng.randint(0, 4))
+        build = str(rng.randint(0, 300))
+        assert index.cancelled_key(toolchain_key(version, build)) == linear_scan(DATABASE, version, build)
+
+def test_nd_key_order():
+    index = KeyCancellationIndex(DATABASE, nd=True)
+    assert index.is_eq_or_newer(0, 1)
+    assert not index.is_eq_or_newer(1, 0)
+    assert index.is_eq_or_newer(2, 0)
+    assert not KeyCancellationIndex(DATABASE).is_eq_or_newer(0, 1)
+
+def test_index_built_once():
+    entries = list(DATABASE)
+    assert cancellation_index(entries) is cancellation_index(entries)
+    entries.append(("23.1/1", 8))
+    assert cancellation_index(entries).cancelled_key(toolchain_key("23.1", "1")) == 8
@@ -0,0 +1,82 @@
+'''
+    compare_buffers() against the per byte loop check_ram()/fpga_read_flash() used before.
+'''
+import random
+
+import pytest
+
+from fwval_lib.configuration import memcompare
+from fwval_lib.configuration.memcompare import compare_buffers
+
+'''
+    Output  : returns the offsets the old loop logged as "Data mismatched at ..."
+'''
+def legacy_mismatches(expected, actual):
+    return [offset for offset in range(len(expected)) if actual[offset] != expected[offset]]
+
+def run_offsets(comparison):
+    return [run.offset + i for run in comparison.runs for i in range(run.length)]
+
+@pytest.fixture(params=[True, False], ids=["numpy", "pure"])
+def use_numpy(request):
+    if request.param and memcompare.numpy is None:
+        pytest.skip("numpy is not installed")
+    return request.param
+
+@pytest.fixture
+def small_windows(monkeypatch):
+    # runs crossing window boundaries are joined, check it with many small windows
+    monkeypatch.setattr(memcompare, "COMPARE_CHUNK_SIZE", 64)
+
+def corrupt(data, offsets):
+    data = bytearray(data)
+    for offset in offsets:
+        data[offset] ^= 0xFF
+    return data
+
+def test_identical(use_numpy):
+    expected = bytearray(random.Random(1).getrandbits(8) for _ in range(5000))
+    comparison = compare_buffers(expected, bytearray(expected), use_numpy=use_numpy)
+    assert comparison.ok
+    assert comparison.summary_lines() == []
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_legacy_loop(seed, use_numpy, small_windows):
+    rng = random.Random(seed)
+    expected = bytearray(rng.getrandbits(8) for _ in range(4096))
+    offsets = set(rng.sample(range(len(expected)), 40))
+    # a run across several windows
+    offsets.update(range(60, 200))
+    actual = corrupt(expected, offsets)
+    comparison = compare_buffers(expected, actual, use_numpy=use_numpy)
+    legacy = legacy_mismatches(expected, actual)
+    assert not comparison.ok
+    assert comparison.mismatched_bytes == len(legacy)
+    assert run_offsets(comparison) == legacy
+    for run in comparison.runs:
+        assert run.expected == expected[run.offset]
+        assert run.actual == actual[run.offset]
+
+def test_runs_are_capped_count_is_exact(use_numpy):
+    expected = bytearray(1000)
+    actual = corrupt(expected, range(0, 1000, 2))
+    comparison = compare_buffers(expected, actual, max_runs=10, use_numpy=use_numpy)
+    assert len(comparison.runs) == 10
+    assert comparison.total_runs == 500
+    assert comparison.mismatched_bytes == len(legacy_mismatches(expected, actual))
+    assert len(comparison.summary_lines(max_lines=4)) == 1 + 4 + 1
+
+def test_short_readback():
+    expected = bytearray(range(100))
+    comparison = compare_buffers(expected, expected[:90])
+    assert not comparison.ok
+    assert comparison.runs[-1].offset == 90
+    assert comparison.runs[-1].length == 10
+    assert comparison.runs[-1].actual is None
+
+def test_list_readback():
+    expected = bytearray(range(16))
+    actual = list(expected)
+    actual[3] = 0
+    comparison = compare_buffers(expected, actual)
+    assert run_offsets(comparison) == [3]
@@ -0,0 +1,62 @@
+'''
+    Coverage and read budget of plan_samples().
+'''
+import pytest
+
+from fwval_lib.configuration.ramsampler import (FLASH_SECTOR_SIZE, MAX_READS, MERGE_GAP, SAMPLE_WINDOW, Region,
+    plan_samples, sample_size)
+
+IMAGE_SIZE = 32 << 20
+REGIONS = [Region("descriptor", 0, 8 << 10), Region("SSBL", 0x10000, 0x30000), Region("main1", 0x100000, 0x800000),
+           Region("SPT0", 0x1F00000, 0x1F01000)]
+
+def covered(plan, start, end):
+    return any(offset < end and start < offset + length for offset, length in plan)
+
+def test_sample_size():
+    assert sample_size(0) == 0
+    assert sample_size(10) == 10
+    # 1 - 0.99^459 >= 0.99
+    assert sample_size(1 << 20) == 459
+    assert sample_size(100, confidence=1) == 100
+
+def test_reproducible():
+    assert list(plan_samples(IMAGE_SIZE, REGIONS, seed=7)) == list(plan_samples(IMAGE_SIZE, REGIONS, seed=7))
+    assert list(plan_samples(IMAGE_SIZE, REGIONS, seed=7)) != list(plan_samples(IMAGE_SIZE, REGIONS, seed=8))
+
+@pytest.mark.parametrize("seed", range(5))
+def test_budget(seed):
+    plan = plan_samples(IMAGE_SIZE, REGIONS, seed=seed)
+    assert 0 < len(plan) <= MAX_READS
+    windows = list(plan)
+    assert windows == sorted(windows)
+    for (offset, length), (next_offset, _) in zip(windows, windows[1:]):
+        assert next_offset - (offset + length) >= MERGE_GAP
+    for offset, length in windows:
+        assert 0 <= offset and offset + length <= IMAGE_SIZE
+
+@pytest.mark.parametrize("seed", range(5))
+def test_every_region_sampled(seed):
+    plan = plan_samples(IMAGE_SIZE, REGIONS, seed=seed)
+    for region in REGIONS:
+        assert covered(plan, region.start, region.end), region.name
+    for region, taken, wanted in plan.regions:
+        assert 0 < taken <= wanted
+
+def test_every_sector_sampled_without_budget():
+    plan = plan_samples(IMAGE_SIZE, REGIONS, seed=1, max_reads=None)
+    for sector in range(0, IMAGE_SIZE, FLASH_SECTOR_SIZE):
+        assert covered(plan, sector, sector + FLASH_SECTOR_SIZE), hex(sector)
+    for region, taken, wanted in plan.regions:
+        assert taken == wanted
+
+def test_small_image_fully_read():
+    plan = plan_samples(1000, seed=3, confidence=1)
+    assert list(plan) == [(0, 1000)]
+    assert plan.sampled_bytes == 1000
+    assert "seed 3" in plan.report()
+
+def test_budget_of_one_read():
+    plan = plan_samples(IMAGE_SIZE, REGIONS, seed=2, max_reads=1)
+    assert len(plan) == 1
+    assert plan.windows[0][1] >= SAMPLE_WINDOW
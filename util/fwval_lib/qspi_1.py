@@ -1,5 +1,12 @@
 from fwval_lib.common import *
+from fwval_lib.configuration.bitrev import qspi_program_plan, reverse_bits, reverse_bits_inplace
 from fwval_lib.configuration.jtag import JtagTest
+from fwval_lib.configuration.layoutcache import set_attributes
+from fwval_lib.configuration.memcompare import compare_buffers
+from fwval_lib.configuration.partitiontable import PartitionTable
+from fwval_lib.configuration.prefetch import prefetch
+from fwval_lib.configuration.ramsampler import DEFAULT_CONFIDENCE, MAX_READS, layout_regions, plan_samples
+from fwval_lib.configuration.spantrace import traced
 import binascii
 import cv_logger
 import execution_lib
@@ -7,6 +14,7 @@ import os
 import pycv as fwval
 import random
 import re
+import tempfile
 
 revision = "$Revision: #14 $"
 __version__ = 0
@@ -67,6 +75,7 @@ class QspiTest(JtagTest):
     Req     : nconfig must be 1 or 0
     Mod     : self -- power cycle the board (off, set nconfig, on)
     '''
+    @traced("power")
     def power_cycle(self, nconfig=1):
         #power off
         cv_logger.info("Power off")
@@ -88,6 +97,7 @@ class QspiTest(JtagTest):
     Output  : True if correct, False if incorrect
     Same with verify_pin for JtagTest, but with different default value for avst_ready_en
     '''
+    @traced("status")
     def verify_pin(self, nstatus_en=1, init_done_en=0, config_done_en=1, ast=0, log_error=1,index="", wait_time_out_check=False):
         return super(QspiTest, self).verify_pin(nstatus_en=nstatus_en, init_done_en=init_done_en,
             config_done_en=config_done_en, ast=ast, log_error=log_error, index=index, wait_time_out_check=wait_time_out_check)
@@ -108,6 +118,7 @@ class QspiTest(JtagTest):
     '''
     Modify  : Verify QSPI BFM Status, assert error if BFM status is not 1
     '''
+    @traced("status")
     def verify_qspi_bfm_status(self):
         #skip this step whenever running on mudv platform
         if self._sdmio.platform == 'mudv':
@@ -134,6 +145,7 @@ class QspiTest(JtagTest):
               - mudv   (with external flash daughter card)
               - oscar  (without daughter card)
     '''
+    @traced("power")
     def power_up_reset(self, cmf_copy=1, puf_enable=0):
         if self._sdmio.platform in ['oscar', 'emulator', 'simics', 'oscarbb']:
             self.power_up_reset_bfm(cmf_copy=cmf_copy, puf_enable=puf_enable)
@@ -146,6 +158,7 @@ class QspiTest(JtagTest):
     '''
     Modify  : perform power up reset sequence in mudv platform with external flash daughter card
     '''
+    @traced("power")
     def power_up_reset_daughter_card(self):
         self.power.set_power(False)
         delay(1000)
@@ -158,6 +171,7 @@ class QspiTest(JtagTest):
                          -- 2 = Corruption (Block 0 -> block 1 Recover)
                          -- 3 = JTAG Activation
     '''
+    @traced("power")
     def power_up_reset_bfm(self, cmf_copy=1, puf_enable=0):
         # Power up dut
         self.power.set_power(True)
@@ -189,14 +203,12 @@ class QspiTest(JtagTest):
                 cv_logger.info("Main Section 2 not present")
                 main_sec_2_addr = 0x0
         
-        # Define current acds version & build
-        acds_version = os.environ.get("ACDS_VERSION")
-        acds_build = float(os.environ.get("ACDS_BUILD_NUMBER"))
+        # acds version & build checks are resolved once in self.run_profile
 
         if cmf_copy == 1:
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
+            if(self.run_profile.agilex_like):
                 if(self.DUT_FAMILY == "diamondmesa"):
-                    if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                    if(self.run_profile.prefetcher_0x1bc):
                         # This adds the address Of second main section (which is HPS section for DM) to QSPI prefetcher
                         cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000,  0x%x, 0x%x, 0x%x"%(ssbl_add1, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0]))
                         self.qspi.set_prefetcher(0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0], ssbl_add1, main_sec_2_addr)
@@ -205,7 +217,7 @@ class QspiTest(JtagTest):
                         cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x200000, 0x80000, 0x100000, 0x180000,  0x%x, 0x%x, 0x%x"%(ssbl_add1, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0]))
                         self.qspi.set_prefetcher(0x0, 0x200000, 0x80000, 0x100000, 0x180000, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0], ssbl_add1, main_sec_2_addr)
                 else:
-                    if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                    if(self.run_profile.prefetcher_0x1bc):
                         cv_logger.info("Configure QSPI prefetcher with: 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000,  0x%x, 0x%x, 0x%x"%(ssbl_add1, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0]))
                         self.qspi.set_prefetcher(0x1BC, 0x200000, 0x200008, 0x80000, 0x100000, 0x180000, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0], ssbl_add1)
                     else:
@@ -221,7 +233,7 @@ class QspiTest(JtagTest):
                         wkey0_data        = self.iid_puf_addr.PUF_WKEY_ADDR[1]
                         core0_data        = self.MAIN_ADD[1]
                         core1_data        = self.MAIN_ADD[2]
-                        if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                        if(self.run_profile.prefetcher_0x1bc):
                             cv_logger.info("PUF ENABLED - Configure QSPI prefetcher with: 0x0, 0x1BC, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x" %(self.SYNC_START_ADD+1, ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, help0_data, wkey0_data, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000))
                             self.qspi.set_prefetcher(0x0, 0x1BC, self.SYNC_START_ADD+1, ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, 0x200010, 0x200014, help0_data, wkey0_data, 0x208008, 0x203000, 0x204000, 0x208010, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000)
                         else:
@@ -242,7 +254,7 @@ class QspiTest(JtagTest):
                     help0_data        = self.iid_puf_addr.PUF_DATA_ADDR[1]
                     help1_data        = self.iid_puf_addr.PUF_DATA_ADDR[2]
                     core0_data = self.MAIN_ADD[1]
-                    if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                    if(self.run_profile.prefetcher_0x1bc):
                         cv_logger.info("PUF ENABLED - Configure QSPI prefetcher with: 0x0, 0x1BC, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x" %(self.SYNC_START_ADD+1, ssbl_add1, puf0_data, puf1_data, help0_data_offset, help1_data_offset, help0_data, help1_data, core0_data))
                         self.qspi.set_prefetcher(0x0, 0x1BC, self.SYNC_START_ADD+1, ssbl_add1, puf0_data, puf1_data, help0_data_offset, help1_data_offset, 0x200010, help0_data, help1_data, core0_data)
                     else:
@@ -265,7 +277,7 @@ class QspiTest(JtagTest):
                     help1_data_offset = self.iid_puf_addr.HELP_DATA_OFFSET[2]
                     help0_data        = self.iid_puf_addr.PUF_DATA_ADDR[1]
                     help1_data        = self.iid_puf_addr.PUF_DATA_ADDR[2]
-                    if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                    if(self.run_profile.prefetcher_0x1bc):
                         cv_logger.info("PUF ENABLED - Configure QSPI prefetcher with: 0x1BC, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x" %(self.SYNC_START_ADD+1, ssbl_add1, mip0_data, mip1_data, puf0_data, puf1_data, help0_data_offset, help1_data_offset, help0_data, help1_data))
                         self.qspi.set_prefetcher(0x1BC, self.SYNC_START_ADD+1, ssbl_add1, mip0_data, mip1_data, puf0_data, puf1_data, help0_data_offset, help1_data_offset, help0_data, help1_data)
                     else:
@@ -275,7 +287,7 @@ class QspiTest(JtagTest):
 
 
             else:
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000,  0x%x, 0x%x, 0x%x"%(ssbl_add1, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0]))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0], ssbl_add1)
                 else:
@@ -300,7 +312,7 @@ class QspiTest(JtagTest):
                     wkey0_data        = self.iid_puf_addr.PUF_WKEY_ADDR[1]
                     core0_data        = self.MAIN_ADD[1]
                     core1_data        = self.MAIN_ADD[2]
-                    if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                    if(self.run_profile.prefetcher_0x1bc):
                         cv_logger.info("PUF ENABLED - Configure QSPI prefetcher with: 0x0, 0x1BC, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x" %(self.SYNC_START_ADD+1, ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, help0_data, wkey0_data, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000))
                         self.qspi.set_prefetcher(0x0, 0x1BC, self.SYNC_START_ADD+1, ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, help0_data, wkey0_data, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000)
                     else:
@@ -321,7 +333,7 @@ class QspiTest(JtagTest):
                     help0_data        = self.iid_puf_addr.PUF_DATA_ADDR[1]
                     help1_data        = self.iid_puf_addr.PUF_DATA_ADDR[2]
                     core0_data = self.MAIN_ADD[1]
-                    if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                    if(self.run_profile.prefetcher_0x1bc):
                         cv_logger.info("PUF ENABLED - Configure QSPI prefetcher with: 0x0, 0x1BC, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x" %(self.SYNC_START_ADD+1, ssbl_add1, puf0_data, puf1_data, help0_data_offset, help1_data_offset, help0_data, help1_data, core0_data))
                         self.qspi.set_prefetcher(0x0, 0x1BC, self.SYNC_START_ADD+1, ssbl_add1, puf0_data, puf1_data, help0_data_offset, help1_data_offset, help0_data, help1_data, core0_data)
                     else:
@@ -344,7 +356,7 @@ class QspiTest(JtagTest):
                     help1_data_offset = self.iid_puf_addr.HELP_DATA_OFFSET[2]
                     help0_data        = self.iid_puf_addr.PUF_DATA_ADDR[1]
                     help1_data        = self.iid_puf_addr.PUF_DATA_ADDR[2]
-                    if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                    if(self.run_profile.prefetcher_0x1bc):
                         cv_logger.info("PUF ENABLED - Configure QSPI prefetcher with: 0x1BC, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x" %(self.SYNC_START_ADD+1, ssbl_add1, mip0_data, mip1_data, puf0_data, puf1_data, help0_data_offset, help1_data_offset, help0_data, help1_data))
                         self.qspi.set_prefetcher(0x1BC, self.SYNC_START_ADD+1, ssbl_add1, mip0_data, mip1_data, puf0_data, puf1_data, help0_data_offset, help1_data_offset, help0_data, help1_data)
                     else:
@@ -353,15 +365,15 @@ class QspiTest(JtagTest):
 
 
         elif cmf_copy == 2:
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+            if(self.run_profile.agilex_like):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x80000))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000)
                 else:
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x80000))
                     self.qspi.set_prefetcher(0x0, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000)
             else:
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x40000))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, ssbl_add1, ssbl_add1 + 0x40000)
                 else:
@@ -369,15 +381,15 @@ class QspiTest(JtagTest):
                     self.qspi.set_prefetcher(0x0, 0x100000, 0x40000, 0x80000, 0xc0000, ssbl_add1, ssbl_add1 + 0x40000)
 
         elif cmf_copy == 3:
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+            if(self.run_profile.agilex_like):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000)
                 else:
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000))
                     self.qspi.set_prefetcher(0x0, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000)
             else:
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, 0x%x, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000)
                 else:
@@ -385,15 +397,15 @@ class QspiTest(JtagTest):
                     self.qspi.set_prefetcher(0x0, 0x100000, 0x40000, 0x80000, 0xc0000, ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000)
 
         elif cmf_copy == 4:
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+            if(self.run_profile.agilex_like):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000)
                 else:
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000))
                     self.qspi.set_prefetcher(0x0, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000)
             else:
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("Configure QSPI prefetcher with: 0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, 0x%x, 0x%x, 0x%x, 0x%x"%(ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000, ssbl_add1 + 0xc0000))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000, ssbl_add1 + 0xc0000)
                 else:
@@ -414,11 +426,16 @@ class QspiTest(JtagTest):
 
 
     '''
+    Optional: patch_set -- PatchSet against file_path which is already prepared, only the
+                           patched bytes (BFM RAM) or flash sectors (daughter card) are written
+              incremental -- 1 to only erase/program the flash sectors that changed since the last
+                           programming of this board (daughter card only, see FlashManifest)
     Modify  : different prepare qspi sequence in different platform
               - mudv   (with external flash daughter card)
               - oscar  (without daughter card)
     '''
-    def prepare_qspi(self, file_path, bitstream=None,  chip_select=0, offset=0, verify=0, check_ram=1, ast=0, read_ssbl=0, timeout=120, reverse=False, reconfig=0, puf_enable = 0, skip_extract = 0):
+    @traced("program")
+    def prepare_qspi(self, file_path, bitstream=None,  chip_select=0, offset=0, verify=0, check_ram=1, ast=0, read_ssbl=0, timeout=120, reverse=False, reconfig=0, puf_enable = 0, skip_extract = 0, patch_set=None, incremental=0):
         
         if file_path!=None and skip_extract == 0:
             conf_done = extract_pin_table(file_path=file_path, pin_name="CONF_DONE")
@@ -427,10 +444,14 @@ class QspiTest(JtagTest):
                 self._CONFIG_DONE = conf_done
 
         if self._sdmio.platform in ['oscar', 'emulator', 'simics', 'oscarbb']:
-            self.prepare_qspi_using_bfm(file_path, offset=offset, check_ram=check_ram, ast=ast, read_ssbl=read_ssbl, timeout=timeout, puf_enable = puf_enable)
+            self.prepare_qspi_using_bfm(file_path, offset=offset, check_ram=check_ram, ast=ast, read_ssbl=read_ssbl, timeout=timeout, puf_enable = puf_enable, patch_set=patch_set)
         elif self._sdmio.platform == 'mudv':
             cv_logger.info('Running on MUDV Platform')
 
+            if patch_set != None:
+                self.prepare_qspi_patch_using_daughter_card(patch_set, rpd=file_path, chip_select=chip_select, offset=offset, verify=verify)
+                return
+
             if file_path and bitstream:
                 cv_logger.info('WARNING :: bitstream is ignored because file_path and bitstream is defined at the same time')
 
@@ -448,7 +469,7 @@ class QspiTest(JtagTest):
                         self._CONFIG_DONE = conf_done
                 reverse = not reverse
 
-            self.prepare_qspi_using_daughter_card(rpd=file_path, chip_select=chip_select, offset=offset, verify=verify, reverse=reverse, reconfig=reconfig)
+            self.prepare_qspi_using_daughter_card(rpd=file_path, chip_select=chip_select, offset=offset, verify=verify, reverse=reverse, reconfig=reconfig, incremental=incremental)
         else:
             raise 'Unsupported Platform in QSPI'
 
@@ -458,6 +479,8 @@ class QspiTest(JtagTest):
     Optional: offset -- 0 the start address of flash
               chip select -- 0 Write the value of the flash device you want to select.
               verify -- 0 verify the data after write rpd into flash
+              incremental -- 1 to only erase/program the 64KB sectors that differ from the flash
+                             manifest of this board/chip select, the rest is skipped
     Modify  : send rpd into daughter card flash
               1. program helper via jtag
               2. qspi open
@@ -467,26 +490,23 @@ class QspiTest(JtagTest):
               6. qspi close
     Output  : None
     '''
-    def prepare_qspi_using_daughter_card(self, rpd, chip_select=0, offset=0, verify=0, reverse=False, reconfig=0):
+    @traced("program")
+    def prepare_qspi_using_daughter_card(self, rpd, chip_select=0, offset=0, verify=0, reverse=False, reconfig=0, incremental=0):
 
         if reconfig == 1:
             cv_logger.info("Skip to program helper during reconfiguration")
         else:
             cv_logger.info("Prepare DUT helper image...")
-            helper = execution_lib.getsof(input_sof_flag=0,input_file='or_gate_design.x4.77MHZ_IOSC.sof',mode="sof2rbf", conf="qspi")
             # helper = 'or_gate_design.x4.77MHZ_IOSC.dc.AGFB014R24A2E2VR0.0341A0DD-20.4_b52.rbf'
-            pem_file = "iid_puf/auth_keys/agilex_ec_priv_384_test.pem"
-            qky_file = "iid_puf/auth_keys/agilex_ec_384_test.qky"
-            signed_helper = "signed_helper_file.rbf"
-
-            if (os.path.exists(pem_file) and os.path.exists(qky_file)):
-                cv_logger.info("Use signed helper image instead of unsigned helper image")
-                run_command("quartus_sign --family=agilex --operation=sign --pem=%s --qky=%s %s %s" %(pem_file,qky_file,helper,signed_helper))
-                helper = signed_helper
+            [helper, helper_key] = self.get_helper_image()
 
-            self.power.set_power(True)
-            self.config_jtag()
-            self.send_jtag(file_path=helper, success=1, timeout=60)
+            if self.is_helper_loaded(helper_key):
+                cv_logger.info("DUT helper image is already running, skip reloading it")
+            else:
+                self.power.set_power(True)
+                self.config_jtag()
+                self.send_jtag(file_path=helper, success=1, timeout=60)
+                self.remember_helper_loaded(helper_key)
 
         status = self.qspi.qspi_open()
         assert_err( status==1,
@@ -499,45 +519,203 @@ class QspiTest(JtagTest):
 
         # most of the corruption test will reverse the data before send bitstream to flash
         # here is way to reverse back into correct order to avoid massive test change
+        # the rpd is read through a bit reversed view, the file itself is left untouched
+        manifest = self.get_flash_manifest(chip_select)
         if reverse:
-            file_obj = open(rpd, "rb")
-            assert_err( file_obj, "ERROR :: Failed to Open the file %s" %rpd)
+            image = self.read_bitstream(rpd, use_mmap=True, bit_reversed=True)
+        else:
+            image = self.read_bitstream(rpd, use_mmap=True)
+        image_size = len(image)
+        sector_size = 64<<10
+
+        with self.span("program rpd", "program"):
+            if incremental and offset % sector_size == 0:
+                sectors, hashes = manifest.changed_sectors(image, offset, sector_size)
+                cv_logger.info("QSPI incremental program %s: %d of %d sectors (64KB) changed"
+                    % (rpd, len(sectors), (image_size + sector_size - 1) / sector_size))
+                manifest.forget(offset, ((image_size + sector_size - 1) / sector_size) * sector_size)
+                status = status and self.program_qspi_sectors(image, offset, sectors)
+                if status and verify:
+                    status = self.verify_qspi_image(rpd, image, offset, reverse)
+                cv_logger.info("QSPI %s" % manifest.report())
+            elif reverse:
+                hashes = manifest.image_hashes(image, offset) if offset % (4<<10) == 0 else None
+                manifest.forget(offset, ((image_size + sector_size - 1) / sector_size) * sector_size)
+                cv_logger.info("QSPI program %s, bit reversed on the fly" % rpd)
+                sectors = [(sector_offset, min(sector_size, image_size - sector_offset)) for sector_offset in range(0, image_size, sector_size)]
+                status = status and self.program_qspi_sectors(image, offset, sectors)
+                if status and verify:
+                    status = self.verify_qspi_image(rpd, image, offset, reverse)
+            else:
+                hashes = manifest.image_hashes(image, offset) if offset % (4<<10) == 0 else None
+                manifest.forget(offset, ((image_size + sector_size - 1) / sector_size) * sector_size)
+                cv_logger.info("QSPI program %s"% rpd)
+                status = status and self.qspi.qspi_program(rpd, offset, verify=verify)
+            image.close()
+            assert_err(status == True,
+                    "ERROR :: Unexpected QSPI verify status : %d" %status )
+        if hashes != None:
+            manifest.update(hashes)
 
-            bitstream = bytearray(file_obj.read())
-            file_obj.close()
+        # Close exclusive access to QSPI interface
+        response = self.qspi.qspi_close()
+        assert_err(response,
+            "ERROR :: Fail to close QSPI Interface access")
 
-            reversed_bitstream = reverse_bitstream(bitstream)
 
-            writer = open(rpd, "wb")
-            writer.write(reversed_bitstream)
-            writer.close()
+    '''
+    Require : QSPI interface opened and chip selected
+    Input   : image -- rpd content (file order, bytearray or Bitstream)
+              offset -- flash address of image
+              sectors -- list of (offset in image, length) of the 64KB sectors to erase and program
+    Output  : returns status
+    Note    : the words of sector N+1 are bit reversed and packed in a worker thread while
+              sector N is programmed
+    '''
+    @traced("program")
+    def program_qspi_sectors(self, image, offset, sectors):
+        status = True
+        plans = prefetch((sector_offset, qspi_program_plan(image[sector_offset:sector_offset + length]))
+                         for sector_offset, length in sectors)
+        for sector_offset, (data_words, chunks) in plans:
+            status = self.qspi.qspi_sector_erase(offset + sector_offset)
+            for chunk_offset, bytes_to_pgm in chunks:
+                status = status and self.qspi.qspi_write(offset + sector_offset + chunk_offset,
+                    *data_words[chunk_offset/4:(chunk_offset + bytes_to_pgm + 3)/4])
+            if not status:
+                cv_logger.warning("Failed to program QSPI sector 0x%08x" % (offset + sector_offset))
+                break
+        return status
 
+    '''
+    Require : QSPI interface opened and chip selected
+    Input   : rpd -- rpd file programmed
+              image -- what was programmed, ie. rpd or its bit reversed view
+              offset -- flash address of image
+              reverse -- True if image is the bit reversed rpd
+    Output  : returns status of qspi_verify
+    Note    : qspi_verify only takes a file, the reversed image goes through a private temporary
+              copy so that the rpd itself is never rewritten
+    '''
+    @traced("verify")
+    def verify_qspi_image(self, rpd, image, offset, reverse):
+        if not reverse:
+            return self.qspi.qspi_verify(rpd, offset)
+        [handle, temp_rpd] = tempfile.mkstemp(suffix=".rpd", prefix="reversed_", dir=os.path.dirname(os.path.abspath(rpd)))
+        try:
+            with os.fdopen(handle, "wb") as writer:
+                for chunk_offset in range(0, len(image), 1<<20):
+                    writer.write(image[chunk_offset:chunk_offset + (1<<20)])
+            return self.qspi.qspi_verify(temp_rpd, offset)
+        finally:
+            os.remove(temp_rpd)
 
-        cv_logger.info("QSPI program %s"% rpd)
-        self.dut.test_time()
-        status = status and self.qspi.qspi_program(rpd, offset, verify=verify)
-        assert_err(status == True,
-                "ERROR :: Unexpected QSPI verify status : %d" %status )
-        cv_logger.info("Time to program rpd: %s" % self.dut.elapsed_time())
+    '''
+    Require : helper design loaded and the base rpd of patch_set already programmed at offset
+    Input   : patch_set -- PatchSet against the rpd in flash
+    Optional: rpd -- base rpd, default patch_set.base_path
+              chip_select -- 0 Write the value of the flash device you want to select.
+              offset -- 0 the start address of flash
+              verify -- 1 to verify the flash against rpd, only possible with revert (flash == rpd)
+              revert -- True to write the original bytes back (recover the good image)
+    Modify  : erases and re-programs only the 64KB flash sectors touched by patch_set
+    '''
+    @traced("program")
+    def prepare_qspi_patch_using_daughter_card(self, patch_set, rpd=None, chip_select=0, offset=0, verify=0, revert=False):
+
+        status = self.qspi.qspi_open()
+        assert_err( status==1,
+            "ERROR :: Failed to open QSPI interface")
+
+        status = self.qspi.qspi_set_cs(chip_select)
+        assert_err( status==1,
+            "ERROR :: Failed to chip select qspi")
+
+        manifest = self.get_flash_manifest(chip_select)
+        for sector in patch_set.sectors(64<<10):
+            manifest.forget(offset + sector, 64<<10, save=False)
+        manifest.try_save()
+
+        with self.span("program patch set", "program"):
+            status = self.program_patch_set(patch_set, rpd, offset, sector_size=64<<10,
+                erase_func=self.qspi.qspi_sector_erase, write_func=self.qspi.qspi_write, revert=revert)
+            if status and verify:
+                if revert:
+                    status = self.qspi.qspi_verify(rpd or patch_set.base_path, offset)
+                else:
+                    cv_logger.warning("Skip verify, flash content is the patched image not %s" % (rpd or patch_set.base_path))
+            assert_err(status == True,
+                    "ERROR :: Unexpected QSPI status after programming patch set : %d" %status )
 
-        # Close exclusive access to QSPI interface
         response = self.qspi.qspi_close()
         assert_err(response,
             "ERROR :: Fail to close QSPI Interface access")
 
+    '''
+    Input   : data -- bytes to write into QSPI RAM
+              offset -- offset of RAM to write to
+              reverse -- True to bit reverse data while writing it
+              timeout -- fixed timeout of the caller, in seconds, see transfer_timeout()
+    Modify  : writes data into QSPI RAM through the BFM, with a timeout derived from its size
+    '''
+    @traced("program")
+    def bfm_prepare_data(self, data, offset, reverse, timeout):
+        timeout = self.transfer_timeout("bfm", "prepare_data", len(data), timeout)
+        with self.measured_transfer("bfm", "prepare_data", len(data)):
+            self.qspi.prepare_data(data, offset, reverse, timeout)
+
+    '''
+    Require : the base image of patch_set is already in QSPI RAM at offset
+    Input   : patch_set -- PatchSet against the image in RAM
+    Optional: offset -- offset of RAM the base image was written to
+              check_ram -- 1 to read back every patched byte
+              ast -- 1 if ast for check_ram, 0 otherwise
+              revert -- True to write the original bytes back (recover the good image)
+    Modify  : writes only the patched bytes into QSPI RAM
+    Output  : return 1 if good (or not checked), 0 if bad
+    '''
+    @traced("program")
+    def prepare_qspi_patch_using_bfm(self, patch_set, offset=0, check_ram=1, ast=0, timeout=120, revert=False):
+
+        cv_logger.info("Writing %d patched bytes into RAM for QSPI..." % patch_set.patched_bytes())
+        with self.span("write patch set into RAM", "program"):
+            # RAM holds the bit reversed image, reverse unless the patch set already is
+            reverse = not patch_set.bit_reversed
+            for patch_offset, original, corrupted in patch_set.patches:
+                self.bfm_prepare_data(original if revert else corrupted, offset + patch_offset, reverse, timeout)
+
+        local_pass = True
+        if check_ram:
+            for patch_offset, original, corrupted in patch_set.patches:
+                expected = original if revert else corrupted
+                if reverse:
+                    expected = reverse_bits(expected)
+                data = bytearray(self.qspi.read_back(offset + patch_offset, len(expected)))
+                if data != expected:
+                    local_pass = False
+                    cv_logger.error("Patch at 0x%08x: expected %s but found %s"
+                        % (offset + patch_offset, binascii.hexlify(expected), binascii.hexlify(data)))
+            assert_err(((not ast) or local_pass),
+                "ERROR :: Readback RAM data is different than expected")
+        else:
+            cv_logger.warning("QSPI RAM patch set not checked")
+        return local_pass
 
     '''
     Input   : file_path -- path for the bitstream file (usually rbf file)
               ast -- 1 if ast for check_ram(), 0 otherwise
               read_ssbl -- 1 to read bitstream for SSBl start address; 0 to skip read if already read once
     Optional: check_ram -- 1 if want to check the bitstream written into RAM, if not 0
+              patch_set -- PatchSet against file_path which is already in RAM, only the patched
+                           bytes are written (see prepare_qspi_patch_using_bfm)
     Modify  : self, prepares AVST configuration by writing bitstream into RAM
     Output  : returns the length of the bitstream (number of bytes)
     '''
-    def prepare_qspi_using_bfm(self, file_path, offset=0, check_ram=1, ast=0, read_ssbl=0, timeout=120, puf_enable=0):
+    @traced("program")
+    def prepare_qspi_using_bfm(self, file_path, offset=0, check_ram=1, ast=0, read_ssbl=0, timeout=120, puf_enable=0, patch_set=None):
 
-        #read bitstream into byte array
-        bitstream = self.read_bitstream(file_path)
+        #read bitstream into byte array (only mapped when just the patch set is written)
+        bitstream = self.read_bitstream(file_path, use_mmap=(patch_set != None))
 
         # Read SSBL start address based on the bitstream
         if not read_ssbl:
@@ -550,30 +728,32 @@ class QspiTest(JtagTest):
             # Read trampoline add
             self.rpd_get_trampoline_add(bitstream)
 
-        #prepare the RAM
-        cv_logger.info("Writing Bistream into RAM for QSPI...")
-        self.dut.test_time()
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        if(self.run_profile.emulator):
             timeout=300
-        self.qspi.prepare_data(bitstream, offset, True, timeout)
-        cv_logger.info("Time to write data into RAM: %s" % self.dut.elapsed_time())
-        #if user specified, check the RAM bistream
-        if check_ram:
-            self.check_ram(bitstream=bitstream, ast=ast)
+        if patch_set != None:
+            self.prepare_qspi_patch_using_bfm(patch_set, offset=offset, check_ram=check_ram, ast=ast, timeout=timeout)
+            if not check_ram:
+                delay(3000)
         else:
-            cv_logger.warning("QSPI RAM bitstream not checked")
-            delay(3000)
+            #prepare the RAM
+            cv_logger.info("Writing Bistream into RAM for QSPI...")
+            with self.span("write data into RAM", "program"):
+                self.bfm_prepare_data(bitstream, offset, True, timeout)
+            #if user specified, check the RAM bistream
+            if check_ram:
+                self.check_ram(bitstream=bitstream, ast=ast)
+            else:
+                cv_logger.warning("QSPI RAM bitstream not checked")
+                delay(3000)
 
-        # Define current acds version & build
-        acds_version = os.environ.get("ACDS_VERSION")
-        acds_build = float(os.environ.get("ACDS_BUILD_NUMBER"))
+        # acds version & build checks are resolved once in self.run_profile
 
         # Configure QSPI prefetcher if read_ssbl is enabled
         if read_ssbl:
             ssbl_add1 = self.SSBL_START_ADD
             trampoline_end_add = self.TRAMPOLINE_END_ADD # Trampoline address is checked from the bitstream
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+            if(self.run_profile.agilex_like):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("QSPI set prefetcher 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, puf_data_0, puf_data_1, ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000, trampoline_end_add")
                     cv_logger.info("QSPI set prefetcher 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x, 0x%x,  0x%x,  0x%x,  0x%x, 0x%x" % (MAIN_IMAGE_POINTER['puf_data_0'][0],  MAIN_IMAGE_POINTER['puf_data_1'][0], ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000, trampoline_end_add))
                     self.qspi.set_prefetcher(0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, MAIN_IMAGE_POINTER['puf_data_0'][0],  MAIN_IMAGE_POINTER['puf_data_1'][0], ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000, trampoline_end_add)
@@ -590,7 +770,7 @@ class QspiTest(JtagTest):
                     wkey0_data        = self.iid_puf_addr.PUF_WKEY_ADDR[1]
                     core0_data        = self.MAIN_ADD[1]
                     core1_data        = self.MAIN_ADD[2]
-                    if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                    if(self.run_profile.prefetcher_0x1bc):
                         cv_logger.info("PUF ENABLED - Configure QSPI prefetcher with: 0x0, 0x1BC, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x" %(self.SYNC_START_ADD+1, ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, help0_data, wkey0_data, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000))
                         self.qspi.set_prefetcher(0x0, 0x1BC, self.SYNC_START_ADD+1, ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, 0x200010, 0x200014, help0_data, wkey0_data, 0x203000, 0x204000, 0x208010, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000)
                     else:
@@ -598,7 +778,7 @@ class QspiTest(JtagTest):
                         self.qspi.set_prefetcher(0x0, self.SYNC_START_ADD+1, ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, 0x200010, 0x200014, help0_data, wkey0_data, 0x203000, 0x204000, 0x208010, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000)
 
             else:
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("QSPI set prefetcher 0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, puf_data_0, puf_data_1, ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000, ssbl_add1 + 0xc0000, trampoline_end_add")
                     cv_logger.info("QSPI set prefetcher 0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, 0x%x, 0x%x, 0x%x,  0x%x,  0x%x,  0x%x, 0x%x"% (MAIN_IMAGE_POINTER['puf_data_0'][0],  MAIN_IMAGE_POINTER['puf_data_1'][0], ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000, ssbl_add1 + 0xc0000, trampoline_end_add))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, MAIN_IMAGE_POINTER['puf_data_0'][0], MAIN_IMAGE_POINTER['puf_data_1'][0], ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000, ssbl_add1 + 0xc0000, trampoline_end_add)
@@ -625,7 +805,7 @@ class QspiTest(JtagTest):
                     wkey0_data        = self.iid_puf_addr.PUF_WKEY_ADDR[1]
                     core0_data        = self.MAIN_ADD[1]
                     core1_data        = self.MAIN_ADD[2]
-                    if((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)):
+                    if(self.run_profile.acds_22_1_140):
                         cv_logger.info("PUF ENABLED - Configure QSPI prefetcher with: 0x0, 0x1BC, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x, 0x%x" %(ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, help0_data, wkey0_data, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000))
                         self.qspi.set_prefetcher(0x0, 0x1BC, ssbl_add1, puf0_data, help0_data_offset, wkey0_data_offset, help0_data, wkey0_data, core0_data, core1_data, core0_data+0x2000, core1_data+0x2000)
                     else:
@@ -1,11 +1,17 @@
 '''
     Input   : bitstream -- the bitstream data
               ast -- 1 if assert, 0 otherwise
-              random_check -- 1 if to randomly check the bitstream
+              random_check -- 1 to read back samples of every layout region and flash sector (see
+                              fwval_lib.configuration.ramsampler), 0 to read back the whole image
+    Optional: seed -- sampling seed to reproduce a check, default $FWVAL_RAM_CHECK_SEED or random
+              confidence -- probability to catch a region with 1% of its windows corrupted
+              max_reads -- read_back() calls of random_check, the confidence reached is in the log
     Modify  : self, prepares QSPI configuration by writing bitstream into RAM
     Output  : return 1 if good, 0 if bad
     '''
-    def check_ram(self, bitstream=None, random_check=1, ast=1, file_path=None):
+    @traced("verify")
+    def check_ram(self, bitstream=None, random_check=1, ast=1, file_path=None, seed=None, confidence=DEFAULT_CONFIDENCE,
+                  max_reads=MAX_READS):
 
         if bitstream == None:
             if file_path == None:
@@ -15,13 +21,7 @@
                 bitstream = self.read_bitstream(file_path)
 
                 cv_logger.info("Reversing data (LSB <-> MSB) per BYTE before checking RAM")
-                for i in range(len(bitstream)) :
-                    data = bitstream[i]
-                    temp = 0
-                    for j in range(8) :
-                        if (data & (1 << j)) :
-                            temp |= (1 << (7-j))
-                    bitstream[i] = temp
+                reverse_bits_inplace(bitstream)
 
         bitstream_length = len(bitstream)
 
@@ -29,23 +29,25 @@
 
         if (random_check):
             local_pass = True
-            for i in range(16) :
-                random.seed()
-                addr = random.randint(0, bitstream_length-32)
-                cv_logger.info("Randomly verify at address 0x%08X (32 Bytes)" % addr)
-                data = self.qspi.read_back(addr, 32)
-                for j in range(32) :
-                    if (bitstream[addr + j] != data[j]):
-                        local_pass = False
-                        cv_logger.error("At offset %d: expected 0x%02X but found 0x%02X" % (j, bitstream[addr + j], data[j]))
+            plan = plan_samples(bitstream_length, layout_regions(self, bitstream_length), seed=seed, confidence=confidence,
+                max_reads=max_reads)
+            cv_logger.info(plan.report())
+            with self.span("verify RAM samples", "verify"):
+                for addr, length in plan :
+                    data = self.qspi.read_back(addr, length)
+                    comparison = compare_buffers(bitstream[addr:addr + length], data)
+                    for line in comparison.summary_lines(addr):
+                        cv_logger.error(line)
+                    local_pass = local_pass and comparison.ok
+            if not local_pass:
+                cv_logger.error("Rerun with FWVAL_RAM_CHECK_SEED=%d to sample the same windows" % plan.seed)
 
         else:
 
             local_pass = True
             read_back_data=[]
-            self.dut.test_time()
-            read_back_data = self.qspi.read_back(0x0,bitstream_length)
-            cv_logger.info("Time to read data from RAM: %s" % self.dut.elapsed_time())
+            with self.span("read data from RAM", "verify"):
+                read_back_data = self.qspi.read_back(0x0,bitstream_length)
             assert_err((not ast) or (len(read_back_data) == bitstream_length),
                 "ERROR :: Readback RAM data length is %d, expected %d bytes"
                 %(len(read_back_data), bitstream_length))
@@ -54,12 +56,11 @@
                 print_err("ERROR :: Readback RAM data length is %d, expected %d bytes"
                     %(len(read_back_data), bitstream_length))
 
-            self.dut.test_time()
-            for i in xrange(bitstream_length):
-                if(bitstream[i]^read_back_data[i]):
-                    local_pass = False
-                    cv_logger.error("Expected data = 0x%x; read data = 0x%x; offset=%d" %(bitstream[i],read_back_data[i],i))
-            cv_logger.info("Time to Compare content: %s" % self.dut.elapsed_time())
+            with self.span("compare content", "verify"):
+                comparison = compare_buffers(bitstream, read_back_data)
+                local_pass = comparison.ok
+                for line in comparison.summary_lines():
+                    cv_logger.error(line)
 
         assert_err(((not ast) or local_pass),
             "ERROR :: Readback RAM data is different than expected")
@@ -88,12 +89,13 @@
               checks all results before and after configuration
     Output  : a list of True and False for pin and status checks
     '''
+    @traced("config")
     def nconfig1_qspi(self, timeout=5, failed_cmf_state=2, success=1, error_nstatus=1, ast=0, failed_state=1, skip_ver=0):
         cv_logger.info("")
         local_success = []
 
 
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        if(self.run_profile.emulator):
             sampling_interval=30000
             # qspi typically requires 15 minutes or more to be configured
             if timeout < 15*60 :
@@ -117,14 +119,21 @@
         cv_logger.info("pin_result_temp: %s" % pin_result_temp)
         limit_timeout = timeout * 1000 # Change to miliseconds
 
-        if os.environ.get("PYCV_PLATFORM") == 'simics' :
+        if self.run_profile.simics :
             # This should be the way for all platform, tweaking timing wont last
             # And why the Test do not use the platform information from the dut?!?!?!
             # And need to use env setting
             self.qspi.config_inactive()
 
+        # an expected failure stops waiting once the device clearly rejected the bitstream
+        rejection = self.config_rejection_monitor(error_nstatus) if (not success and self.run_profile.early_abort) else None
         while ((pin_result_temp == False) & (cur_delay < limit_timeout) ):
             cv_logger.info("Pin mismatch - conf_done is still low?")
+            reason = rejection.poll() if rejection != None else None
+            if reason:
+                cv_logger.info("(Expected) Configuration rejected after %d ms instead of waiting up to %d ms: %s" %
+                    (cur_delay, limit_timeout, reason))
+                break
             cur_delay += sampling_interval
             cv_logger.info("total delay: %d ms" %cur_delay )
             delay(sampling_interval, self.dut)
@@ -147,7 +156,7 @@
 
             #update expectations
             self.update_exp(state=0x0, config_done=1, init_done=1)
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+            if(self.run_profile.emulator):
                 fwval.delay(10000)
             #check pins and config_status
             local_success.append(self.verify_pin(ast=ast))
@@ -184,7 +193,7 @@
 
         cv_logger.info("Finished nconfig1_qspi")
 
-        if os.environ.get('FWVAL_PLATFORM') == "emulator" :
+        if self.run_profile.emulator :
             wait_time = 130
             cv_logger.info("Wait for %ds" % wait_time)
             delay(wait_time*1000)
@@ -210,6 +219,7 @@
               checks all results before and after configuration
     Output  : a list of True and False for pin and status checks
     '''
+    @traced("config")
     def toggle_nconfig_qspi(self, timeout=5, chk_config_status=False, failed_cmf_state=2, success=1, error_nstatus=1, ast=0, skip=1, skip_ver=0, failed_state=1):
         cv_logger.info("")
         local_success = []
@@ -219,14 +229,14 @@
         cv_logger.info("Setting nCONFIG => 0")
         self.update_exp(nconfig=0, nstatus=0, config_done=0, init_done=0)
         self.nconfig.set_input(0)
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        if(self.run_profile.emulator):
             cv_logger.debug(":Delay 250s for emulator")
             fwval.delay(250000)
         else:
             self.dut.delay(2000)
         local_success.append(self.verify_pin(ast=ast,wait_time_out_check=True))
         cv_logger.debug("Adding more delay post nCONFIG-->0 to check it it is really effective causing to stay in bootrom.........")
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        if(self.run_profile.emulator):
             fwval.delay(150000)
         else:
             delay(1000, self.dut)
@@ -237,7 +247,7 @@
         local_lst_length = len(local_respond)
 
         if(chk_config_status):
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
+            if(self.run_profile.agilex_like):
                 if(local_lst_length == 4):
                     cv_logger.debug("Interruption occured in bootrom stage  <> OK")
                 else:
@@ -256,7 +266,7 @@
         if (not skip):
             self.debug_read_bootstatus()
 
-        if os.environ.get("PYCV_PLATFORM") != 'simics' :
+        if not self.run_profile.simics :
             [design_hash_return, sld_node_return] = self.check_idle_jtagconfig()
             assert_err( not design_hash_return and not sld_node_return,
                 "ERROR :: Device should not be in user-mode")
@@ -292,6 +302,7 @@
               checks all results before and after configuration
     Output  : a list of True and False for pin and status checks
     '''
+    @traced("config")
     def reconfig_qspi(self, file_path=None, timeout=5, offset=0, failed_cmf_state=2, check_ram=1, success=1, error_nstatus=1, ast=0, failed_state=1, send_efuse_write_disable=1, reconfig=1, skip_ver=0, skip_extract=0):
         cv_logger.info("")
         local_success = []
@@ -300,15 +311,13 @@
         # Download data to QSPI BFM
         self.prepare_qspi( file_path=file_path, offset=offset, check_ram=check_ram, ast=ast, reconfig=reconfig, skip_extract=skip_extract)
 
-        # Define current acds version & build
-        acds_version = os.environ.get("ACDS_VERSION")
-        acds_build = float(os.environ.get("ACDS_BUILD_NUMBER"))
+        # acds version & build checks are resolved once in self.run_profile
 
         if not self.daughter_card:
             # Re-configure prefetcher
             ssbl_add1 = self.SSBL_START_ADD
-            if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+            if(self.run_profile.agilex_like):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("QSPI set prefetcher 0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000")
                     cv_logger.info("QSPI set prefetcher 0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x,  0x%x,  0x%x" % (ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000)
@@ -317,7 +326,7 @@
                     cv_logger.info("QSPI set prefetcher 0x0, 0x200000, 0x80000, 0x100000, 0x180000, 0x%x, 0x%x,  0x%x,  0x%x" % (ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000))
                     self.qspi.set_prefetcher(0x0, 0x200000, 0x80000, 0x100000, 0x180000, ssbl_add1, ssbl_add1 + 0x80000, ssbl_add1 + 0x100000, ssbl_add1 + 0x180000)
             else:
-                if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+                if(self.run_profile.prefetcher_0x1bc):
                     cv_logger.info("QSPI set prefetcher 0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000, ssbl_add1 + 0xc0000")
                     cv_logger.info("QSPI set prefetcher 0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, 0x%x, 0x%x,  0x%x,  0x%x" % (ssbl_add1, ssbl_add1 + 0x40000, ssbl_add1 + 0x80000, ssbl_add1 + 0xc0000))
                     self.qspi.set_prefetcher(0x0, 0x1BC, 0x100000, 0x40000, 0x80000, 0xc0000, ssbl_add1, ssbl_add1 + 0x40000,ssbl_add1 + 0x80000, ssbl_add1 + 0xc0000)
@@ -344,6 +353,7 @@
     Input    : design_name -- as long as design_name contains "and"/"or" (case insensitive), this function will verify whether
                the programmed device has the correct design
     '''
+    @traced("design")
     def verify_design(self, design_name, ast=1):
         local_pass = self.verify_design_andor(design_name, ast=ast)
         return local_pass
@@ -398,7 +408,10 @@
 
     '''
     # Input   : file_path -- path for the bitstream file ( map file)
+    # Optional: use_cache -- 1 to restore the partition table from the layout cache
+                (fwval_lib.configuration.layoutcache, if enabled) when this map was parsed before
     # Modify  : reads the bitstream given and initializes these variables:
+                self.PARTITION_TABLE      --  PartitionTable (fwval_lib.configuration.partitiontable) of every block
                 self.MBR_START_ADD        --  MBR start address
                 self.MBR_END_ADD          --  MBR end address
                 self.A2_PARTITION_START_ADD     -- A2_PARTITION start address
@@ -428,98 +441,24 @@
                 self.PARTITION_A3_START_ADD     -- PARTITION_A3 start address
                 self.PARTITION_A3_END_ADD       -- PARTITION_A3 end address
     # '''
-    def map_get_rsu_add(self,file):
+    def map_get_rsu_add(self,file, use_cache=1):
         'get the base address of the ssbl descriptor reading the bitstream file'
-        'Open the file'
-        file_obj = open(file, "rb")
-        assert_err( file_obj, "ERROR :: Failed to Open the file %s" %file)
-        content = file_obj.read().splitlines()
-        file_obj.close()
-        self.A2_PARTITION_START_ADD = 0
-
-        for i in range(len(content)) :
-            # python 3 will return bytes instead of string   
-            if isinstance(content[i],bytes):
-                content[i] = content[i].decode()
-            searchObj = re.search( r'MBR\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.MBR_START_ADD = int(searchObj.group(1),0)
-                self.MBR_INFO_END_ADD = int(searchObj.group(2),0)
-
-            searchObj = re.search( r'PARTITION_A2 \(CONFIG\)\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.A2_PARTITION_START_ADD = int(searchObj.group(1),0)
-                self.A2_PARTITION_END_ADD = int(searchObj.group(2),0)
-
-            searchObj = re.search( r'BOOT_INFO\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.BOOT_INFO_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.BOOT_INFO_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'FACTORY_IMAGE\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.FACTORY_IMAGE_START_ADD = int(searchObj.group(1),0)+ self.A2_PARTITION_START_ADD
-                self.FACTORY_IMAGE_END_ADD = int(searchObj.group(2),0)+ self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'SPT0\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.SPT0_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.SPT0_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'SPT1\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.SPT1_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.SPT1_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'CPB0\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.CPB0_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.CPB0_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'CPB1\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.CPB1_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.CPB1_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'P1\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.P1_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.P1_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'P2\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.P2_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.P2_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'P3\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.P3_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.P3_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'P4\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.P4_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.P4_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'P5\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.P5_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.P5_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'PUF\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.PUF_START_ADD = int(searchObj.group(1),0) + self.A2_PARTITION_START_ADD
-                self.PUF_END_ADD = int(searchObj.group(2),0) + self.A2_PARTITION_START_ADD
-
-            searchObj = re.search( r'PARTITION_48 \(LITTLEFS\)\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.PARTITION_48_START_ADD = int(searchObj.group(1),0)
-                self.PARTITION_48_END_ADD = int(searchObj.group(2),0)
-
-            searchObj = re.search( r'PARTITION_A3 \(BACKUP\)\s+(\w+)\s+(\w+)', content[i])
-            if searchObj:
-                self.PARTITION_A3_START_ADD = int(searchObj.group(1),0)
-                self.PARTITION_A3_END_ADD = int(searchObj.group(2),0)
+        layout = None
+        use_cache = use_cache and self.get_layout_cache().enabled
+        if use_cache:
+            layout_cache = self.get_layout_cache()
+            cache_key = layout_cache.key("map_get_rsu_add", [file])
+            layout = layout_cache.get(cache_key)
+
+        if layout != None:
+            cv_logger.info("Partition table of %s restored from the layout cache" %file)
+            self.PARTITION_TABLE = PartitionTable.from_list(layout)
+        else:
+            assert_err( os.path.isfile(file), "ERROR :: Failed to Open the file %s" %file)
+            self.PARTITION_TABLE = PartitionTable.from_file(file)
+            if use_cache:
+                layout_cache.put(cache_key, self.PARTITION_TABLE.to_list())
+        set_attributes(self, self.PARTITION_TABLE.legacy_attributes())
 
         if hasattr(self, 'MBR_START_ADD'):
             cv_logger.info("MBR_START_ADD : 0x%x" %self.MBR_START_ADD)
@@ -580,20 +519,11 @@
     def rpd_get_fw_add(self,file, get_fw_add=1, puf_enable=0):
 
         'get the base address of the ssbl descriptor reading the bitstream file'
-        'Open the file'
-        file_obj = open(file, "rb")
-        assert_err( file_obj, "ERROR :: Failed to Open the file %s" %file)
-        bitstream = bytearray(file_obj.read())
-        file_obj.close()
+        'Read the file, through the bitstream cache'
+        bitstream = self.read_bitstream(file)
         cv_logger.info("Reversing data (LSB <-> MSB) per BYTE ")
-        for i in range(len(bitstream)) :
-            data = bitstream[i]
-            temp = 0
-            for j in range(8) :
-                if (data & (1 << j)) :
-                    temp |= (1 << (7-j))
-            bitstream[i] = temp
-            
+        reverse_bits_inplace(bitstream)
+
         # Pre-check for A2 startaddr. If A2 is not found, set a2__startaddr as 0
         a2__startaddr = 0
         if hasattr(self, 'A2_PARTITION_START_ADD'):
@@ -607,28 +537,19 @@
 
     '''
     *********************************************************************************************
-    Input   : bitstream --  bytearray of the bitstream read
+    Input   : bitstream --  bytearray (or Bitstream) of the bitstream read
     Output  : This method will read RPD file, reverse data and get SSBL start address
     *********************************************************************************************
     '''
     def rpd_get_ssbl_add(self,bitstream):
         cv_logger.info("Read SSBL start address")
-        bitstream_temp = bytearray(bitstream)
 
         # offset for SSBL start add
         index_start     = BOOTROM_DESCRIPTOR['ssbl_offset'][0]
         index_end       = index_start + BOOTROM_DESCRIPTOR['ssbl_offset'][1]
 
         # cv_logger.info("Reversing SSBL start offset data (LSB <-> MSB) per BYTE ")
-        for i in range(index_start,index_end) :
-            data = bitstream_temp[i]
-            temp = 0
-            for j in range(8) :
-                if (data & (1 << j)) :
-                    temp |= (1 << (7-j))
-            bitstream_temp[i] = temp
-
-        src_buff        = bitstream_temp[index_start:index_end]
+        src_buff        = reverse_bits(bitstream[index_start:index_end])
         src_buff_le     = reverse_arr(src_buff)
         add = int(binascii.hexlify(src_buff_le),16)
         cv_logger.info("%s_START_ADD: 0x%08x"% (self.SSBL_TSBL,add))
@@ -636,28 +557,19 @@
 
     '''
     *********************************************************************************************
-    Input   : bitstream --  bytearray of the bitstream read
+    Input   : bitstream --  bytearray (or Bitstream) of the bitstream read
     Output  : This method will read RPD file, reverse data and get Trampoline start and end address
     *********************************************************************************************
     '''
     def rpd_get_trampoline_add(self,bitstream):
         cv_logger.info("Read Trampoline address")
-        bitstream_temp = bytearray(bitstream)
 
         # Trampoline start add
         index_start     = CMF_DESCRIPTOR['offset_trampol'][0]
         index_end       = index_start + CMF_DESCRIPTOR['offset_trampol'][1]
 
         # cv_logger.info("Reversing Trampoline start offset data (LSB <-> MSB) per BYTE ")
-        for i in range(index_start,index_end) :
-            data = bitstream_temp[i]
-            temp = 0
-            for j in range(8) :
-                if (data & (1 << j)) :
-                    temp |= (1 << (7-j))
-            bitstream_temp[i] = temp
-
-        src_buff        = bitstream_temp[index_start:index_end]
+        src_buff        = reverse_bits(bitstream[index_start:index_end])
         src_buff_le     = reverse_arr(src_buff)
         add = int(binascii.hexlify(src_buff_le),16)
         cv_logger.info("TRAMPOLINE_START_ADD: 0x%08x"% add)
@@ -668,15 +580,7 @@
         index_end       = index_start + CMF_DESCRIPTOR['size_trampoline'][1]
 
         # cv_logger.info("Reversing Trampoline start offset data (LSB <-> MSB) per BYTE ")
-        for i in range(index_start,index_end) :
-            data = bitstream_temp[i]
-            temp = 0
-            for j in range(8) :
-                if (data & (1 << j)) :
-                    temp |= (1 << (7-j))
-            bitstream_temp[i] = temp
-
-        src_buff        = bitstream_temp[index_start:index_end]
+        src_buff        = reverse_bits(bitstream[index_start:index_end])
         src_buff_le     = reverse_arr(src_buff)
         add = int(binascii.hexlify(src_buff_le),16)
         cv_logger.info("TRAMPOLINE_END_ADD: 0x%08x"% add)
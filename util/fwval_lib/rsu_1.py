@@ -1,5 +1,12 @@
 from fwval_lib.common import *
+from fwval_lib.configuration.bitrev import qspi_program_plan, reverse_bits, reverse_bits_inplace
+from fwval_lib.configuration.bitstream import as_bytearray
+from fwval_lib.configuration.eraseplan import plan_erase
+from fwval_lib.configuration.flashmanifest import FlashManifest
+from fwval_lib.configuration.fwlayout import FirmwareLayout, compile_layout, decode_image, decode_images, table_fields
+from fwval_lib.configuration.layoutcache import MAP_LAYOUT_ATTRS, get_attributes, set_attributes
 from fwval_lib.configuration.qspi import QspiTest
+from fwval_lib.configuration.spantrace import traced
 from fwval_lib.security.puf import PufAdd
 import cv_logger
 import os
@@ -41,7 +48,7 @@ class RsuTest(QspiTest):
             config_done_sdmio=config_done_sdmio, init_done_sdmio=init_done_sdmio)
 
         # Factory pin workaround for emulator MAX 10 BFM
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator'):
+        if(self.run_profile.emulator):
             # Power up the board and wait for the board to become stable
             self.power_up_reset()
             self.verify_pin(ast=0,wait_time_out_check=True)
@@ -82,6 +89,7 @@ class RsuTest(QspiTest):
               Prints mismatching fields
     Note    : Checks all the status fields except 'ERROR_LOCATION', 'ERROR_DETAILS' (last 2)
     '''
+    @traced("status")
     def verify_rsu_status(self, ast=0, rsu_state=1, check_version=0, fpga=False):
         if not fpga:
             cv_logger.info("V%d :: Verify rsu_status via JTAG" %(self._verify_counter))
@@ -233,15 +241,13 @@ class RsuTest(QspiTest):
 
         cv_logger.info("Set Prefetcher")
 
-        # Define current acds version & build
-        acds_version = os.environ.get("ACDS_VERSION")
-        acds_build = float(os.environ.get("ACDS_BUILD_NUMBER"))
+        # acds version & build checks are resolved once in self.run_profile
 
         assert_err(dcmf >=1 and dcmf<=4, "ERROR :: DCMF copy must be within 1-4, user set to %d" %dcmf )
         assert_err(cpb >=0 and cpb<=1, "ERROR :: CPB copy must be within 0-1, user set to %d" %cpb )
         # if (! hasattr(self, 'prefetcher_list')):
             # self.prefetcher_list = []
-        if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and self.DUT_FAMILY != "stratix10"):
+        if(self.run_profile.prefetcher_0x1bc):
             prefetcher_list = [0x1BC]
 
         else:
@@ -249,7 +255,7 @@ class RsuTest(QspiTest):
 
 
         # DCMF offset
-        if(((compare_quartus_version("22.1",acds_version)==0 and acds_build >= 140) or (compare_quartus_version(acds_version , "22.1")==1)) and "agilex" in self.DUT_FAMILY)!=True:
+        if not (self.run_profile.acds_22_1_140 and "agilex" in self.DUT_FAMILY):
             if dcmf >= 1:
                 prefetcher_list.append(0)
         if dcmf >= 2:
@@ -357,6 +363,7 @@ class RsuTest(QspiTest):
               - mudv   (with external flash daughter card)
               - oscar  (without daughter card)
     '''
+    @traced("power")
     def power_up_reset(self,cmf_copy=1, puf_enable=0):
         if self._sdmio.platform in ['oscar', 'emulator', 'simics','oscarbb']:
             #self.power_up_reset_bfm(cmf_copy=cmf_copy, puf_enable=puf_enable)
@@ -370,6 +377,7 @@ class RsuTest(QspiTest):
     '''
     Modify  : Power up DUT, Reset CSR upon power up and Configure data prefetcher
     '''
+    @traced("power")
     def power_up_reset_bfm(self):
 
         cv_logger.info("RSU power up reset")
@@ -391,31 +399,47 @@ class RsuTest(QspiTest):
     Modify  : different prepare qspi sequence in different platform
               - mudv   (with external flash daughter card)
               - oscar  (without daughter card)
+    Optional: patch_set -- PatchSet against file_path which is already prepared, only the
+                           patched bytes (BFM RAM) or flash sectors (daughter card) are written
     '''
-    def prepare_qspi_rsu(self, file_path=None, chip_select=0, bitstream=None, offset=0, verify=0, check_ram=1, ast=0, timeout=120, reverse=False, reconfig=0):
+    @traced("program")
+    def prepare_qspi_rsu(self, file_path=None, chip_select=0, bitstream=None, offset=0, verify=0, check_ram=1, ast=0, timeout=120, reverse=False, reconfig=0, patch_set=None):
         if self._sdmio.platform in ['oscar', 'emulator', 'simics','oscarbb']:
-            self.prepare_qspi_rsu_using_bfm(file_path, bitstream, offset=offset, check_ram=check_ram, ast=ast, timeout=timeout)
+            self.prepare_qspi_rsu_using_bfm(file_path, bitstream, offset=offset, check_ram=check_ram, ast=ast, timeout=timeout, patch_set=patch_set)
         elif self._sdmio.platform == 'mudv':
             cv_logger.info('Running on MUDV Platform')
+            if patch_set != None:
+                self.prepare_qspi_patch_using_daughter_card(patch_set, rpd=file_path, chip_select=chip_select, offset=offset, verify=verify)
+                return
             self.prepare_qspi_rsu_using_daughter_card(rpd=file_path, bitstream=bitstream, chip_select=chip_select, offset=offset, verify=verify, reverse=reverse, reconfig=reconfig)
         else:
             raise 'Unsupported Platform in Rsu'
 
 
+    @traced("program")
     def prepare_qspi_rsu_using_daughter_card(self, rpd, bitstream, chip_select, offset, verify, reverse, reconfig):
         super(RsuTest, self).prepare_qspi(rpd, bitstream, chip_select=chip_select, offset=offset, verify=verify, reverse=reverse, reconfig=reconfig)
         return
 
     '''
     # Input   : file_path -- path for the bitstream file (usually rbf file)
-                bitstream -- bitstream in LSB
+                bitstream -- bitstream in LSB, bytearray or Bitstream
                 offset -- offset of RAM to write into
                 ast -- 1 if ast for check_ram(), 0 otherwise
     # Optional: check_ram -- 1 if want to check the bitstream written into RAM, if not 0
+                patch_set -- PatchSet against the image already in RAM, only the patched bytes are written
     # Modify  : self, prepares QSPI configuration by writing bitstream into RAM
     # '''
     # def prepare_qspi(self, bitstream, offset=0, check_ram=1, ast=0, reverse=0):
-    def prepare_qspi_rsu_using_bfm(self, file_path=None, bitstream=None, offset=0, check_ram=1, ast=0, timeout=120):
+    @traced("program")
+    def prepare_qspi_rsu_using_bfm(self, file_path=None, bitstream=None, offset=0, check_ram=1, ast=0, timeout=120, patch_set=None):
+        if patch_set != None:
+            self.prepare_qspi_patch_using_bfm(patch_set, offset=offset, check_ram=check_ram, ast=ast, timeout=timeout)
+            if not check_ram:
+                delay(1000)
+            cv_logger.info("Finished preparing QSPI")
+            return
+
         if (bitstream==None):
             #read bitstream into byte array
             bitstream = self.read_bitstream(file_path)
@@ -425,9 +449,8 @@ class RsuTest(QspiTest):
 
         #prepare the RAM
         cv_logger.info("Writing Bistream into RAM for QSPI...")
-        self.dut.test_time()
-        self.qspi.prepare_data(bitstream, offset, reverse, timeout)
-        cv_logger.info("Time to write data into RAM: %s" % self.dut.elapsed_time())
+        with self.span("write data into RAM", "program"):
+            self.bfm_prepare_data(as_bytearray(bitstream), offset, reverse, timeout)
         #if user specified, check the RAM bistream
         if check_ram:
             self.check_ram(bitstream=bitstream, ast=ast)
@@ -441,6 +464,7 @@ class RsuTest(QspiTest):
 
     '''
     # Input   : file_path -- path for the bitstream file ( rpd file), map_file
+    # Optional: use_cache -- 1 to restore the PUF addresses from the layout cache, if enabled (FWVAL_LAYOUT_CACHE=1)
     # Modify  : reads the bitstream given and initializes these variables:
     #           self.iid_puf_addr_map.PUF_OFFSET = []            #Offset location in MIP i.e. 1F90/1F98 for PUF Data
                 self.iid_puf_addr_map.PUF_ADD = []               #Offset location for base of actual PUF data i.e. 100000/108000
@@ -450,14 +474,29 @@ class RsuTest(QspiTest):
                 self.iid_puf_addr_map.PUF_WKEY_ADDR = []         #Offset location for actual WKEY data i.e. 102000/110000
     # Output  : none
     '''
-    def rpd_get_puf_add(self,file,map_file):
+    def rpd_get_puf_add(self,file,map_file, use_cache=1):
 
         self.iid_puf_addr_map = PufAdd()
         self.iid_puf_addr_map.BOOT_INFO_START_ADD = self.BOOT_INFO_START_ADD
-        self.iid_puf_addr_map.puf_extract_addr_map(file, map_file)
+        layout = None
+        use_cache = use_cache and self.get_layout_cache().enabled
+        if use_cache:
+            layout_cache = self.get_layout_cache()
+            cache_key = layout_cache.key("rpd_get_puf_add", [file, map_file], self.BOOT_INFO_START_ADD)
+            layout = layout_cache.get(cache_key)
+        if layout != None:
+            cv_logger.info("PUF addresses of %s restored from the layout cache" %file)
+            set_attributes(self.iid_puf_addr_map, layout)
+        else:
+            self.iid_puf_addr_map.puf_extract_addr_map(file, map_file)
+            if use_cache:
+                layout_cache.put(cache_key, vars(self.iid_puf_addr_map))
 
     '''
     # Input   : file_path -- path for the bitstream file ( rpd file)
+    # Optional: use_cache -- 1 to restore the variables below from the layout cache
+                (fwval_lib.configuration.layoutcache, if enabled) when this rpd/map was parsed before
+                workers -- >1 to decode FACTORY/P1..P5 in a pool of that many processes
     # Modify  : reads the bitstream given and initializes these variables:
     #           self.BOOT_INFO_OFFSET
                 self.NSLOTS
@@ -471,26 +510,54 @@ class RsuTest(QspiTest):
                 self.P1
                 self.P2
                 self.P3
-    # Output  : returns full bitstream that reverted
+    # Output  : returns the full bitstream that reverted, as a lazily reversed Bitstream view of the
+                mapped file (nothing is reversed on a layout cache hit). The caller closes it, or uses
+                as_bytearray() and closes it where a real buffer is required
     '''
-    def rpd_get_rsu_fw_add(self,file):
+    def rpd_get_rsu_fw_add(self,file, use_cache=1, workers=0):
 
         'get the base address of the ssbl descriptor reading the bitstream file'
-        'Open the file'
-        file_obj = open(file, "rb")
-        assert_err( file_obj, "ERROR :: Failed to Open the file %s" %file)
-
-        bitstream = bytearray(file_obj.read())
-        file_obj.close()
-
-        cv_logger.info("Reversing data (LSB <-> MSB) per BYTE ")
-        for i in range(len(bitstream)) :
-            data = bitstream[i]
-            temp = 0
-            for j in range(8) :
-                if (data & (1 << j)) :
-                    temp |= (1 << (7-j))
-            bitstream[i] = temp
+        # the descriptors are read through a bit reversed view (mmap or cached contents), the file is never reversed
+        bitstream = self.read_bitstream(file, use_mmap=True, bit_reversed=True)
+        try:
+            self.rpd_parse_rsu_fw_add(file, bitstream, use_cache, workers)
+        except:
+            bitstream.close()
+            raise
+        return bitstream
+
+    '''
+    # Input   : file -- path of the rpd file
+                bitstream -- Bitstream of the rpd, bit reversed
+    # Optional: use_cache, workers -- see rpd_get_rsu_fw_add()
+    # Modify  : initializes the variables of rpd_get_rsu_fw_add()
+    '''
+    def rpd_parse_rsu_fw_add(self, file, bitstream, use_cache=1, workers=0):
+
+        layout_names = ["BOOT_INFO_OFFSET", "NSLOTS", "FACTORY"]
+        for app in range(1, 6):
+            if hasattr(self, 'P%d_START_ADD' % app):
+                layout_names += ["P%d" % app] + (["CPB0_APP%d_START" % app] if app <= 3 else [])
+        layout = None
+        use_cache = use_cache and self.get_layout_cache().enabled
+        if use_cache:
+            layout_cache = self.get_layout_cache()
+            cache_key = layout_cache.key("rpd_get_rsu_fw_add", [file], [get_attributes(self, MAP_LAYOUT_ATTRS),
+                SPT_DESC, CPB_DESC, MAIN_IMAGE_POINTER, MAIN_DESCRIPTOR, BOOTROM_DESCRIPTOR, CMF_DESCRIPTOR])
+            layout = layout_cache.get(cache_key)
+        if layout != None:
+            cv_logger.info("FW layout of %s restored from the layout cache" %file)
+            for name, value in layout.items():
+                if isinstance(value, dict):
+                    layout[name] = FirmwareLayout.from_dict(value)
+            set_attributes(self, layout)
+            cv_logger.info("BOOT_INFO_OFFSET: 0x%x NSLOTS: 0x%x" %(self.BOOT_INFO_OFFSET, self.NSLOTS))
+            for name in layout_names[3:]:
+                if name.startswith("P"):
+                    fw_info = getattr(self, name)
+                    cv_logger.info("%s: START_ADD 0x%x SSBL_START_ADD 0x%08x TRAMPOLINE_START_ADD 0x%08x" %
+                        (name, fw_info["START_ADD"], fw_info["SSBL_START_ADD"], fw_info["TRAMPOLINE_START_ADD"]))
+            return
 
         # SPT_DESC = {
             # 'magic_word'        : [0x000, 4],
@@ -500,10 +567,7 @@ class RsuTest(QspiTest):
             # 'sp0_offset'        : [0x030, 8],
             # 'sp0_length'        : [0x038, 4],
             # 'sp0_flags'         : [0x03C, 4],
-        index_start = self.SPT0_START_ADD + SPT_DESC['sp0_offset'][0]
-        index_end = index_start + SPT_DESC['sp0_offset'][1]
-        # cv_logger.debug("0x%x 0x%x" %(index_start, index_end))
-        self.BOOT_INFO_OFFSET = self.read_add(bitstream, index_start, index_end)
+        self.BOOT_INFO_OFFSET = compile_layout(table_fields(SPT_DESC, ["sp0_offset"])).unpack(bitstream, self.SPT0_START_ADD)["sp0_offset"]
         cv_logger.info("BOOT_INFO_OFFSET: 0x%x" %self.BOOT_INFO_OFFSET )
 
         # CPB_DESC = {
@@ -514,46 +578,35 @@ class RsuTest(QspiTest):
             # 'iptab_nslots'      : [0x014, 4],
             # 'image1'            : [0x020, 8],
             # 'image2'            : [0x028, 8],
-        index_start = self.CPB0_START_ADD + CPB_DESC['iptab_nslots'][0]
-        index_end = index_start + CPB_DESC['iptab_nslots'][1]
-        self.NSLOTS = self.read_add( bitstream, index_start, index_end)
+        apps = [app for app in range(1, 4) if hasattr(self, 'P%d_START_ADD' % app)]
+        cpb0 = compile_layout(table_fields(CPB_DESC, ["iptab_nslots"] + ["image%d" % app for app in apps])).unpack(bitstream, self.CPB0_START_ADD)
+        self.NSLOTS = cpb0["iptab_nslots"]
         cv_logger.info("NSLOTS: 0x%x" %self.NSLOTS )
 
-        if hasattr(self, 'P1_START_ADD'):
-            index_start = self.CPB0_START_ADD + CPB_DESC['image1'][0]
-            index_end = index_start + CPB_DESC['image1'][1]
-            self.CPB0_APP1_START = self.read_add( bitstream, index_start, index_end)
-            cv_logger.info("CPB0_APP1_START: 0x%x" %self.CPB0_APP1_START )
-
-        if hasattr(self, 'P2_START_ADD'):
-            index_start = self.CPB0_START_ADD + CPB_DESC['image2'][0]
-            index_end = index_start + CPB_DESC['image2'][1]
-            self.CPB0_APP2_START = self.read_add( bitstream, index_start, index_end)
-            cv_logger.info("CPB0_APP2_START: 0x%x" %self.CPB0_APP2_START )
-
-        if hasattr(self, 'P3_START_ADD'):
-            index_start = self.CPB0_START_ADD + CPB_DESC['image3'][0]
-            index_end = index_start + CPB_DESC['image3'][1]
-            self.CPB0_APP3_START = self.read_add( bitstream, index_start, index_end)
-            cv_logger.info("CPB0_APP3_START: 0x%x" %self.CPB0_APP3_START )
-
-        self.FACTORY = self.get_image_fw_add( bitstream, self.FACTORY_IMAGE_START_ADD, "FACTORY")
-
-        if hasattr(self, 'P1_START_ADD'):
-           self.P1 = self.get_image_fw_add( bitstream, self.P1_START_ADD, "P1")
-
-        if hasattr(self, 'P2_START_ADD'):
-           self.P2 = self.get_image_fw_add( bitstream, self.P2_START_ADD, "P2")
-
-        if hasattr(self, 'P3_START_ADD'):
-           self.P3 = self.get_image_fw_add( bitstream, self.P3_START_ADD, "P3")
-        
-        if hasattr(self, 'P4_START_ADD'):
-           self.P4 = self.get_image_fw_add( bitstream, self.P4_START_ADD, "P4")
-
-        if hasattr(self, 'P5_START_ADD'):
-           self.P5 = self.get_image_fw_add( bitstream, self.P5_START_ADD, "P5")
+        for app in apps:
+            setattr(self, "CPB0_APP%d_START" % app, cpb0["image%d" % app])
+            cv_logger.info("CPB0_APP%d_START: 0x%x" %(app, cpb0["image%d" % app]))
+
+        images = [("FACTORY", self.FACTORY_IMAGE_START_ADD)]
+        for app in range(1, 6):
+            if hasattr(self, 'P%d_START_ADD' % app):
+                images.append(("P%d" % app, getattr(self, 'P%d_START_ADD' % app)))
+        if workers > 1:
+            # each image decoded in its own process, from its own mapping of the rpd
+            layouts = decode_images(file, images, self.get_fw_descriptors(), self.A2_PARTITION_START_ADD, workers)
+            for image, _ in images:
+                cv_logger.info("Get FW INFO from %s" %image)
+                self.report_image_fw_add(layouts[image])
+                setattr(self, image, layouts[image])
+        else:
+            for image, image_start in images:
+                setattr(self, image, self.get_image_fw_add( bitstream, image_start, image))
 
-        # self.get_rsu_fw_add(bitstream)
+        if use_cache:
+            layout = get_attributes(self, layout_names)
+            for name, value in layout.items():
+                if isinstance(value, FirmwareLayout):
+                    layout[name] = value.as_dict()
+            layout_cache.put(cache_key, layout)
 
-        return bitstream
\ No newline at end of file
+        # self.get_rsu_fw_add(bitstream)
\ No newline at end of file
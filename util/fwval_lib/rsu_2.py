@@ -7,7 +7,7 @@
                 image -- image name to printout in INFO
                 single_image_rpd  -- default 0 for rpd file with RSU; 1 for single image rpd for RSU
                 bitstream_flash_offset -- offset of the "bitstream" wherein the image will be stored in QSPI
-    Output  : dict with the keys below:
+    Output  : FirmwareLayout (fwval_lib.configuration.fwlayout), read like a dict with the keys below:
               MAIN_START_ADD -- a list of main section start addresses
               MAIN_END_ADD -- a list of main section end addresses
               MAIN_SEC_NUM -- number of main sections
@@ -21,182 +21,43 @@
     def get_image_fw_add(self, bitstream, bitstream_start, image="Unkwown", single_image_rpd=0, single_image_offset=None, bitstream_flash_offset=0):
 
         cv_logger.info("Get FW INFO from %s" %image)
+        cv_logger.info("Bitstream processing to get address")
+        fw_info = decode_image(bitstream, bitstream_start, self.get_fw_descriptors(), self.A2_PARTITION_START_ADD,
+            single_image_rpd, single_image_offset, bitstream_flash_offset)
+        self.report_image_fw_add(fw_info)
+        return fw_info
 
-        fw_info = dict.fromkeys(["START_ADD","ABSOLUTE_START_ADD", "END_ADD", "MAIN_START_ADD", "MAIN_END_ADD", "MAIN_SEC_NUM", "SSBL_START_ADD", "SSBL_END_ADD", "TRAMPOLINE_START_ADD", "TRAMPOLINE_END_ADD" ,"SYNC_START_ADD", "SYNC_END_ADD"])
-
-        index_offset    = 0
-        index_size      = 1
+    '''
+    Output  : returns the descriptor tables decode_image() (fwval_lib.configuration.fwlayout) needs
+    '''
+    def get_fw_descriptors(self):
+        return {"MAIN_IMAGE_POINTER": MAIN_IMAGE_POINTER, "MAIN_DESCRIPTOR": MAIN_DESCRIPTOR,
+                "BOOTROM_DESCRIPTOR": BOOTROM_DESCRIPTOR, "CMF_DESCRIPTOR": CMF_DESCRIPTOR}
 
-        cv_logger.info("Bitstream processing to get address")
-        fw_info["START_ADD"] = bitstream_start + bitstream_flash_offset - self.A2_PARTITION_START_ADD
+    '''
+    Input   : fw_info -- FirmwareLayout from get_image_fw_add()
+    Output  : logs the addresses of the image
+    '''
+    def report_image_fw_add(self, fw_info):
         cv_logger.info("START_ADD: 0x%x"% fw_info["START_ADD"])
-
-        fw_info["ABSOLUTE_START_ADD"] = bitstream_start + bitstream_flash_offset
         cv_logger.info("ABSOLUTE_START_ADD: 0x%x"% fw_info["ABSOLUTE_START_ADD"])
-
-        # Main Image Pointer - last 256 bytes  of the second 4kB block within the firmware section
-        index_start     = bitstream_start + MAIN_IMAGE_POINTER['sec_num'][index_offset]
-        index_end       = index_start + MAIN_IMAGE_POINTER['sec_num'][index_size]
-        fw_info["MAIN_SEC_NUM"] = self.read_add( bitstream, index_start, index_end)
         cv_logger.info("Main Image Pointer MAIN_SEC_NUM: %d"% fw_info["MAIN_SEC_NUM"])
-
-        fw_info["MAIN_START_ADD"] = []
-        fw_info["MAIN_END_ADD"] = []
-
-        # dummy add 0
-        fw_info["MAIN_START_ADD"].append(0)
-        fw_info["MAIN_END_ADD"].append(0)
-
-        main_sec = 1
-        if fw_info["MAIN_SEC_NUM"] >= 1 :
-            index_start     = bitstream_start + MAIN_IMAGE_POINTER['1st_main_add'][index_offset]
-            index_end       = index_start + MAIN_IMAGE_POINTER['1st_main_add'][index_size]
-            add = self.read_add( bitstream, index_start, index_end)
-            #assert_err ( add != 0, "ERROR :: 1st main address cannot be 0")
-            # if address == 0, it means we are using relative address
-            if add == 0:
-                index_start     = bitstream_start + CMF_DESCRIPTOR['fw_sec_size'][index_offset]
-                index_end       = index_start + CMF_DESCRIPTOR['fw_sec_size'][index_size]
-                add = bitstream_start + self.read_add( bitstream, index_start, index_end)
-            cv_logger.info("MIP MAIN_START_ADD[%d]: 0x%08x"% (main_sec, add))
-            fw_info["MAIN_START_ADD"].append(add)
-
-            if (single_image_rpd == 0):
-                # MAIN_END_ADD
-                index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset]
-                index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                add2 = add + self.read_add(bitstream, index_start, index_end) -1
-                cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, add2))
-                fw_info["MAIN_END_ADD"].append(add2)
-            else:
-                if single_image_offset != None:
-                    # MAIN_END_ADD
-                    index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset] - single_image_offset
-                    index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                    add2 = add + self.read_add(bitstream, index_start, index_end) -1
-                    cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, add2))
-                    fw_info["MAIN_END_ADD"].append(add2)
-
-        if fw_info["MAIN_SEC_NUM"] >= 2 :
-            index_start     = bitstream_start + MAIN_IMAGE_POINTER['2nd_main_add'][index_offset]
-            index_end       = index_start + MAIN_IMAGE_POINTER['2nd_main_add'][index_size]
-            add = self.read_add( bitstream, index_start, index_end)
-            if add == 0:
-                add = fw_info["MAIN_END_ADD"][1] + 1
-            main_sec += 1
-            cv_logger.info("MIP MAIN_START_ADD[%d]: 0x%08x"% (main_sec, add))
-            fw_info["MAIN_START_ADD"].append(add)
-
-            if (single_image_rpd == 0):
-                # MAIN_END_ADD
-                index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset]
-                index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                add2 = add + self.read_add(bitstream, index_start, index_end) -1
-                cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, add2))
-                fw_info["MAIN_END_ADD"].append(add2)
-            else:
-                if single_image_offset != None:
-                    # MAIN_END_ADD
-                    index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset] - single_image_offset
-                    index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                    add2 = add + self.read_add(bitstream, index_start, index_end) -1
-                    cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, add2))
-                    fw_info["MAIN_END_ADD"].append(add2)
-
-        if fw_info["MAIN_SEC_NUM"] >= 3 :
-            index_start     = bitstream_start + MAIN_IMAGE_POINTER['3rd_main_add'][index_offset]
-            index_end       = index_start + MAIN_IMAGE_POINTER['3rd_main_add'][index_size]
-            add = self.read_add( bitstream, index_start, index_end)
-            if add == 0:
-                add = fw_info["MAIN_END_ADD"][2] + 1
-            main_sec += 1
-            cv_logger.info("MIP MAIN_START_ADD[%d]: 0x%08x"% (main_sec, add))
-            fw_info["MAIN_START_ADD"].append(add)
-
-            if (single_image_rpd == 0):
-                # MAIN_END_ADD
-                index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset]
-                index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                add2 = add + self.read_add(bitstream, index_start, index_end) -1
-                cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, add2))
-                fw_info["MAIN_END_ADD"].append(add2)
-            else:
-                if single_image_offset != None:
-                    # MAIN_END_ADD
-                    index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset] - single_image_offset
-                    index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                    add2 = add + self.read_add(bitstream, index_start, index_end) -1
-                    cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, add2))
-                    fw_info["MAIN_END_ADD"].append(add2)
-
-        if fw_info["MAIN_SEC_NUM"] >= 4 :
-            index_start     = bitstream_start + MAIN_IMAGE_POINTER['4th_main_add'][index_offset]
-            index_end       = index_start + MAIN_IMAGE_POINTER['4th_main_add'][index_size]
-            add = self.read_add( bitstream, index_start, index_end)
-            if add == 0:
-                add = fw_info["MAIN_END_ADD"][3] + 1
-            main_sec += 1
-            cv_logger.info("MIP MAIN_START_ADD[%d]: 0x%08x"% (main_sec, add))
-            fw_info["MAIN_START_ADD"].append(add)
-
-            if (single_image_rpd == 0):
-                # MAIN_END_ADD
-                index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset]
-                index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                add2 = add + self.read_add(bitstream, index_start, index_end) -1
-                cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, add2))
-                fw_info["MAIN_END_ADD"].append(add2)
-            else:
-                if single_image_offset != None:
-                    # MAIN_END_ADD
-                    index_start = add + MAIN_DESCRIPTOR['size_main_sec'][index_offset] - single_image_offset
-                    index_end   = index_start + MAIN_DESCRIPTOR['size_main_sec'][index_size]
-                    add2 = add + self.read_add(bitstream, index_start, index_end) -1
-                    cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, add2))
-                    fw_info["MAIN_END_ADD"].append(add2)
-
-        if (single_image_rpd == 0):
-            fw_info["END_ADD"] = fw_info["MAIN_END_ADD"][fw_info["MAIN_SEC_NUM"]]
+        for main_sec in range(1, len(fw_info["MAIN_START_ADD"])):
+            cv_logger.info("MIP MAIN_START_ADD[%d]: 0x%08x"% (main_sec, fw_info["MAIN_START_ADD"][main_sec]))
+            if main_sec < len(fw_info["MAIN_END_ADD"]):
+                cv_logger.info("MAIN_END_ADD[%d]: 0x%08x"% (main_sec, fw_info["MAIN_END_ADD"][main_sec]))
+        if fw_info["END_ADD"] != None:
             cv_logger.info("END_ADD: 0x%x"% fw_info["END_ADD"])
-
-        # SSBL/TSBL start add
-        index_start     = bitstream_start + BOOTROM_DESCRIPTOR['ssbl_offset'][index_offset]
-        index_end       = index_start + BOOTROM_DESCRIPTOR['ssbl_offset'][index_size]
-        fw_info["SSBL_START_ADD"] = bitstream_start + self.read_add( bitstream, index_start, index_end) + bitstream_flash_offset
         cv_logger.info("%s_START_ADD: 0x%08x"% (self.SSBL_TSBL,fw_info["SSBL_START_ADD"]))
-
-        # SSBL/TSBL end address
-        index_start     = bitstream_start + BOOTROM_DESCRIPTOR['ssbl_size'][index_offset]
-        index_end       = index_start + BOOTROM_DESCRIPTOR['ssbl_size'][index_size]
-        fw_info["SSBL_END_ADD"] = fw_info["SSBL_START_ADD"] + self.read_add( bitstream, index_start, index_end)
         cv_logger.info("%s_END_ADD: 0x%08x"% (self.SSBL_TSBL,fw_info["SSBL_END_ADD"]))
-
-        # Trampoline start add
-        index_start     = bitstream_start + CMF_DESCRIPTOR['offset_trampol'][index_offset]
-        index_end       = index_start + CMF_DESCRIPTOR['offset_trampol'][index_size]
-        fw_info["TRAMPOLINE_START_ADD"] = bitstream_start + self.read_add( bitstream, index_start, index_end) + bitstream_flash_offset
         cv_logger.info("TRAMPOLINE_START_ADD: 0x%08x"% fw_info["TRAMPOLINE_START_ADD"])
-
-        # Trampoline end address
-        index_start     = bitstream_start + CMF_DESCRIPTOR['size_trampoline'][index_offset]
-        index_end       = index_start + CMF_DESCRIPTOR['size_trampoline'][index_size]
-        fw_info["TRAMPOLINE_END_ADD"] = fw_info["TRAMPOLINE_START_ADD"] + self.read_add( bitstream, index_start, index_end)
         cv_logger.info("TRAMPOLINE_END_ADD: 0x%08x"% fw_info["TRAMPOLINE_END_ADD"])
-
-        # Sync start add
-        fw_info["SYNC_START_ADD"]=fw_info["TRAMPOLINE_END_ADD"]
-        if fw_info["SYNC_START_ADD"]!=fw_info["SSBL_START_ADD"]:
+        if fw_info["SYNC_END_ADD"] != None:
             cv_logger.info("SYNC_START_ADD: 0x%08x"% fw_info["SYNC_START_ADD"])
-
-            # Sync end address
-            fw_info["SYNC_END_ADD"]=fw_info["SSBL_START_ADD"] - 1
             cv_logger.info("SYNC_END_ADD: 0x%08x"% fw_info["SYNC_END_ADD"])
         else:
             cv_logger.info("No Sync Block")
 
-
-        return fw_info
-
     '''
     Require  :  rpd_get_rsu_fw_add() must be called beforehand
     Input    :  bitstream -- the bytearray of the read bitstream
@@ -379,7 +240,7 @@
                 except:
                     assert_err(0, "ERROR :: Unsupport item %s" %location )
         #------SatyaS Added Code making address Byte Alligned----------#
-        if(os.environ.get("FWVAL_PLATFORM") == 'emulator' or "agilex" in self.DUT_FAMILY or self.DUT_FAMILY == "diamondmesa"):
+        if(self.run_profile.agilex_like):
             cv_logger.debug("Original Address selected by test ---> 0x%x" %offset)
             temp_offset = int(offset/4)
             offset      = temp_offset*4
@@ -401,62 +262,42 @@
         bitstream = self.read_bitstream(rpd_file_name)
         bitstream_size = len(bitstream)
 
+        # flash written outside of the flash manifest, the selected chip select is unknown here
+        self.forget_flash_range(start_address, ((bitstream_size + (64<<10) - 1) >> 16) << 16)
+
         # 1. Erase
         if (update == 1):
             cv_logger.info("Erasing flash...")
-            offset = 0
-            while status and offset < bitstream_size :
-                status = self.qspi.qspi_sector_erase(start_address + offset)
-                offset +=  64<<10
+            # the QSPI connector only erases 64KB sectors, and the flash content is unknown here
+            erase_plan = plan_erase([(start_address, bitstream_size)], (64<<10,), legacy_size=64<<10)
+            for address, size in erase_plan :
+                status = self.qspi.qspi_sector_erase(address)
+                if not status :
+                    break
+            cv_logger.info("QSPI %s" % erase_plan.report())
         else:
             cv_logger.info("Skip QSPI_ERASE")
 
         # 2. Program
         if status :
-            if os.environ.get("PYCV_PLATFORM") == 'simics' :
+            if self.run_profile.simics :
                 cv_logger.info("Simics Programming %s..." % rpd_file_name)
-                reserved_bitstream = bytearray()
-                for data in bitstream :
-                    if data == 0xFF or data == 0 :
-                        reserved_bitstream.append(data)
-                    else :
-                        rdata = 0
-                        for i in range(8) :
-                            if data & (1 << i) :
-                                rdata |= (1 << (7-i))
-                        reserved_bitstream.append(rdata)
+                # 0xFF and 0x00 are their own bit reverse, so blank data passes through unchanged
+                reserved_bitstream = reverse_bits(bitstream)
                 self.qspi.prepare_data(reserved_bitstream, start_address, 30)
             else :
-                offset = 0
-                max_data = 4096
                 cv_logger.info("Programming %s..." % rpd_file_name)
-                while status and offset < bitstream_size :
-                    # Check whether there is 4K bytes or less data
-                    if (offset + max_data) <= bitstream_size :
-                        bytes_to_pgm = max_data
-                    else :
-                        bytes_to_pgm = bitstream_size - 1
-                    data_words = []
-                    for i in range (offset/4, (offset + bytes_to_pgm)/4) :
-                        # convert bytes to words
-                        data_word = bitstream[i * 4] << 24 | bitstream[i * 4 + 1] << 16 | bitstream[i * 4 + 2] << 8 | bitstream[i * 4 + 3]
-                        # reverse bit order
-                        reversed_data = 0
-                        if data_word != 0xFFFFFFFF and data_word != 0:
-                            for j in xrange(32) :
-                                if (data_word >> j) & 1 :
-                                    reversed_data |= 1 << (31 - j)
-                        else :
-                            reversed_data = data_word
-                        data_words.append(reversed_data)
-                    # Program if data is not blank
-                    if data_words != ([0xFFFFFFFF] * len(data_words)) :
-                        status = self.qspi.qspi_write(start_address + offset, *data_words)
-                    offset += bytes_to_pgm
+                # bit reversed words for the whole image + the 4KB chunks that are not blank
+                data_words, chunks = qspi_program_plan(bitstream)
+                cv_logger.info("%d of %d chunks (4KB) are not blank" % (len(chunks), (bitstream_size + 4095) / 4096))
+                for offset, bytes_to_pgm in chunks :
+                    status = self.qspi.qspi_write(start_address + offset, *data_words[offset/4:(offset + bytes_to_pgm + 3)/4])
+                    if not status :
+                        break
             cv_logger.info("Programming completed")
 
         # 3. Verify
-        if status and verify and os.environ.get("PYCV_PLATFORM") != 'simics' :
+        if status and verify and not self.run_profile.simics :
             status = self.qspi.qspi_verify(rpd_file_name, start_address)
 
         return status
@@ -525,7 +366,8 @@
         cv_logger.info("Root entry length end recorded at 0x%08x" %index_root_entry_length_end)
 
         #To get the public key entry by adding the index of root entry and the root entry size(read from bit stream)
-        index_public_key_entry_start       = index_root_entry + self.read_add(bitstream, index_root_entry_start, index_root_entry_length_end)
+        index_public_key_entry_start       = index_root_entry + compile_layout(table_fields(ROOT_ENTRY[self.DUT_FAMILY],
+            ["length"])).unpack(bitstream, index_root_entry)["length"]
         cv_logger.info("Public Key entry located at 0x%08x" %index_public_key_entry_start)
 
         #To get the key cancellation entry by adding the
@@ -537,7 +379,8 @@
         cv_logger.info("Key cancellation entry end recorded at 0x%08x" %index_key_cancellation_entry_end)
 
         #To get the key cancellation location
-        key_cancellation                   =  self.read_add(bitstream, index_key_cancellation_entry_start, index_key_cancellation_entry_end )
+        key_cancellation                   =  compile_layout(table_fields(PUBLIC_ENTRY[self.DUT_FAMILY],
+            ["cancellation"])).unpack(bitstream, index_public_key_entry_start)["cancellation"]
         cv_logger.info("Running firmware Key ID 0x%x" %key_cancellation)
 
         return key_cancellation
\ No newline at end of file